@@ -0,0 +1,51 @@
+"""
+Bytes and time per GET /api/habits/ for the full payload versus sparse
+fieldsets, for a user with 20 habits and 60 days of logs each.
+
+The full payload computes current/longest streak and today's status per
+habit, several queries each; a fieldset without them skips those queries.
+"""
+from datetime import date, timedelta
+
+from benchmarks.common import create_test_db, make_user, run_for, setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from habits.models import Habit, HabitLog  # noqa: E402
+
+HABITS = 20
+DAYS = 60
+ITERATIONS = 50
+
+
+def main():
+    create_test_db()
+    user = make_user()
+    today = date.today()
+    for i in range(HABITS):
+        habit = Habit.objects.create(user=user, name=f'Habit {i}')
+        HabitLog.objects.bulk_create(
+            HabitLog(habit=habit, date=today - timedelta(days=day), completed=day % 7 != 3)
+            for day in range(DAYS)
+        )
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+    for query in ['', '?fields=id,name,color,icon,today_completed', '?fields=id,name,color,icon']:
+        path = f'/api/habits/{query}'
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            response = client.get(path, HTTP_ACCEPT='application/json')
+        assert response.status_code == 200, response.status_code
+        seconds = run_for(lambda: client.get(path, HTTP_ACCEPT='application/json'), ITERATIONS)
+        print(f"{query or 'full payload':<45} {len(response.content):>7,} bytes  {len(queries):>4} queries  "
+              f"{seconds / ITERATIONS * 1000:>7.2f} ms/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Habit, HabitLog
+from .models import Habit, HabitLog, Job
 
 
 @admin.register(Habit)
@@ -17,3 +17,10 @@ class HabitLogAdmin(admin.ModelAdmin):
     search_fields = ['habit__name', 'notes']
     readonly_fields = ['created_at', 'updated_at']
     date_hierarchy = 'date'
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'status', 'user', 'priority', 'attempts', 'progress', 'total', 'created_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'user__username']
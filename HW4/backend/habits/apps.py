@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class HabitsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'habits'
+
+
+def warm_up():
+    """
+    Build the lazily-created singletons at boot instead of on the first request
+    each worker serves: the URLconf (which imports every view, serializer and
+    DRF module) and the password hasher. With a preloading server (gunicorn
+    --preload) forked workers share the result.
+
+    Called from the WSGI and ASGI entry points, so only server processes pay
+    for it; migrate and the other management commands don't.
+    """
+    from django.contrib.auth.hashers import get_hasher
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    get_hasher()
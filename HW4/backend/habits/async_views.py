@@ -0,0 +1,163 @@
+"""
+Async-native endpoints, served without a worker thread under ASGI.
+
+These are plain Django views rather than DRF views, which are sync-only, and
+return the same payloads as their DRF counterparts in views.py.
+"""
+import json
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.utils.encoders import JSONEncoder
+
+from .authentication import averify_credentials
+from .models import Habit, HabitLog
+from .serializers import HabitLogSerializer, HabitSerializer, UserRegistrationSerializer, UserSerializer
+
+
+async def _authenticate(request):
+    """
+    TokenAuthentication on the async ORM: set `request.user` or return a 401.
+    Session authentication is not supported here.
+    """
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0].lower() != 'token':
+        return JsonResponse({'detail': NotAuthenticated.default_detail}, status=401)
+    token = await Token.objects.select_related('user').filter(key=parts[1]).afirst()
+    if token is None or not token.user.is_active:
+        return JsonResponse({'detail': 'Invalid token.'}, status=401)
+    request.user = token.user
+    return None
+
+
+def _read_view(view):
+    async def wrapper(request, *args, **kwargs):
+        error = await _authenticate(request)
+        if error is not None:
+            return error
+        return await view(request, *args, **kwargs)
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return require_GET(wrapper)
+
+
+def _current_streak(completed, today):
+    streak = 0
+    while today - timedelta(days=streak) in completed:
+        streak += 1
+    return streak
+
+
+def _longest_streak(completed):
+    longest = current = 0
+    prev_date = None
+    for day in sorted(completed):
+        current = current + 1 if prev_date and (day - prev_date).days == 1 else 1
+        longest = max(longest, current)
+        prev_date = day
+    return longest
+
+
+class _StreaksHabitSerializer(HabitSerializer):
+    """HabitSerializer reading streaks from `completed_dates` instead of querying per habit."""
+
+    def get_current_streak(self, obj):
+        return _current_streak(obj.completed_dates, self.context['today'])
+
+    def get_longest_streak(self, obj):
+        return _longest_streak(obj.completed_dates)
+
+    def get_today_completed(self, obj):
+        return self.context['today'] in obj.completed_dates
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    """`views.login` with the password check awaited on the hashing pool."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    username = data.get('username')
+    password = data.get('password')
+    if not username or not password:
+        return JsonResponse({
+            'error': 'Please provide both username and password'
+        }, status=400)
+
+    user = await averify_credentials(username, password, request)
+    if not user:
+        return JsonResponse({'error': 'Invalid credentials'}, status=401)
+
+    token, _ = await Token.objects.aget_or_create(user=user)
+    return JsonResponse({
+        'token': token.key,
+        'user': UserSerializer(user).data
+    })
+
+
+@csrf_exempt
+@require_POST
+async def register(request):
+    """`views.register` with the password hash awaited on the hashing pool."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    serializer = UserRegistrationSerializer(data=data)
+    # Validation queries for a taken username.
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, encoder=JSONEncoder, status=400)
+    user = await serializer.acreate(serializer.validated_data)
+    token = await Token.objects.acreate(user=user)
+    return JsonResponse({
+        'token': token.key,
+        'user': UserSerializer(user).data
+    }, status=201)
+
+
+@_read_view
+async def habit_list(request):
+    """GET /habits/ with every habit's streaks computed from one log query."""
+    habits = [habit async for habit in Habit.objects.filter(user=request.user)]
+    completed = defaultdict(set)
+    async for habit_id, day in HabitLog.objects.filter(
+        habit__user=request.user, completed=True
+    ).values_list('habit_id', 'date'):
+        completed[habit_id].add(day)
+    for habit in habits:
+        habit.user = request.user
+        habit.completed_dates = completed[habit.id]
+
+    context = {'request': request, 'today': date.today()}
+    data = _StreaksHabitSerializer(habits, many=True, context=context).data
+    return JsonResponse(data, encoder=JSONEncoder, safe=False)
+
+
+@_read_view
+async def habit_logs(request, pk):
+    """GET /habits/<pk>/logs/, including the start_date/end_date filters."""
+    habit = await Habit.objects.filter(pk=pk, user=request.user).afirst()
+    if habit is None:
+        return JsonResponse({'detail': 'No Habit matches the given query.'}, status=404)
+
+    logs = habit.logs.all()
+    for param, lookup in (('start_date', 'date__gte'), ('end_date', 'date__lte')):
+        value = request.GET.get(param)
+        if value:
+            try:
+                logs = logs.filter(**{lookup: datetime.strptime(value, '%Y-%m-%d').date()})
+            except ValueError:
+                pass
+
+    data = HabitLogSerializer([log async for log in logs], many=True).data
+    return JsonResponse(data, encoder=JSONEncoder, safe=False)
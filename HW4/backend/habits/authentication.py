@@ -0,0 +1,100 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import aauthenticate, authenticate
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password, verify_password
+from django.contrib.auth.models import User
+
+
+_hashing_pool = None
+
+
+def _get_hashing_pool():
+    """
+    Bounded pool that every password hash runs on.
+
+    hashlib and argon2 release the GIL, so at most WORKERS cores are ever busy
+    hashing, however many logins arrive at once; other requests keep their CPU.
+    """
+    global _hashing_pool
+    if _hashing_pool is None:
+        _hashing_pool = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASHING.get('WORKERS', 4),
+            thread_name_prefix='password-hashing',
+        )
+    return _hashing_pool
+
+
+def _check(password, encoded):
+    """Return (is_correct, new_encoded); new_encoded is set when a rehash is due."""
+    if encoded is None:
+        # Unknown user: hash anyway so response time doesn't reveal it.
+        make_password(password)
+        return False, None
+    is_correct, must_update = verify_password(password, encoded)
+    return is_correct, make_password(password) if is_correct and must_update else None
+
+
+def hash_password(password):
+    """make_password on the hashing pool; the calling thread waits for it."""
+    return _get_hashing_pool().submit(make_password, password).result()
+
+
+async def ahash_password(password):
+    """hash_password for async views: the event loop serves other requests meanwhile."""
+    return await asyncio.wrap_future(_get_hashing_pool().submit(make_password, password))
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend with the password hash run on the hashing pool.
+
+    The user lookup and the rehash save stay on the calling thread so they use
+    its database connection; only the hashing goes to the pool.
+    """
+
+    def _lookup(self, username, kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        return User._default_manager.filter(**{User.USERNAME_FIELD: username})
+
+    def _accept(self, user, is_correct):
+        return user if is_correct and self.user_can_authenticate(user) else None
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if password is None:
+            return None
+        user = self._lookup(username, kwargs).first()
+        future = _get_hashing_pool().submit(_check, password, user.password if user else None)
+        is_correct, new_encoded = future.result()
+        if new_encoded:
+            user.password = new_encoded
+            user.save(update_fields=['password'])
+        return self._accept(user, is_correct)
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if password is None:
+            return None
+        user = await self._lookup(username, kwargs).afirst()
+        future = _get_hashing_pool().submit(_check, password, user.password if user else None)
+        is_correct, new_encoded = await asyncio.wrap_future(future)
+        if new_encoded:
+            user.password = new_encoded
+            await user.asave(update_fields=['password'])
+        return self._accept(user, is_correct)
+
+
+def verify_credentials(username, password, request=None):
+    """
+    Return the active user with these credentials, or None.
+
+    Goes through `authenticate()`, so AUTHENTICATION_BACKENDS apply and a
+    failed login sends `user_login_failed`.
+    """
+    return authenticate(request, username=username, password=password)
+
+
+async def averify_credentials(username, password, request=None):
+    return await aauthenticate(request, username=username, password=password)
\ No newline at end of file
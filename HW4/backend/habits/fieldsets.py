@@ -0,0 +1,99 @@
+"""
+Sparse fieldsets: `?fields=id,name` keeps only those fields in a GET
+response, `?omit=created_at` drops fields. Both take comma-separated
+serializer field names and can be combined.
+
+Trimming happens before any data is read: serializers lose the fields
+(SparseFieldsMixin), querysets load only the columns the remaining fields
+need (SparseQuerysetMixin), and list projections select only those columns.
+Writes ignore both parameters.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def _params(request):
+    """(fields, omit) from a GET/HEAD request, or None if it doesn't shape the response."""
+    if getattr(request, 'method', None) not in SAFE_METHODS:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    fields, omit = params.get('fields'), params.get('omit')
+    if not fields and not omit:
+        return None
+    return fields, omit
+
+
+def sparse_fieldset(request, names):
+    """
+    The subset of `names` (in their order) the request asks for, or None if it
+    doesn't shape the response.
+    """
+    params = _params(request)
+    if params is None:
+        return None
+    fields, omit = params
+
+    wanted = _names(fields) if fields else set(names)
+    omitted = _names(omit or '')
+    unknown = (wanted | omitted) - set(names)
+    if unknown:
+        raise serializers.ValidationError({
+            'fields': [f"Unknown field(s): {', '.join(sorted(unknown))}."]
+        })
+    return [name for name in names if name in wanted and name not in omitted]
+
+
+class SparseFieldsMixin:
+    """Apply `?fields=`/`?omit=` to a serializer's readable fields."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Only the top-level serializer (or a list's child) is shaped, not nested ones.
+        if self.parent is not None and not (
+                isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None):
+            return fields
+        readable = [name for name, field in fields.items() if not field.write_only]
+        keep = sparse_fieldset(self.context.get('request'), readable)
+        if keep is not None:
+            for name in readable:
+                if name not in keep:
+                    del fields[name]
+        return fields
+
+
+def model_columns(serializer, model):
+    """
+    Model fields `serializer`'s fields read, for `QuerySet.only()`; None if a
+    field isn't backed by a model field (e.g. a SerializerMethodField).
+    """
+    columns = []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            return None
+        try:
+            model_field = model._meta.get_field(field.source_attrs[0])
+        except FieldDoesNotExist:
+            return None
+        if not model_field.concrete:
+            return None
+        columns.append(model_field.name)
+    return columns
+
+
+class SparseQuerysetMixin:
+    """Load only the columns a sparse GET response renders (viewsets: list/retrieve only)."""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        action = getattr(self, 'action', None)
+        if (action is not None and action not in ('list', 'retrieve')) or _params(self.request) is None:
+            return queryset
+        columns = model_columns(self.get_serializer(), queryset.model)
+        return queryset.only(*columns) if columns is not None else queryset
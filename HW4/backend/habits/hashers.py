@@ -0,0 +1,56 @@
+"""
+Password hashers whose cost parameters come from settings.PASSWORD_HASHING.
+
+The algorithm names match Django's built-in hashers, so existing hashes keep
+verifying. Changing a cost parameter makes `must_update` true for old hashes,
+and they are rehashed the next time the user logs in.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher,
+)
+
+
+def _cost(name, default):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, default)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id; requires the optional argon2-cffi package."""
+
+    @property
+    def time_cost(self):
+        return _cost('ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _cost('ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return _cost('ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return _cost('SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return _cost('SCRYPT_BLOCK_SIZE', ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return _cost('SCRYPT_PARALLELISM', ScryptPasswordHasher.parallelism)
+
+    @property
+    def maxmem(self):
+        # 0 keeps OpenSSL's 32 MiB cap; raise it along with the work factor.
+        return _cost('SCRYPT_MAXMEM', ScryptPasswordHasher.maxmem)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return _cost('PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
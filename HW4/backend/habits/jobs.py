@@ -0,0 +1,165 @@
+"""
+A job queue in the database (Job) for work too slow to do inside a request.
+The request enqueues the job and answers 202 with it; the client polls
+/api/jobs/<id>/ for its progress and then its result. `manage.py run_jobs`
+runs the queue in a pool of worker processes.
+
+A job names the function that does it by dotted path, and that function is
+called as `func(job, **job.arguments)`. Its return value (JSON) is the job's
+result, and it may call `report(job, done, total)` as it goes.
+
+Workers claim the queued job with the lowest priority number, oldest first.
+Where the database supports it (PostgreSQL), they SELECT ... FOR UPDATE
+SKIP LOCKED, so concurrent workers pass over each other's rows instead of
+queueing on them. SQLite locks the whole database for a write anyway: there
+a worker claims a candidate with an UPDATE conditioned on it still being
+queued, and moves on to the next candidate if another worker got it first.
+
+A claimed job is leased to its worker for JOB_LEASE_SECONDS, and each
+progress report renews the lease. If the worker dies, the job is queued
+again once the lease runs out, and another worker takes it over. The worker
+that lost the lease finds out at its next report (LeaseLost) and stops.
+A job that raises is retried after JOB_RETRY_SECONDS, doubled for each
+retry after that, until max_attempts. After that it is marked failed with
+the traceback. Job functions should therefore be safe to run again after a
+partial attempt.
+"""
+import time
+import traceback
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+# Queued jobs a worker on SQLite tries to claim before reading the queue again.
+CANDIDATES = 10
+
+
+class LeaseLost(Exception):
+    """The job was taken over by another worker after its lease ran out."""
+
+
+def task_path(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, arguments=None, user_id=None, priority=0, max_attempts=3, unique=False):
+    """
+    Queue `func(job, **arguments)`. With `unique`, a job for the same
+    function and user that is still queued is returned instead of a new one.
+    """
+    task = task_path(func)
+    if unique:
+        queued = Job.objects.filter(task=task, user_id=user_id, status=Job.QUEUED).order_by('id').first()
+        if queued is not None:
+            return queued
+    return Job.objects.create(
+        task=task, arguments=arguments or {}, user_id=user_id, priority=priority, max_attempts=max_attempts,
+    )
+
+
+def _lease(now):
+    return now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+
+def _expire(now):
+    """Queue again the running jobs whose lease has run out, or fail them if out of attempts."""
+    expired = Job.objects.filter(status=Job.RUNNING, lease_until__lte=now)
+    # Rarely any: look before taking the write lock.
+    if not expired.exists():
+        return
+    lost = 'The worker running this job stopped reporting before its lease ran out.'
+    expired.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, claimed_by='', lease_until=None, finished_at=now, error=lost,
+    )
+    expired.update(status=Job.QUEUED, claimed_by='', lease_until=None, run_after=now, error=lost)
+
+
+def claim(worker):
+    """The next queued job, now running under `worker`; None when nothing is due."""
+    now = timezone.now()
+    _expire(now)
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('priority', 'id')
+    take = {
+        'status': Job.RUNNING, 'attempts': F('attempts') + 1, 'claimed_by': worker,
+        'lease_until': _lease(now), 'started_at': now,
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = due.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            Job.objects.filter(pk=pk).update(**take)
+        return Job.objects.get(pk=pk)
+    while True:
+        candidates = list(due.values_list('pk', flat=True)[:CANDIDATES])
+        if not candidates:
+            return None
+        for pk in candidates:
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**take):
+                return Job.objects.get(pk=pk)
+        # Every candidate went to another worker; read the queue again.
+
+
+def _held(job):
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, claimed_by=job.claimed_by)
+
+
+def report(job, done, total=None):
+    """Record how far the job has got (`done` of `total`), and renew its lease."""
+    changes = {'progress': done, 'lease_until': _lease(timezone.now())}
+    if total is not None:
+        changes['total'] = total
+    if not _held(job).update(**changes):
+        raise LeaseLost(f'Job {job.pk} was taken over by another worker.')
+    job.progress = done
+    if total is not None:
+        job.total = total
+
+
+def run(job):
+    """Run a claimed job and record its result, or its failure and whether it is retried."""
+    try:
+        result = import_string(job.task)(job, **job.arguments)
+    except LeaseLost:
+        return
+    except Exception:
+        now = timezone.now()
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_SECONDS * 2 ** (job.attempts - 1)
+            _held(job).update(
+                status=Job.QUEUED, claimed_by='', lease_until=None, error=error,
+                run_after=now + timedelta(seconds=delay),
+            )
+        else:
+            _held(job).update(status=Job.FAILED, claimed_by='', lease_until=None, error=error, finished_at=now)
+        return
+    _held(job).update(
+        status=Job.SUCCEEDED, claimed_by='', lease_until=None, result=result, error='', finished_at=timezone.now(),
+    )
+
+
+def work(worker=None, burst=False, poll_seconds=1.0):
+    """
+    Claim and run jobs as `worker`: until the queue has nothing due with
+    `burst`, else forever, checking every `poll_seconds` while it is empty.
+    Returns how many jobs were run.
+    """
+    worker = worker or uuid4().hex
+    ran = 0
+    while True:
+        job = claim(worker)
+        if job is None:
+            if burst:
+                return ran
+            time.sleep(poll_seconds)
+            continue
+        run(job)
+        ran += 1
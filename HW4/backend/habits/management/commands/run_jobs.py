@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from uuid import uuid4
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from habits import jobs
+
+
+def _setup_worker():
+    # Spawned workers start without Django; forked ones already have it.
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background job queue (see habits.jobs) in a pool of worker "
+        "processes, until stopped. With --burst, exit once nothing is left to run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker processes.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue has nothing due.')
+        parser.add_argument(
+            '--poll-seconds', type=float, default=1.0, help='How often an idle worker checks the queue.',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        work = partial(jobs.work, burst=options['burst'], poll_seconds=options['poll_seconds'])
+        names = [uuid4().hex for _ in range(max(options['workers'], 1))]
+        if len(names) == 1:
+            counts = [work(names[0])]
+        else:
+            # Don't hand this process's connections to the workers.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=len(names), initializer=_setup_worker) as pool:
+                counts = list(pool.map(work, names))
+        for name, count in zip(names, counts):
+            self.stdout.write(f"Worker {name[:8]} ran {count} jobs")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Ran {sum(counts)} jobs in {elapsed:.1f}s."))
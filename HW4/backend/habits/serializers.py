@@ -1,6 +1,22 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Habit, HabitLog
+from .authentication import ahash_password, hash_password
+from .fieldsets import SparseFieldsMixin
+from .models import Habit, HabitLog, Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    # The exception, without the traceback (that stays in the admin).
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'task', 'status', 'attempts', 'max_attempts', 'progress', 'total', 'result', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_error(self, job):
+        return job.error.strip().splitlines()[-1] if job.error else ''
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -22,24 +38,33 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Passwords do not match")
         return data
 
-    def create(self, validated_data):
-        validated_data.pop('password_confirm')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data.get('email', ''),
-            password=validated_data['password']
+    def _user(self, validated_data, encoded_password):
+        return User(
+            username=User.normalize_username(validated_data['username']),
+            email=User.objects.normalize_email(validated_data.get('email', '')),
+            password=encoded_password,
         )
+
+    def create(self, validated_data):
+        user = self._user(validated_data, hash_password(validated_data['password']))
+        user.save()
+        return user
+
+    async def acreate(self, validated_data):
+        """create() with the hash awaited on the hashing pool (async_views.register)."""
+        user = self._user(validated_data, await ahash_password(validated_data['password']))
+        await user.asave()
         return user
 
 
-class HabitLogSerializer(serializers.ModelSerializer):
+class HabitLogSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = HabitLog
         fields = ['id', 'habit', 'date', 'completed', 'notes', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class HabitSerializer(serializers.ModelSerializer):
+class HabitSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
     current_streak = serializers.SerializerMethodField()
     longest_streak = serializers.SerializerMethodField()
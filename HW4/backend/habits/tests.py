@@ -1,3 +1,325 @@
-from django.test import TestCase
+import gzip
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.hashers import get_hasher, get_hashers, make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.cache import CacheMiddleware
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, get_resolver
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from . import jobs
+from .apps import warm_up
+from .middleware import CompressionMiddleware
+from .models import Habit, HabitLog, Job
+from .renderers import ORJSONRenderer
+from .serializers import HabitLogSerializer
+
+
+def failing_job(job, succeed_on):
+    if job.attempts < succeed_on:
+        raise ValueError(f'attempt {job.attempts} failed')
+    jobs.report(job, 1, 1)
+    return {'attempts': job.attempts}
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_builds_urlconf_and_hasher(self):
+        clear_url_caches()
+        get_hashers.cache_clear()
+        warm_up()
+        self.assertIn('url_patterns', get_resolver().__dict__)
+        self.assertEqual(get_hashers.cache_info().currsize, 1)
+
+    def test_only_server_entry_points_warm_up(self):
+        for module, enabled in [('habittracker.wsgi', True), ('habittracker.asgi', True), ('habittracker.wsgi', False)]:
+            sys.modules.pop(module, None)
+            with patch('habits.apps.warm_up') as warm, self.settings(WARM_UP=enabled):
+                import_module(module)
+            self.assertEqual(warm.called, enabled, module)
+
+
+class PasswordHashingTests(APITestCase):
+    def login(self, path, username, password):
+        return self.client.post(path, {'username': username, 'password': password}, format='json')
+
+    def test_login_rehashes_legacy_hash(self):
+        user = User.objects.create(username='dave', password=make_password('pass1234!', hasher='pbkdf2_sha256'))
+        resp = self.login('/api/auth/login/', 'dave', 'pass1234!')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith(f'{get_hasher().algorithm}$'))
+
+        encoded = user.password
+        self.assertEqual(self.login('/api/auth/login/', 'dave', 'nope').status_code, status.HTTP_401_UNAUTHORIZED)
+        user.refresh_from_db()
+        self.assertEqual(user.password, encoded)
+
+    def test_async_login(self):
+        User.objects.create_user('erin', password='pass1234!')
+        resp = self.login('/api/auth/login/async/', 'erin', 'pass1234!')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()['user']['username'], 'erin')
+        habits = self.client.get('/api/habits/', HTTP_AUTHORIZATION=f"Token {resp.json()['token']}")
+        self.assertEqual(habits.status_code, status.HTTP_200_OK)
+        bad = self.login('/api/auth/login/async/', 'erin', 'wrong')
+        self.assertEqual(bad.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_async_register(self):
+        payload = {'username': 'gina', 'email': 'gina@test.com', 'password': 'StrongPass123!',
+                   'password_confirm': 'StrongPass123!'}
+        resp = self.client.post('/api/auth/register/async/', payload, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.json()['user']['username'], 'gina')
+        self.assertTrue(User.objects.get(username='gina').check_password('StrongPass123!'))
+        again = self.client.post('/api/auth/register/async/', payload, format='json')
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('username', again.json())
+
+    def test_login_goes_through_authenticate(self):
+        User.objects.create_user('frank', password='pass1234!', is_active=False)
+        failed = []
+        user_login_failed.connect(lambda sender, credentials, **kwargs: failed.append(credentials['username']),
+                                  weak=False, dispatch_uid='test-login-failed')
+        self.addCleanup(user_login_failed.disconnect, dispatch_uid='test-login-failed')
+        for path in ['/api/auth/login/', '/api/auth/login/async/']:
+            self.assertEqual(self.login(path, 'frank', 'pass1234!').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(failed, ['frank', 'frank'])
+
+
+class HabitTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass1234!')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        today = date.today()
+        self.run = Habit.objects.create(user=self.user, name='Run', description='5k before work')
+        Habit.objects.create(user=self.user, name='Read', color='#10B981', icon='book')
+        for days_ago in [0, 1, 2, 5]:
+            HabitLog.objects.create(
+                habit=self.run, date=today - timedelta(days=days_ago), completed=True, notes=f'Day -{days_ago}',
+            )
+        HabitLog.objects.create(habit=self.run, date=today - timedelta(days=3), completed=False)
+        self.hidden = Habit.objects.create(user=User.objects.create_user('bob', password='pass1234!'), name='Run')
+
+
+class AsyncReadTests(HabitTestCase):
+    def test_habit_list_matches_sync(self):
+        resp = self.client.get('/api/habits/async/')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), self.client.get('/api/habits/').json())
+        self.assertEqual([(h['name'], h['current_streak'], h['longest_streak']) for h in resp.json()],
+                         [('Read', 0, 0), ('Run', 3, 3)])
+
+    def test_logs_match_sync(self):
+        start = (date.today() - timedelta(days=2)).isoformat()
+        for query in ['', f'?start_date={start}', f'?end_date={start}', '?start_date=nope']:
+            resp = self.client.get(f'/api/habits/{self.run.id}/logs/async/{query}')
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(resp.json(), self.client.get(f'/api/habits/{self.run.id}/logs/{query}').json(), query)
+
+    def test_requires_own_habit_and_token(self):
+        self.assertEqual(self.client.get(f'/api/habits/{self.hidden.id}/logs/async/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(self.client.get('/api/habits/async/').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/habits/async/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ProjectionContractTests(HabitTestCase):
+    def assert_matches_serializer(self, path, queryset):
+        expected = HabitLogSerializer(queryset, many=True).data
+        resp = self.client.get(path, HTTP_ACCEPT='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.content, ORJSONRenderer().render(expected))
+        self.assertEqual(resp.content, JSONRenderer().render(expected))
+
+    def test_log_lists_match_serializer(self):
+        HabitLog.objects.create(habit=self.hidden, date=date.today(), notes='not listed')
+        self.assert_matches_serializer('/api/logs/', HabitLog.objects.filter(habit__user=self.user))
+        self.assert_matches_serializer(f'/api/habits/{self.run.id}/logs/', self.run.logs.all())
+
+
+class SparseFieldsetTests(HabitTestCase):
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(path)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.json(), ' '.join(q['sql'] for q in queries)
+
+    def test_fields_trims_output_and_columns(self):
+        data, sql = self.get(f'/api/habits/{self.run.id}/logs/?fields=date,completed')
+        self.assertEqual(data[0], {'date': date.today().isoformat(), 'completed': True})
+        self.assertNotIn('notes', sql)
+
+        data, sql = self.get('/api/logs/?fields=id,notes')
+        self.assertEqual([list(log) for log in data], [['id', 'notes']] * 5)
+        self.assertNotIn('updated_at', sql)
+
+        data, _ = self.get('/api/habits/?fields=name,current_streak')
+        self.assertEqual(data, [{'name': 'Read', 'current_streak': 0}, {'name': 'Run', 'current_streak': 3}])
+
+    def test_omit(self):
+        data, _ = self.get(f'/api/habits/{self.run.id}/?omit=logs,description,created_at,updated_at')
+        self.assertEqual(list(data), ['id', 'user', 'name', 'color', 'icon', 'current_streak', 'longest_streak',
+                                      'today_completed'])
+        data, _ = self.get(f'/api/habits/{self.run.id}/')
+        self.assertEqual(list(data['logs'][0]), ['id', 'habit', 'date', 'completed', 'notes', 'created_at',
+                                                 'updated_at'])
+
+    def test_unknown_field_is_rejected(self):
+        for path in ['/api/habits/?fields=id,nope', '/api/logs/?omit=nope']:
+            resp = self.client.get(path)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, path)
+            self.assertIn('nope', str(resp.json()['fields']))
+
+    def test_writes_ignore_fieldsets(self):
+        resp = self.client.post('/api/habits/?fields=id', {'name': 'Swim'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.json()['name'], 'Swim')
+        resp = self.client.post(f'/api/habits/{self.run.id}/toggle_today/?fields=id')
+        self.assertEqual(resp.json()['today_completed'], False)
+
+
+class CompressionTests(HabitTestCase):
+    def test_large_json_is_gzipped(self):
+        Habit.objects.bulk_create(Habit(user=self.user, name=f'Habit {i}', description='Every day') for i in range(30))
+        plain = self.client.get('/api/habits/')
+        resp = self.client.get('/api/habits/', HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp['Vary'])
+        self.assertEqual(gzip.decompress(resp.content), plain.content)
+        self.assertLess(int(resp['Content-Length']), len(plain.content))
+
+    def test_skips_small_refused_and_excluded_responses(self):
+        small = self.client.get(f'/api/habits/{self.run.id}/logs/?fields=id', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+        refused = self.client.get('/api/habits/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+        login = self.client.post('/api/auth/login/', {'username': 'alice', 'password': 'pass1234!'},
+                                 format='json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(login.status_code, status.HTTP_200_OK)
+        self.assertFalse(login.has_header('Content-Encoding'))
+
+    def test_streaming_response_is_compressed_per_chunk(self):
+        chunks = [b'{"chunk": %d}\n' % i * 40 for i in range(5)]
+        middleware = CompressionMiddleware(lambda request: StreamingHttpResponse(
+            iter(chunks), content_type='application/json'
+        ))
+        resp = middleware(RequestFactory().get('/stream/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        parts = list(resp.streaming_content)
+        self.assertEqual(len(parts), len(chunks) + 1)
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+
+    def test_skips_encoded_and_cached_responses(self):
+        body = b'{"chunk": 1}\n' * 200
+        encoded = CompressionMiddleware(lambda request: HttpResponse(
+            body, content_type='application/json', headers={'Content-Encoding': 'br'}
+        ))
+        resp = encoded(RequestFactory().get('/encoded/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual((resp['Content-Encoding'], resp.content), ('br', body))
+
+        # With the cache above the middleware, a hit is served as stored, compressed once.
+        self.addCleanup(cache.clear)
+        views = []
+
+        def view(request):
+            views.append(request.path)
+            return HttpResponse(body, content_type='application/json')
+
+        stack = CacheMiddleware(CompressionMiddleware(view), page_timeout=60)
+        with patch.object(gzip, 'compress', wraps=gzip.compress) as compress:
+            first, hit = [stack(RequestFactory().get('/cached/', HTTP_ACCEPT_ENCODING='gzip')) for _ in range(2)]
+        self.assertEqual((views, compress.call_count), (['/cached/'], 1))
+        self.assertEqual((hit['Content-Encoding'], hit.content), ('gzip', first.content))
+        self.assertEqual(gzip.decompress(hit.content), body)
+
+
+class ORJSONRendererTests(HabitTestCase):
+    def test_matches_drf_renderer(self):
+        HabitLog.objects.create(habit=self.run, date=date(2024, 1, 1), notes='Caf\u00e9 \u2028 line\u2029sep')
+        for path in ['/api/habits/', f'/api/habits/{self.run.id}/', '/api/logs/']:
+            data = self.client.get(path).data
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data), path)
+
+    def test_raw_decimals_render_as_strings(self):
+        self.assertEqual(ORJSONRenderer().render({'rate': Decimal('0.50'), 1: None}), b'{"rate":"0.50","1":null}')
+
+    def test_malformed_body_is_bad_request(self):
+        resp = self.client.post('/api/habits/', b'{"name": ', content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JSON parse error', resp.data['detail'])
+        resp = self.client.post('/api/habits/', b'{"name": "Swim"}', content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+
+@override_settings(JOB_RETRY_SECONDS=0)
+class JobTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pass1234!')
+        self.client.force_authenticate(user=self.user)
+
+    def enqueue(self, succeed_on=1, **kwargs):
+        return jobs.enqueue(failing_job, {'succeed_on': succeed_on}, user_id=self.user.id, **kwargs)
+
+    def test_retries_until_max_attempts(self):
+        retried = self.enqueue(succeed_on=2)
+        failed = self.enqueue(succeed_on=4)
+        self.assertEqual(jobs.work(burst=True), 5)
+
+        resp = self.client.get(f'/api/jobs/{retried.id}/')
+        self.assertEqual(
+            {key: resp.data[key] for key in ('status', 'attempts', 'progress', 'total', 'result', 'error')},
+            {'status': 'succeeded', 'attempts': 2, 'progress': 1, 'total': 1, 'result': {'attempts': 2}, 'error': ''},
+        )
+        resp = self.client.get(f'/api/jobs/{failed.id}/')
+        self.assertEqual((resp.data['status'], resp.data['attempts']), ('failed', 3))
+        self.assertEqual(resp.data['error'], 'ValueError: attempt 3 failed')
+        self.assertIn('Traceback', Job.objects.get(pk=failed.id).error)
+
+        # Jobs are only visible to their user.
+        self.client.force_authenticate(user=User.objects.create_user('bob', password='pass1234!'))
+        self.assertEqual(self.client.get(f'/api/jobs/{failed.id}/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_claims_by_priority_and_takes_over_expired_leases(self):
+        later = self.enqueue()
+        first = self.enqueue(priority=-1)
+        claimed = jobs.claim('worker-1')
+        self.assertEqual((claimed.pk, claimed.status, claimed.claimed_by), (first.pk, Job.RUNNING, 'worker-1'))
+
+        # worker-1 stops reporting; once its lease runs out the job goes to the next worker.
+        Job.objects.filter(pk=first.pk).update(lease_until=timezone.now() - timedelta(seconds=1))
+        taken = jobs.claim('worker-2')
+        self.assertEqual((taken.pk, taken.attempts), (first.pk, 2))
+        with self.assertRaises(jobs.LeaseLost):
+            jobs.report(claimed, 1)
+        self.assertEqual(jobs.claim('worker-1').pk, later.pk)
+        self.assertIsNone(jobs.claim('worker-1'))
+
+    def test_export_queues_one_job_at_a_time(self):
+        first = self.client.post('/api/habits/export/')
+        second = self.client.post('/api/habits/export/')
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertTrue(first['Location'].endswith(f"/api/jobs/{first.data['id']}/"))
+
+        out = StringIO()
+        call_command('run_jobs', '--burst', '--workers', '1', stdout=out)
+        self.assertIn('Ran 1 jobs', out.getvalue())
+        self.assertEqual(Job.objects.get().status, Job.SUCCEEDED)
@@ -1,18 +1,25 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
-    HabitViewSet, HabitLogViewSet,
+    HabitViewSet, HabitLogViewSet, JobViewSet,
     register, login, logout, current_user
 )
 
 router = DefaultRouter()
 router.register(r'habits', HabitViewSet, basename='habit')
 router.register(r'logs', HabitLogViewSet, basename='habitlog')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
+    # Async-native reads; listed before the router so `async` isn't taken for a pk.
+    path('habits/async/', async_views.habit_list, name='habit-list-async'),
+    path('habits/<int:pk>/logs/async/', async_views.habit_logs, name='habit-logs-async'),
     path('', include(router.urls)),
     path('auth/register/', register, name='register'),
+    path('auth/register/async/', async_views.register, name='register-async'),
     path('auth/login/', login, name='login'),
+    path('auth/login/async/', async_views.login, name='login-async'),
     path('auth/logout/', logout, name='logout'),
     path('auth/user/', current_user, name='current-user'),
 ]
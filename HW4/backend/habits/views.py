@@ -1,18 +1,26 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.authtoken.models import Token
-from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from datetime import date, datetime
-from .models import Habit, HabitLog
+from . import jobs
+from .authentication import verify_credentials
+from .exports import export_habits
+from .fieldsets import SparseQuerysetMixin
+from .models import Habit, HabitLog, Job
+from .projections import ValuesProjection
 from .serializers import (
-    HabitSerializer, HabitDetailSerializer, HabitLogSerializer,
+    HabitSerializer, HabitDetailSerializer, HabitLogSerializer, JobSerializer,
     UserSerializer, UserRegistrationSerializer
 )
 
+# Read-only log lists go straight from values() to dicts (see habits.projections).
+habit_log_projection = ValuesProjection(HabitLogSerializer)
 
-class HabitViewSet(viewsets.ModelViewSet):
+
+class HabitViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = HabitSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -68,11 +76,31 @@ class HabitViewSet(viewsets.ModelViewSet):
             except ValueError:
                 pass
 
-        serializer = HabitLogSerializer(logs, many=True)
-        return Response(serializer.data)
+        return Response(habit_log_projection.rows(logs, request))
+
+    @action(detail=False, methods=['post'])
+    def export(self, request):
+        """Queue an export of every habit with its logs and streaks (see habits.exports)."""
+        job = jobs.enqueue(export_habits, {'user_id': request.user.id}, user_id=request.user.id, unique=True)
+        return job_accepted(job, request)
 
 
-class HabitLogViewSet(viewsets.ModelViewSet):
+def job_accepted(job, request):
+    """202 with the queued job, and where to poll it."""
+    location = reverse('job-detail', args=[job.pk], request=request)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """The user's background jobs (see habits.jobs), to poll for progress and results."""
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+
+class HabitLogViewSet(SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = HabitLogSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -93,6 +121,11 @@ class HabitLogViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        if self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        return Response(habit_log_projection.rows(self.filter_queryset(self.get_queryset()), request))
+
     def perform_create(self, serializer):
         habit_id = self.request.data.get('habit')
         try:
@@ -127,7 +160,7 @@ def login(request):
             'error': 'Please provide both username and password'
         }, status=status.HTTP_400_BAD_REQUEST)
 
-    user = authenticate(username=username, password=password)
+    user = verify_credentials(username, password, request)
 
     if not user:
         return Response({
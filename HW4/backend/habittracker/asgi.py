@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'habittracker.settings')
 
 application = get_asgi_application()
+
+if settings.WARM_UP:
+    from habits.apps import warm_up
+
+    warm_up()
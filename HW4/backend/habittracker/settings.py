@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'habits.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,6 +86,35 @@ DATABASES = {
     }
 }
 
+# DJANGO_SQLITE_PROFILE=production tunes SQLite for several worker processes:
+# WAL so readers never wait on the writer, NORMAL sync (durable across app
+# crashes, not power loss), a larger page cache and mmap, a busy timeout
+# instead of immediate "database is locked" errors, IMMEDIATE write
+# transactions so two writers can't deadlock upgrading their locks, and
+# persistent connections so requests stop reopening the file.
+
+SQLITE_PROFILE = os.environ.get('DJANGO_SQLITE_PROFILE', 'default')
+
+if SQLITE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA busy_timeout=5000;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+
+
+# Logins go through authenticate(); this backend hashes on the pool in habits.authentication.
+AUTHENTICATION_BACKENDS = ['habits.authentication.PooledModelBackend']
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -103,6 +134,56 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# The selected algorithm hashes new passwords; hashes made with another listed
+# algorithm or older cost parameters are upgraded on the user's next login.
+# argon2 needs the optional argon2-cffi package.
+
+PASSWORD_HASHING = {
+    'ALGORITHM': os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt'),
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 102400,
+    'ARGON2_PARALLELISM': 8,
+    'SCRYPT_WORK_FACTOR': 2 ** 14,
+    'SCRYPT_BLOCK_SIZE': 8,
+    'SCRYPT_PARALLELISM': 1,
+    'PBKDF2_ITERATIONS': 1_000_000,
+    # Threads allowed to hash at once (see habits.authentication).
+    'WORKERS': int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+}
+
+_PASSWORD_HASHERS = {
+    'argon2': 'habits.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'habits.hashers.TunedScryptPasswordHasher',
+    'pbkdf2': 'habits.hashers.TunedPBKDF2PasswordHasher',
+}
+
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHING['ALGORITHM']]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items()
+    if name != PASSWORD_HASHING['ALGORITHM']
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+
+# Build the URLconf and password hasher when a server process starts
+# (habits.apps.warm_up, called from wsgi.py and asgi.py) rather than on each
+# worker's first request.
+
+WARM_UP = os.environ.get('HABITS_WARM_UP', '1') == '1'
+
+
+# Response compression (see habits.middleware). zstd and br are used when the
+# zstandard / brotli packages are installed.
+
+RESPONSE_COMPRESSION = {
+    'ENCODINGS': ['zstd', 'br', 'gzip'],
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    'ZSTD_LEVEL': 3,
+    # Token responses: keep them out of reach of compression side channels.
+    'EXCLUDE_PATHS': ['/api/auth/'],
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -136,9 +217,25 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'habits.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'habits.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 
+# Background jobs (see habits.jobs): how long a worker holds a job without
+# reporting progress before another may take it over, and the delay before
+# the first retry of a failed one, doubled for each retry after.
+JOB_LEASE_SECONDS = 5 * 60
+JOB_RETRY_SECONDS = 30
+
+
 # CORS Configuration
 # For development - allows local Expo app to connect
 CORS_ALLOWED_ORIGINS = [
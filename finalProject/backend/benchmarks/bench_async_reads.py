@@ -0,0 +1,96 @@
+"""
+500 concurrent clients reading accounts and category balances: sync DRF
+views behind a WSGI-style thread pool versus the async views in
+budget.async_views on the ASGI handler.
+
+Both sides run in-process so the numbers compare handlers, not servers.
+WSGI_THREADS plays the role of gunicorn's total worker threads: requests
+beyond it wait in the queue, which shows up in p99. For numbers against real
+servers, point a load generator at `gunicorn budgetapp.wsgi` and
+`uvicorn budgetapp.asgi:application`.
+"""
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+setup_django()
+
+from django.test import AsyncClient, Client  # noqa: E402
+
+from budget.authentication import tokens_for_user  # noqa: E402
+from budget.models import Account, BudgetAllocation, Category, Transaction  # noqa: E402
+
+CONNECTIONS = 500
+WSGI_THREADS = 32
+CATEGORIES = 12
+
+
+def seed(user):
+    account = Account.objects.create(user=user, name='Checking', balance=Decimal('5000.00'))
+    Account.objects.create(user=user, name='Savings', balance=Decimal('100.00'))
+    for i in range(CATEGORIES):
+        category = Category.objects.create(user=user, name=f'Category {i}')
+        BudgetAllocation.objects.create(category=category, account=account, amount=Decimal('200.00'))
+        Transaction.objects.create(
+            user=user, account=account, category=category,
+            transaction_type='expense', amount=Decimal('12.50'),
+        )
+
+
+def summarize(label, latencies, seconds):
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{label:<45} {len(latencies) / seconds:>9,.1f} req/s   "
+          f"p50 {cuts[49]:>8.1f} ms   p99 {cuts[98]:>8.1f} ms")
+
+
+def run_wsgi(path, auth):
+    client = Client(headers={'Authorization': auth})
+
+    def request(queued_at):
+        response = client.get(path)
+        assert response.status_code == 200, response.status_code
+        return (time.perf_counter() - queued_at) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WSGI_THREADS) as pool:
+        latencies = list(pool.map(request, [time.perf_counter()] * CONNECTIONS))
+    return latencies, time.perf_counter() - start
+
+
+def run_asgi(path, auth):
+    client = AsyncClient()
+
+    async def request():
+        queued_at = time.perf_counter()
+        response = await client.get(path, headers={'Authorization': auth})
+        assert response.status_code == 200, response.status_code
+        return (time.perf_counter() - queued_at) * 1000
+
+    async def burst():
+        return await asyncio.gather(*(request() for _ in range(CONNECTIONS)))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(burst())
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    create_test_db()
+    user = make_user()
+    seed(user)
+    auth = f"Bearer {tokens_for_user(user)['access']}"
+
+    for name, sync_path, async_path in [
+        ('accounts', '/api/accounts/', '/api/accounts/async/'),
+        ('balances', '/api/categories/balances/', '/api/categories/balances/async/'),
+    ]:
+        summarize(f'{name}: WSGI, {WSGI_THREADS} threads', *run_wsgi(sync_path, auth))
+        summarize(f'{name}: ASGI, async view', *run_asgi(async_path, auth))
+
+
+if __name__ == '__main__':
+    main()
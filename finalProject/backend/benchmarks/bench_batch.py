@@ -0,0 +1,93 @@
+"""
+Cold start of the frontend (log in, then load the dashboard data) over a
+simulated high-latency link: one call after another, versus log in plus a
+single POST /api/batch/.
+
+Latency is simulated by sleeping one round trip per HTTP call before it is
+sent; the server work is real. Both clients start with no cached state.
+"""
+import time
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+setup_django()
+
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget.models import Account, BudgetAllocation, Category, Transaction  # noqa: E402
+
+ROUND_TRIPS_MS = [0, 50, 150, 300]
+STARTUP_PATHS = [
+    '/api/auth/me/',
+    '/api/accounts/',
+    '/api/categories/',
+    '/api/categories/balances/',
+    '/api/allocations/',
+    '/api/transactions/',
+]
+ITERATIONS = 5
+
+
+class LinkClient(APIClient):
+    """APIClient that waits one round trip before every request."""
+
+    def __init__(self, rtt, **kwargs):
+        super().__init__(**kwargs)
+        self.rtt = rtt
+
+    def request(self, **kwargs):
+        time.sleep(self.rtt)
+        return super().request(**kwargs)
+
+
+def login(client):
+    resp = client.post('/api/auth/login/', {'username': 'bench', 'password': 'bench-pass-123'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {resp.data['tokens']['access']}")
+
+
+def sequential(rtt):
+    client = LinkClient(rtt)
+    login(client)
+    for path in STARTUP_PATHS:
+        assert client.get(path, HTTP_ACCEPT='application/json').status_code == 200, path
+
+
+def batched(rtt):
+    client = LinkClient(rtt)
+    login(client)
+    resp = client.post('/api/batch/', {'requests': [{'path': path} for path in STARTUP_PATHS]}, format='json')
+    assert all(r['status'] == 200 for r in resp.data['responses']), resp.data
+
+
+def best_of(func, rtt):
+    best = float('inf')
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        func(rtt)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    create_test_db()
+    user = make_user()
+    account = Account.objects.create(user=user, name='Checking', balance=Decimal('5000.00'))
+    for i in range(10):
+        category = Category.objects.create(user=user, name=f'Category {i}')
+        BudgetAllocation.objects.create(category=category, account=account, amount=Decimal('100.00'))
+        Transaction.objects.bulk_create(
+            Transaction(user=user, account=account, category=category,
+                        transaction_type='expense', amount=Decimal('1.50'), description=f'Purchase {j}')
+            for j in range(20)
+        )
+
+    print(f"{'rtt':>6} {'sequential':>12} {'batched':>10} {'speedup':>8}")
+    for rtt_ms in ROUND_TRIPS_MS:
+        seq = best_of(sequential, rtt_ms / 1000)
+        batch = best_of(batched, rtt_ms / 1000)
+        print(f"{rtt_ms:>4}ms {seq * 1000:>10.1f}ms {batch * 1000:>8.1f}ms {seq / batch:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Category balances and the dashboard with and without ledger checkpoints, for
+one user with 5 years x 50 categories x 100 expenses and an allocation per
+category per month (about 300,000 rows), plus 15 smaller users.
+
+Also times `close_ledger_period` across all the users with 1 and 4 workers,
+and its --verify recount. Runs on a file database under
+DJANGO_SQLITE_PROFILE=production, so the worker threads share it and queue
+for the write lock (busy timeout, IMMEDIATE transactions) rather than fail.
+On SQLite the writes still go one at a time; the extra workers overlap the
+reads. Pass a smaller expenses-per-month count as the first argument for
+a quicker run.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, time as day_time
+from decimal import Decimal
+from pathlib import Path
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+os.environ.setdefault('DJANGO_SQLITE_PROFILE', 'production')
+setup_django()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget import rollups  # noqa: E402
+from budget.models import Account, BudgetAllocation, Category, LedgerCheckpoint, Transaction  # noqa: E402
+
+YEARS = 5
+CATEGORIES = 50
+SMALL_USERS = 15
+ITERATIONS = 20
+
+
+def seed(user, per_month):
+    account = Account.objects.create(user=user, name='Checking', balance=Decimal('0.00'))
+    categories = [Category.objects.create(user=user, name=f'Category {i:02}') for i in range(CATEGORIES)]
+    # The dates are auto_now_add; switch that off to spread the history over the years.
+    fields = [Transaction._meta.get_field('date'), BudgetAllocation._meta.get_field('allocated_at')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        last = rollups.month_of(timezone.now())
+        for offset in range(YEARS * 12):
+            moment = timezone.make_aware(datetime.combine(rollups.add_months(last, -offset), day_time(12)))
+            BudgetAllocation.objects.bulk_create(
+                BudgetAllocation(category=category, account=account, amount=Decimal('500.00'), allocated_at=moment)
+                for category in categories
+            )
+            Transaction.objects.bulk_create((
+                Transaction(
+                    user=user, account=account, category=category, date=moment,
+                    transaction_type='expense', amount=Decimal(i % 90) + Decimal('0.25'),
+                )
+                for category in categories for i in range(per_month)
+            ), batch_size=5000)
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def timed(func):
+    best = float('inf')
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def close(*args):
+    start = time.perf_counter()
+    call_command('close_ledger_period', *args, stdout=open('/dev/null', 'w'))
+    return time.perf_counter() - start
+
+
+def main():
+    per_month = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    with tempfile.TemporaryDirectory() as tmp:
+        create_test_db(Path(tmp) / 'bench.sqlite3')
+        user = make_user()
+        seed(user, per_month)
+        for i in range(SMALL_USERS):
+            seed(make_user(f'small{i}'), max(1, per_month // 20))
+        print(f"{Transaction.objects.count():,} transactions, {BudgetAllocation.objects.count():,} allocations")
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        paths = ['/api/categories/balances/', '/api/dashboard/']
+        before = {path: client.get(path).data for path in paths}
+        full = {path: timed(lambda: client.get(path)) for path in paths}
+
+        print(f"close, 1 worker:  {close('--workers', '1'):.2f}s")
+        LedgerCheckpoint.objects.all().delete()
+        print(f"close, 4 workers: {close('--workers', '4'):.2f}s")
+        print(f"verify, 4 workers: {close('--verify', '--workers', '4'):.2f}s")
+
+        print(f"{'endpoint':<28} {'from scratch':>14} {'checkpointed':>14}")
+        for path in paths:
+            assert client.get(path).data == before[path], path
+            checkpointed = timed(lambda: client.get(path))
+            print(f"{path:<28} {full[path] * 1000:>12.2f}ms {checkpointed * 1000:>12.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+CPU cost versus bytes saved when compressing transaction-list JSON of typical
+sizes, for each codec budget.middleware can use here (gzip always; brotli and
+zstd when their packages are installed) at a few levels.
+
+Payloads come from the real serializer/renderer, so the ratios reflect
+repetitive API JSON rather than random text.
+"""
+import time
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+setup_django()
+
+from budget import middleware  # noqa: E402
+from budget.models import Account, Category, Transaction  # noqa: E402
+from budget.renderers import ORJSONRenderer  # noqa: E402
+from budget.serializers import TransactionSerializer  # noqa: E402
+
+ROW_COUNTS = [3, 30, 300, 3000]
+LEVELS = {
+    'gzip': ('GZIP_LEVEL', [1, 6, 9]),
+    'br': ('BROTLI_QUALITY', [1, 4, 11]),
+    'zstd': ('ZSTD_LEVEL', [1, 3, 9]),
+}
+
+
+def measure(codec, payload):
+    """Best-of-several seconds per compress call, and compressed size."""
+    repeats = max(3, 2_000_000 // len(payload))
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            compressed = codec.compress(payload)
+        best = min(best, (time.perf_counter() - start) / repeats)
+    return best, len(compressed)
+
+
+def main():
+    create_test_db()
+    user = make_user()
+    account = Account.objects.create(user=user, name='Checking', balance=Decimal('100000.00'))
+    categories = [Category.objects.create(user=user, name=f'Category {i}') for i in range(20)]
+    Transaction.objects.bulk_create(
+        Transaction(
+            user=user, account=account, category=categories[i % len(categories)],
+            transaction_type='expense', amount=Decimal(i % 500) + Decimal('0.99'),
+            description=f'Purchase #{i}',
+        )
+        for i in range(max(ROW_COUNTS))
+    )
+    rows = TransactionSerializer(Transaction.objects.select_related('account', 'category'), many=True).data
+
+    print(f"{'payload':>10} {'codec':>10} {'bytes':>10} {'saved':>7} {'µs/resp':>10} {'MB/s':>8}")
+    for count in ROW_COUNTS:
+        payload = ORJSONRenderer().render(rows[:count])
+        for name, (setting, levels) in LEVELS.items():
+            if name not in middleware.CODECS:
+                continue
+            for level in levels:
+                codec = middleware.CODECS[name]({**middleware.DEFAULTS, setting: level})
+                seconds, size = measure(codec, payload)
+                print(f"{len(payload):>10,} {f'{name}-{level}':>10} {size:>10,} "
+                      f"{1 - size / len(payload):>7.0%} {seconds * 1e6:>10.1f} "
+                      f"{len(payload) / seconds / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Latency of the first POST /api/auth/register/ served by a freshly forked
+worker, with and without budget.apps.warm_up() having run in the parent (as
+budgetapp.wsgi does under gunicorn --preload). The cold samples fork from a
+process that has only run django.setup().
+"""
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import create_test_db, setup_django
+
+setup_django()
+
+from django.contrib.auth.password_validation import get_default_password_validators  # noqa: E402
+from django.db import connections  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget.apps import warm_up  # noqa: E402
+
+FORKS = 10
+
+
+def first_request_ms(index):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        start = time.perf_counter()
+        response = APIClient().post('/api/auth/register/', {
+            'username': f'user{index}',
+            'email': f'user{index}@bench.test',
+            'password': 'Correct-Horse-42',
+            'password_confirm': 'Correct-Horse-42',
+        }, format='json')
+        elapsed = (time.perf_counter() - start) * 1000
+        assert response.status_code == 201, response.content
+        os.write(write_fd, str(elapsed).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        elapsed = float(pipe.read())
+    os.waitpid(pid, 0)
+    return elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        create_test_db(Path(tmp) / 'bench.sqlite3')
+        connections.close_all()
+
+        results = {}
+        for label, warm in [('cold worker', False), ('warmed before fork', True)]:
+            # The cold samples come first, before anything has imported the URLconf.
+            samples = []
+            for i in range(FORKS):
+                get_default_password_validators.cache_clear()
+                if warm:
+                    warm_up()
+                samples.append(first_request_ms(f'{int(warm)}{i}'))
+            results[label] = samples
+
+        for label, samples in results.items():
+            print(f"{label:<25} first request median {statistics.median(samples):>7.1f} ms"
+                  f"   max {max(samples):>7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
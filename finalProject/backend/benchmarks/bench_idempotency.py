@@ -0,0 +1,97 @@
+"""
+Idempotency keys on POST /api/transactions/ (budget.idempotency):
+
+- latency of a first attempt against a retry replayed from its key;
+- 8 threads sending the same keyed request at once, 50 times: how many
+  transactions get written (one per key) and whether every thread got the
+  same response.
+
+Runs on a file database under DJANGO_SQLITE_PROFILE=production so the
+threads' connections share it.
+"""
+import os
+import statistics
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+os.environ.setdefault('DJANGO_SQLITE_PROFILE', 'production')
+setup_django()
+
+from django.db import connections  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget.models import Account, Category, Transaction  # noqa: E402
+
+REQUESTS = 300
+THREADS = 8
+ROUNDS = 50
+
+
+def timings(client, payload, keys):
+    latencies = []
+    for key in keys:
+        start = time.perf_counter()
+        response = client.post('/api/transactions/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 201, response.status_code
+    return latencies
+
+
+def print_latency(label, latencies):
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{label:<32} p50 {cuts[49]:>7.2f} ms   p99 {cuts[98]:>7.2f} ms")
+
+
+def duplicates(user, payload, key):
+    barrier = threading.Barrier(THREADS)
+    bodies = []
+
+    def attempt():
+        client = APIClient()
+        client.force_authenticate(user=user)
+        barrier.wait()
+        response = client.post('/api/transactions/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        bodies.append((response.status_code, response.content))
+        connections.close_all()
+
+    threads = [threading.Thread(target=attempt) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return bodies
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        create_test_db(Path(tmp) / 'bench.sqlite3')
+        user = make_user()
+        account = Account.objects.create(user=user, name='Checking', balance=Decimal('1000000.00'))
+        category = Category.objects.create(user=user, name='Food')
+        payload = {'account': account.id, 'category': category.id, 'transaction_type': 'expense', 'amount': '1.00'}
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        keys = [f'latency-{i}' for i in range(REQUESTS)]
+        print_latency('first attempt', timings(client, payload, keys))
+        print_latency('retry (replayed)', timings(client, payload, keys))
+
+        before = Transaction.objects.count()
+        consistent = 0
+        start = time.perf_counter()
+        for i in range(ROUNDS):
+            bodies = duplicates(user, payload, f'race-{i}')
+            consistent += len(set(bodies)) == 1 and bodies[0][0] == 201
+        elapsed = time.perf_counter() - start
+        written = Transaction.objects.count() - before
+        print(f"{ROUNDS} keys x {THREADS} concurrent attempts in {elapsed:.1f}s: {written} transactions written, "
+              f"{consistent}/{ROUNDS} rounds with one response for every attempt")
+
+
+if __name__ == '__main__':
+    main()
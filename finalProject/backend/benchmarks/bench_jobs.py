@@ -0,0 +1,94 @@
+"""
+The background job queue (budget.jobs):
+
+- rules/apply/ for a user with 20,000 uncategorized transactions: the request
+  categorizing them itself, as it used to, against queueing the job;
+- draining 2,000 jobs that each take 5 ms, with 1 and with 4 worker
+  processes: throughput, and whether every job ran exactly once.
+
+Runs on a file database under DJANGO_SQLITE_PROFILE=production so the worker
+processes share it. Pass a different job count as the first argument.
+"""
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from functools import partial
+from pathlib import Path
+from uuid import uuid4
+
+from benchmarks.common import create_test_db, make_user, report, setup_django
+
+os.environ.setdefault('DJANGO_SQLITE_PROFILE', 'production')
+setup_django()
+
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget import jobs, workers  # noqa: E402
+from budget.categorization import categorize_uncategorized  # noqa: E402
+from budget.models import Account, CategorizationRule, Category, Job, Transaction  # noqa: E402
+
+TRANSACTIONS = 20000
+JOB_SECONDS = 0.005
+
+
+def sleep_job(job):
+    time.sleep(JOB_SECONDS)
+
+
+def make_uncategorized(user):
+    account = Account.objects.create(user=user, name='Checking', balance=Decimal('1000000.00'))
+    category = Category.objects.create(user=user, name='Coffee')
+    CategorizationRule.objects.create(user=user, category=category, pattern='coffee')
+    Transaction.objects.bulk_create(
+        Transaction(user=user, account=account, transaction_type='expense', amount=Decimal('3.50'),
+                    description='Corner coffee' if i % 2 else 'Groceries')
+        for i in range(TRANSACTIONS)
+    )
+    return Transaction.objects.filter(category__isnull=False)
+
+
+def drain(count, processes):
+    for _ in range(count):
+        jobs.enqueue(sleep_job)
+    start = time.perf_counter()
+    names = [uuid4().hex for _ in range(processes)]
+    for _ in workers.run(partial(jobs.work, burst=True), names, processes):
+        pass
+    seconds = time.perf_counter() - start
+    ran = Job.objects.filter(status=Job.SUCCEEDED)
+    report(f'drain, {processes} worker processes', count, seconds, 'jobs/s')
+    print(f"  {ran.count():,} of {count:,} succeeded, {ran.filter(attempts=1).count():,} on their first attempt")
+    Job.objects.all().delete()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        create_test_db(Path(tmp) / 'bench.sqlite3')
+        user = make_user()
+        categorized = make_uncategorized(user)
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        start = time.perf_counter()
+        categorize_uncategorized(user.id)
+        print(f"request categorizing {categorized.count():,} transactions itself: "
+              f"{(time.perf_counter() - start) * 1000:,.1f} ms")
+        categorized.update(category=None)
+
+        start = time.perf_counter()
+        resp = client.post('/api/rules/apply/')
+        print(f"request queueing the job: {(time.perf_counter() - start) * 1000:,.1f} ms ({resp.status_code})")
+        jobs.work(burst=True)
+        job = client.get(resp['Location']).json()
+        print(f"  job {job['status']}: {job['result']}, progress {job['progress']:,}/{job['total']:,}")
+        Job.objects.all().delete()
+
+        drain(count, 1)
+        drain(count, 4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Render and parse a 10k-transaction list payload with DRF's JSONRenderer /
+JSONParser versus budget.renderers.ORJSONRenderer / ORJSONParser.
+
+Serialization to primitives happens once up front; this measures only the
+JSON step.
+"""
+import io
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, report, run_for, setup_django
+
+setup_django()
+
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from budget.models import Account, Category, Transaction  # noqa: E402
+from budget.renderers import ORJSONParser, ORJSONRenderer  # noqa: E402
+from budget.serializers import TransactionSerializer  # noqa: E402
+
+ROWS = 10_000
+ITERATIONS = 20
+
+
+def main():
+    create_test_db()
+    user = make_user()
+    account = Account.objects.create(user=user, name='Checking', balance=Decimal('100000.00'))
+    categories = [Category.objects.create(user=user, name=f'Category {i}') for i in range(20)]
+    Transaction.objects.bulk_create(
+        Transaction(
+            user=user, account=account, category=categories[i % len(categories)],
+            transaction_type='expense', amount=Decimal(i % 500) + Decimal('0.99'),
+            description=f'Purchase #{i}',
+        )
+        for i in range(ROWS)
+    )
+    queryset = Transaction.objects.filter(user=user).select_related('account', 'category')
+    data = TransactionSerializer(queryset, many=True).data
+    body = JSONRenderer().render(data)
+    assert ORJSONRenderer().render(data) == body
+    print(f"payload: {ROWS:,} transactions, {len(body) / 1024:,.0f} KiB\n")
+
+    for label, renderer in [('JSONRenderer', JSONRenderer()), ('ORJSONRenderer', ORJSONRenderer())]:
+        report(f'render  {label}', ITERATIONS, run_for(lambda: renderer.render(data), ITERATIONS), unit='payloads/s')
+    for label, parser in [('JSONParser', JSONParser()), ('ORJSONParser', ORJSONParser())]:
+        report(f'parse   {label}', ITERATIONS, run_for(lambda: parser.parse(io.BytesIO(body)), ITERATIONS),
+               unit='payloads/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+The ledger event log (budget.events), for one user with 10 accounts and 20
+categories:
+
+- writes: moving a balance the old way (read the account, change it, save
+  it) against appending the event and adding it with one UPDATE;
+- projection: replaying 200,000 events from the beginning against replaying
+  the 1,000 appended after a snapshot.
+
+Pass a different event count as the first argument.
+"""
+import random
+import sys
+import time
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, report, setup_django
+
+setup_django()
+
+from django.db import transaction  # noqa: E402
+
+from budget import events  # noqa: E402
+from budget.models import Account, Category, LedgerEvent, LedgerSnapshot  # noqa: E402
+
+ACCOUNTS = 10
+CATEGORIES = 20
+WRITES = 2000
+TAIL = 1000
+
+
+def postings(accounts, categories, count):
+    rng = random.Random(count)
+    for _ in range(count):
+        amount = Decimal(rng.randint(1, 10000)).scaleb(-2)
+        yield events.Posting(rng.choice(accounts), rng.choice(categories), -amount, Decimal('0'), amount)
+
+
+def save_loop(accounts, categories):
+    """A write as TransactionViewSet.perform_create made it before the log."""
+    for posting in postings(accounts, categories, WRITES):
+        with transaction.atomic():
+            account = Account.objects.get(pk=posting.account)
+            account.balance += posting.balance
+            account.save()
+
+
+def append_loop(user_id, accounts, categories):
+    for posting in postings(accounts, categories, WRITES):
+        with transaction.atomic():
+            events.append(user_id, [(LedgerEvent.TRANSACTION_CREATED, None, posting)])
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    create_test_db()
+    user = make_user()
+    accounts = [Account.objects.create(user=user, name=f'Account {i}', balance=Decimal('1000.00')).pk
+                for i in range(ACCOUNTS)]
+    categories = list(Category.objects.bulk_create(
+        Category(user=user, name=f'Category {i}') for i in range(CATEGORIES)
+    ))
+    categories = [category.pk for category in categories]
+
+    seconds, _ = timed(save_loop, accounts, categories)
+    report('write: read, change and save the account', WRITES, seconds, 'writes/s')
+    # Those writes left no events; start the log from the opening balances again.
+    Account.objects.update(balance=Decimal('1000.00'))
+    seconds, _ = timed(append_loop, user.id, accounts, categories)
+    report('write: append the event', WRITES, seconds, 'writes/s')
+
+    start = time.perf_counter()
+    with transaction.atomic():
+        batch = [(LedgerEvent.TRANSACTION_CREATED, None, posting)
+                 for posting in postings(accounts, categories, count)]
+        events.append(user.id, batch)
+    print(f"{count:,} more events appended in {time.perf_counter() - start:.1f}s")
+
+    seconds, projection = timed(events.project, user.id)
+    report('project: replay every event', 1, seconds, 'projections/s')
+    stored = dict(Account.objects.values_list('id', 'balance'))
+    assert projection.balances == stored, 'projection disagrees with the stored balances'
+
+    seconds, _ = timed(events.snapshot, user.id)
+    print(f"snapshot written in {seconds * 1000:,.1f} ms ({LedgerSnapshot.objects.count()} rows)")
+    events.append(user.id, [(LedgerEvent.TRANSACTION_CREATED, None, posting)
+                            for posting in postings(accounts, categories, TAIL)])
+    seconds, projection = timed(events.project, user.id)
+    report(f'project: snapshot + {TAIL:,} events', 1, seconds, 'projections/s')
+    stored = dict(Account.objects.values_list('id', 'balance'))
+    assert projection.balances == stored, 'projection disagrees with the stored balances'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+p50/p99 latency of GET /api/accounts/ while a burst of logins is in flight.
+
+Compares an idle server, a burst whose hashing is effectively unbounded (one
+pool thread per login client), and a burst capped at PASSWORD_HASHING['WORKERS'].
+hashlib releases the GIL, so the in-process threads contend for CPU the way
+separate workers would.
+"""
+import statistics
+import threading
+import time
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget import authentication  # noqa: E402
+from budget.authentication import tokens_for_user  # noqa: E402
+
+LOGIN_CLIENTS = 16
+PROBE_SECONDS = 5
+
+
+def login_loop(stop):
+    client = APIClient()
+    while not stop.is_set():
+        client.post('/api/auth/login/', {'username': 'bench', 'password': 'bench-pass-123'}, format='json')
+
+
+def probe(access):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    latencies = []
+    deadline = time.perf_counter() + PROBE_SECONDS
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = client.get('/api/accounts/')
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return latencies
+
+
+def scenario(label, access, login_clients, hash_workers):
+    settings.PASSWORD_HASHING['WORKERS'] = hash_workers
+    authentication._hashing_pool = None
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=login_loop, args=(stop,)) for _ in range(login_clients)]
+    for thread in threads:
+        thread.start()
+    latencies = probe(access)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{label:<40} p50 {cuts[49]:>8.1f} ms   p99 {cuts[98]:>8.1f} ms   ({len(latencies)} requests)")
+
+
+def main():
+    create_test_db()
+    user = make_user()
+    access = tokens_for_user(user)['access']
+
+    scenario('no login burst', access, 0, 2)
+    scenario(f'{LOGIN_CLIENTS} logins, unbounded hashing', access, LOGIN_CLIENTS, LOGIN_CLIENTS)
+    scenario(f'{LOGIN_CLIENTS} logins, 2 hashing threads', access, LOGIN_CLIENTS, 2)
+
+
+if __name__ == '__main__':
+    main()
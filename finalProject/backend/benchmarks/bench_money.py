@@ -0,0 +1,113 @@
+"""
+Amount sums and reads with decimal columns versus integer cents
+(budget.money.MoneyField), on the same 300,000 transactions: 5 years x 50
+categories x 100 per category per month.
+
+The rows are written at migration 0007, where amounts are still decimals,
+and timed through the models as they were then. Migration 0008 (also timed)
+then converts them in place and the same queries run through the current
+models. Pass a smaller transactions-per-month count as the first argument
+for a quicker run.
+"""
+import sys
+import time
+from datetime import datetime, time as day_time
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+setup_django()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.migrations.loader import MigrationLoader  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from budget import models as current, rollups  # noqa: E402
+
+YEARS = 5
+CATEGORIES = 50
+ITERATIONS = 20
+PAGE = 1000
+
+
+def seed(models, user_id, per_month):
+    account = models.Account.objects.create(user_id=user_id, name='Checking', balance=Decimal('0.00'))
+    categories = [models.Category.objects.create(user_id=user_id, name=f'Category {i:02}') for i in range(CATEGORIES)]
+    last = rollups.month_of(timezone.now())
+    for offset in range(YEARS * 12):
+        moment = timezone.make_aware(datetime.combine(rollups.add_months(last, -offset), day_time(12)))
+        models.Transaction.objects.bulk_create((
+            models.Transaction(
+                user_id=user_id, account=account, category=category, date=moment,
+                transaction_type='expense', amount=Decimal(i * 37 % 9000 + 1) / 100,
+            )
+            for category in categories for i in range(per_month)
+        ), batch_size=5000)
+
+
+def timed(func):
+    best = float('inf')
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def cases(models, user_id):
+    transactions = models.Transaction.objects.filter(user_id=user_id)
+    return {
+        'sum per category': lambda: list(
+            transactions.values('category').annotate(total=Sum('amount')).order_by()
+        ),
+        'total': lambda: transactions.aggregate(total=Sum('amount')),
+        'all amounts': lambda: list(transactions.values_list('amount', flat=True)),
+        f'page of {PAGE} rows': lambda: list(
+            transactions.order_by('-date').values_list('id', 'amount', 'date', 'description')[:PAGE]
+        ),
+        f'page of {PAGE} instances': lambda: list(transactions.order_by('-date')[:PAGE]),
+    }
+
+
+def analyze():
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def run(models, user_id):
+    results = {}
+    for name, func in cases(models, user_id).items():
+        results[name] = (func(), timed(func))
+    return results
+
+
+def main():
+    per_month = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    create_test_db()
+    user = make_user()
+    call_command('migrate', 'budget', '0007', verbosity=0)
+    decimal_models = MigrationLoader(connection).project_state(('budget', '0007_ledger_checkpoints')).apps
+    models = type('Models', (), {name: decimal_models.get_model('budget', name)
+                                 for name in ('Account', 'Category', 'Transaction')})
+    seed(models, user.id, per_month)
+    print(f"{models.Transaction.objects.count():,} transactions")
+    analyze()
+
+    before = run(models, user.id)
+    start = time.perf_counter()
+    call_command('migrate', 'budget', '0008', verbosity=0)
+    print(f"migration 0008: {time.perf_counter() - start:.2f}s")
+    analyze()
+    after = run(current, user.id)
+
+    # SQLite sums the decimal column as floating point; the cents add up exactly.
+    print(f"sum of amounts: decimal {before['total'][0]['total']}, cents {after['total'][0]['total']}")
+    print(f"{'query':<26} {'decimal':>12} {'cents':>12}")
+    for name, (_, seconds) in before.items():
+        print(f"{name:<26} {seconds * 1000:>10.2f}ms {after[name][1] * 1000:>10.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Rows/second for the transaction and allocation list payloads: DRF
+serializers over model instances versus budget.projections.ValuesProjection.
+
+Both paths start from the same queryset and include the query itself. The
+serializer path runs with and without select_related, since the plain viewset
+queryset loads category and account once per row.
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+
+from benchmarks.common import create_test_db, make_user, report, run_for, setup_django
+
+setup_django()
+
+from budget.models import Account, BudgetAllocation, Category, Transaction  # noqa: E402
+from budget.projections import ValuesProjection  # noqa: E402
+from budget.serializers import BudgetAllocationSerializer, TransactionSerializer  # noqa: E402
+
+ROWS = 5_000
+ITERATIONS = 5
+
+
+def main():
+    create_test_db()
+    user = make_user()
+    request = SimpleNamespace(user=user)
+    account = Account.objects.create(user=user, name='Checking', balance=Decimal('100000.00'))
+    categories = [Category.objects.create(user=user, name=f'Category {i}') for i in range(20)]
+    Transaction.objects.bulk_create(
+        Transaction(
+            user=user, account=account, category=categories[i % len(categories)],
+            transaction_type='expense', amount=Decimal(i % 500) + Decimal('0.99'),
+            description=f'Purchase #{i}',
+        )
+        for i in range(ROWS)
+    )
+    BudgetAllocation.objects.bulk_create(
+        BudgetAllocation(category=categories[i % len(categories)], account=account, amount=Decimal('10.00'))
+        for i in range(ROWS)
+    )
+
+    for model, serializer_class in [(Transaction, TransactionSerializer), (BudgetAllocation, BudgetAllocationSerializer)]:
+        queryset = model.objects.for_user(user.id)
+        projection = ValuesProjection(serializer_class)
+        context = {'request': request}
+        assert projection.rows(queryset, request) == serializer_class(queryset, many=True, context=context).data
+
+        print(f'{model.__name__} list, {ROWS:,} rows')
+        for label, func in [
+            ('serializer', lambda: serializer_class(queryset.all(), many=True, context=context).data),
+            ('serializer + select_related', lambda: serializer_class(
+                queryset.select_related('category', 'account'), many=True, context=context).data),
+            ('ValuesProjection', lambda: projection.rows(queryset.all(), request)),
+        ]:
+            report(f'  {label}', ROWS * ITERATIONS, run_for(func, ITERATIONS), unit='rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+rebuild_account_balances: the old loop (one aggregate and one save() per
+account) against the ranged, batched rebuild with 1 and 4 worker processes,
+for 5,000 users with 2 accounts and 10 allocations each.
+
+Runs on a file database under DJANGO_SQLITE_PROFILE=production so the
+worker processes share it. SQLite takes one writer at a time, so there
+the extra workers only overlap reads; on PostgreSQL the ranges commit in
+parallel. Pass a different user count as the first argument.
+"""
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from benchmarks.common import create_test_db, setup_django
+
+os.environ.setdefault('DJANGO_SQLITE_PROFILE', 'production')
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.db.migrations.recorder import MigrationRecorder  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from budget import balances  # noqa: E402
+from budget.models import Account, AccountBalanceRebuild, BudgetAllocation, Category  # noqa: E402
+
+ACCOUNTS = 2
+ALLOCATIONS = 5
+BALANCE = Decimal('1000.00')
+
+
+def seed(users):
+    User.objects.bulk_create(User(username=f'bench{i}', password='!') for i in range(users))
+    user_ids = list(User.objects.values_list('id', flat=True))
+    Category.objects.bulk_create(Category(user_id=user_id, name='Spending') for user_id in user_ids)
+    categories = dict(Category.objects.values_list('user_id', 'id'))
+    Account.objects.bulk_create(
+        Account(user_id=user_id, name=f'Account {i}', balance=BALANCE) for user_id in user_ids for i in range(ACCOUNTS)
+    )
+    BudgetAllocation.objects.bulk_create((
+        BudgetAllocation(account_id=account_id, category_id=categories[user_id], amount=Decimal(i + 1) / 4)
+        for account_id, user_id in Account.objects.values_list('id', 'user_id') for i in range(ALLOCATIONS)
+    ), batch_size=5000)
+    # The seeded accounts predate the allocation change the rebuild corrects.
+    app, name = balances.CUTOVER_MIGRATION
+    MigrationRecorder.Migration.objects.filter(app=app, name=name).update(applied=timezone.now())
+
+
+def reset():
+    AccountBalanceRebuild.objects.all().delete()
+    Account.objects.update(balance=BALANCE)
+
+
+def old_loop():
+    """The command as it was before the rebuild became batched."""
+    for account in Account.objects.all():
+        total = BudgetAllocation.objects.filter(account=account).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        account.balance = account.balance + total
+        account.save(update_fields=['balance'])
+
+
+def timed(func):
+    reset()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    total = Account.objects.aggregate(total=Sum('balance'))['total']
+    return seconds, total
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        create_test_db(Path(tmp) / 'bench.sqlite3')
+        seed(users)
+        accounts = Account.objects.count()
+        print(f"{users:,} users, {accounts:,} accounts, {BudgetAllocation.objects.count():,} allocations")
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        devnull = open(os.devnull, 'w')
+        runs = {
+            'old loop': old_loop,
+            'batched, 1 worker': lambda: call_command('rebuild_account_balances', '--workers', '1', stdout=devnull),
+            'batched, 4 workers': lambda: call_command('rebuild_account_balances', '--workers', '4', stdout=devnull),
+        }
+        expected = None
+        for label, func in runs.items():
+            seconds, total = timed(func)
+            connections.close_all()
+            expected = expected or total
+            assert total == expected, (label, total, expected)
+            print(f"{label:<22} {seconds:>8.2f}s {accounts / seconds:>12,.0f} accounts/s")
+
+        start = time.perf_counter()
+        call_command('rebuild_account_balances', '--verify', '--workers', '4', stdout=devnull)
+        print(f"{'verify, 4 workers':<22} {time.perf_counter() - start:>8.2f}s")
+
+
+if __name__ == '__main__':
+    main()
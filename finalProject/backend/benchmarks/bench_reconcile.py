@@ -0,0 +1,98 @@
+"""
+reconcile_balances over 10,000,000 transactions: 20,000 accounts with 500
+each, 25 of them drifted, with 1 and 4 worker processes, then with --fix.
+
+The rows are generated in SQL (a recursive CTE) rather than through the
+ORM, with the search triggers off while loading, so seeding takes minutes
+rather than hours. Runs on a file database under
+DJANGO_SQLITE_PROFILE=production so the workers share it. Pass a smaller
+transactions-per-account count as the first argument for a quicker run.
+"""
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+
+from benchmarks.common import create_test_db, setup_django
+
+os.environ.setdefault('DJANGO_SQLITE_PROFILE', 'production')
+setup_django()
+
+from django.core.management import CommandError, call_command  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+
+from budget import search  # noqa: E402
+
+ACCOUNTS = 20000
+DRIFTED = 25
+
+
+def seed(per_account):
+    total = ACCOUNTS * per_account
+    with connection.cursor() as cursor:
+        for name in search._SQLITE_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        ids = f'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {ACCOUNTS}) '
+        cursor.execute(
+            ids + "INSERT INTO auth_user (id, password, is_superuser, username, first_name, last_name, email, "
+            "is_staff, is_active, date_joined) SELECT i, '!', 0, 'bench' || i, '', '', '', 0, 1, "
+            "'2026-01-01 00:00:00' FROM n"
+        )
+        cursor.execute(ids + "INSERT INTO budget_category (id, user_id, name, created_at) "
+                             "SELECT i, i, 'Spending', '2026-01-01 00:00:00' FROM n")
+        cursor.execute(ids + "INSERT INTO budget_account (id, user_id, name, balance, opening_balance, created_at, "
+                             "updated_at) SELECT i, i, 'Checking', 0, 100000, '2026-01-01 00:00:00', "
+                             "'2026-01-01 00:00:00' FROM n")
+        # Transaction i belongs to account (i % ACCOUNTS) + 1; every tenth is income. Amounts are in cents.
+        cursor.execute(
+            f"WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {total}) "
+            "INSERT INTO budget_transaction (id, user_id, account_id, category_id, transaction_type, amount, "
+            "description, date) SELECT i, i % {0} + 1, i % {0} + 1, i % {0} + 1, "
+            "CASE WHEN i % 10 = 0 THEN 'income' ELSE 'expense' END, (i * 37) % 10000 + 1, '', "
+            "'2026-01-01 00:00:00' FROM n".format(ACCOUNTS)
+        )
+        cursor.execute(
+            "UPDATE budget_account SET balance = opening_balance + (SELECT COALESCE(SUM(CASE WHEN transaction_type "
+            "= 'income' THEN amount ELSE -amount END), 0) FROM budget_transaction t WHERE t.account_id = "
+            "budget_account.id)"
+        )
+        cursor.execute(f'UPDATE budget_account SET balance = balance + 1 WHERE id % {ACCOUNTS // DRIFTED} = 0')
+        cursor.execute('ANALYZE')
+    return total
+
+
+def reconcile(*args):
+    """(seconds, accounts reported as drifted)."""
+    out = StringIO()
+    start = time.perf_counter()
+    try:
+        call_command('reconcile_balances', *args, stdout=out)
+    except CommandError:
+        pass
+    seconds = time.perf_counter() - start
+    connections.close_all()
+    return seconds, sum(line.startswith('Account ') for line in out.getvalue().splitlines())
+
+
+def main():
+    per_account = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as tmp:
+        create_test_db(Path(tmp) / 'bench.sqlite3')
+        start = time.perf_counter()
+        total = seed(per_account)
+        print(f"{total:,} transactions, {ACCOUNTS:,} accounts, seeded in {time.perf_counter() - start:.0f}s")
+
+        for label, args in [
+            ('check, 1 worker', ['--workers', '1']),
+            ('check, 4 workers', ['--workers', '4']),
+            ('fix, 4 workers', ['--workers', '4', '--fix']),
+            ('check after fix', ['--workers', '4']),
+        ]:
+            seconds, drifted = reconcile(*args)
+            print(f"{label:<18} {seconds:>7.2f}s {total / seconds:>14,.0f} transactions/s  {drifted} drifted")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Catching up on recurring transactions (budget.recurring) after the scheduler
+was down for a year: 200 users with 3 monthly schedules each, 12 missed
+occurrences per schedule.
+
+- one occurrence at a time, as the API writes a transaction (create it,
+  append its event, update its rollup), against recurring.run's batches;
+- 4 threads running the scheduler at once over the same schedules: every
+  occurrence must be written exactly once.
+
+Runs on a file database under DJANGO_SQLITE_PROFILE=production so the
+threads' connections share it. Pass a different user count as the first
+argument.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+from benchmarks.common import create_test_db, make_user, report, setup_django
+
+os.environ.setdefault('DJANGO_SQLITE_PROFILE', 'production')
+setup_django()
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from budget import events, recurring, rollups  # noqa: E402
+from budget.models import (  # noqa: E402
+    Account, Category, CategoryMonthRollup, LedgerEvent, RecurringTransaction, Transaction,
+)
+
+SCHEDULES_PER_USER = 3
+MONTHS = 12
+THREADS = 4
+STARTS = timezone.make_aware(datetime(2025, 1, 15, 9))
+UNTIL = timezone.make_aware(datetime(2025, 12, 31))
+
+
+def make_schedules(users):
+    schedules = []
+    for i in range(users):
+        user = make_user(f'bench{i}')
+        account = Account.objects.create(user=user, name='Checking', balance=Decimal('100000.00'))
+        category = Category.objects.create(user=user, name='Bills')
+        for n in range(SCHEDULES_PER_USER):
+            schedule = RecurringTransaction(
+                user=user, account=account, category=category, transaction_type='expense',
+                amount=Decimal('10.00') + n, description=f'Bill {n}', starts_at=STARTS,
+            )
+            schedule.set_next_run()
+            schedules.append(schedule)
+    RecurringTransaction.objects.bulk_create(schedules)
+
+
+def reset():
+    Transaction.objects.all().delete()
+    LedgerEvent.objects.filter(kind=LedgerEvent.TRANSACTION_CREATED).delete()
+    CategoryMonthRollup.objects.all().delete()
+    Account.objects.update(balance=Decimal('100000.00'))
+    RecurringTransaction.objects.update(occurrences=0, next_run=STARTS, active=True, claimed_by='', lease_until=None)
+
+
+def one_at_a_time():
+    for schedule in RecurringTransaction.objects.all():
+        while schedule.active and schedule.next_run <= UNTIL:
+            with transaction.atomic():
+                txn = recurring.occurrence(schedule, schedule.next_run)
+                txn.save()
+                events.transaction_created(txn)
+                rollups.add_transaction(txn)
+                schedule.occurrences += 1
+                schedule.save()
+
+
+def concurrent_runs():
+    barrier = threading.Barrier(THREADS)
+
+    def worker():
+        barrier.wait()
+        recurring.run(DEFAULT_DB_ALIAS, until=UNTIL, batch_size=100)
+        connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    expected = users * SCHEDULES_PER_USER * MONTHS
+    with tempfile.TemporaryDirectory() as tmp:
+        create_test_db(Path(tmp) / 'bench.sqlite3')
+        make_schedules(users)
+
+        report('one occurrence at a time', expected, timed(one_at_a_time), 'occurrences/s')
+        assert Transaction.objects.count() == expected
+        reset()
+        report('recurring.run, batches of 500', expected, timed(lambda: recurring.run(DEFAULT_DB_ALIAS, until=UNTIL)),
+               'occurrences/s')
+        assert Transaction.objects.count() == expected
+        reset()
+        seconds = timed(concurrent_runs)
+        written = Transaction.objects.count()
+        report(f'{THREADS} concurrent runs, batches of 100', written, seconds, 'occurrences/s')
+        print(f"{written:,} occurrences written for {expected:,} due"
+              + ("" if written == expected else " -- MISMATCH"))
+        drifted = sum(len(events.drifted(user_id)) for user_id in
+                      RecurringTransaction.objects.values_list('user_id', flat=True).distinct())
+        print(f"{drifted} balances disagree with the ledger events")
+
+
+if __name__ == '__main__':
+    main()
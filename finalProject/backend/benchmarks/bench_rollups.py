@@ -0,0 +1,107 @@
+"""
+Spending reports from the monthly rollups versus the same numbers grouped
+straight from the transactions, for one user with 5 years x 50 categories x
+200 transactions per category per month (600,000 transactions).
+
+Also times the backfill that builds the rollups from those transactions.
+Pass a smaller transactions-per-month count as the first argument for a
+quicker run.
+"""
+import sys
+import time
+from datetime import datetime, time as day_time
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget import rollups  # noqa: E402
+from budget.models import Account, Category, Transaction  # noqa: E402
+
+YEARS = 5
+CATEGORIES = 50
+ITERATIONS = 20
+
+
+def seed(user, per_month):
+    account = Account.objects.create(user=user, name='Checking', balance=Decimal('0.00'))
+    categories = [Category.objects.create(user=user, name=f'Category {i:02}') for i in range(CATEGORIES)]
+    # Transaction.date is auto_now_add; insert with it off to spread the history over the years.
+    date_field = Transaction._meta.get_field('date')
+    date_field.auto_now_add = False
+    try:
+        last = rollups.month_of(timezone.now())
+        for offset in range(YEARS * 12):
+            month = rollups.add_months(last, -offset)
+            moment = timezone.make_aware(datetime.combine(month, day_time(12)))
+            Transaction.objects.bulk_create((
+                Transaction(
+                    user=user, account=account, category=category, date=moment,
+                    transaction_type='income' if i % 20 == 0 else 'expense',
+                    amount=Decimal(i % 90) + Decimal('0.25'),
+                )
+                for category in categories for i in range(per_month)
+            ), batch_size=5000)
+    finally:
+        date_field.auto_now_add = True
+
+
+def timed(func):
+    best = float('inf')
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    per_month = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    create_test_db()
+    user = make_user()
+    seed(user, per_month)
+    print(f"{Transaction.objects.count():,} transactions")
+
+    start = time.perf_counter()
+    written = rollups.rebuild(user.id)
+    print(f"backfill: {written:,} rollups in {time.perf_counter() - start:.2f}s")
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    client = APIClient()
+    client.force_authenticate(user)
+    transactions = Transaction.objects.filter(user=user)
+    scans = {
+        'monthly/': lambda: list(
+            rollups.monthly_totals(transactions).values('rollup_month')
+            .annotate(total=Sum('amount')).order_by('rollup_month')
+        ),
+        'categories/': lambda: list(
+            transactions.values('category').annotate(total=Sum('amount')).order_by()
+        ),
+        'trends/': lambda: list(
+            rollups.monthly_totals(transactions.filter(
+                date__gte=timezone.make_aware(datetime.combine(
+                    rollups.add_months(rollups.month_of(timezone.now()), -11), day_time()))
+            ))
+        ),
+    }
+
+    print(f"{'report':<14} {'from rollups':>14} {'scanning transactions':>22}")
+    for report, scan in scans.items():
+        path = f'/api/reports/{report}'
+        assert client.get(path).status_code == 200
+        from_rollups = timed(lambda: client.get(path))
+        scanning = timed(scan)
+        print(f"{report:<14} {from_rollups * 1000:>12.2f}ms {scanning * 1000:>20.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
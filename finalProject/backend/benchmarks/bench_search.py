@@ -0,0 +1,83 @@
+"""
+GET /api/transactions/?q= latency on a 5M-row transactions table: 100
+users with 50,000 transactions each. Descriptions are 2-5 words drawn from a
+Zipf-like vocabulary, so some words are rare and some are in a large share of
+rows. The FTS results are compared with an `icontains` scan of the same user's
+rows. Pass a smaller total row count as the first argument for a quicker run.
+"""
+import random
+import sys
+import time
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+setup_django()
+
+from django.db import connection, transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget.models import Account, Category, Transaction  # noqa: E402
+
+USERS = 100
+VOCABULARY = [f'word{i}' for i in range(5000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+ITERATIONS = 10
+
+
+def seed(rows):
+    rng = random.Random(42)
+    now = timezone.now()
+    per_user = rows // USERS
+    users = []
+    for u in range(USERS):
+        user = make_user(f'bench{u}')
+        account = Account.objects.create(user=user, name='Checking')
+        category = Category.objects.create(user=user, name='Everything')
+        users.append(user)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO budget_transaction (user_id, account_id, category_id, transaction_type, amount, '
+                'description, date) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                [
+                    (user.id, account.id, category.id, 'expense', Decimal('1.00'),
+                     ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(2, 5))), now)
+                    for _ in range(per_user)
+                ],
+            )
+    return users
+
+
+def timed(func):
+    best = float('inf')
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    create_test_db()
+    start = time.perf_counter()
+    user = seed(rows)[USERS // 2]
+    print(f"{Transaction.objects.count():,} transactions, seeded and indexed in {time.perf_counter() - start:.0f}s")
+
+    client = APIClient()
+    client.force_authenticate(user)
+    print(f"{'query':<22} {'matches':>8} {'fts ms':>8} {'icontains ms':>13}")
+    for query in ['word4000', 'word300', 'word20 word21', 'word1', 'word0']:
+        resp = client.get('/api/transactions/', {'q': query})
+        assert resp.status_code == 200, resp.data
+        fts = timed(lambda: client.get('/api/transactions/', {'q': query}))
+        scan = Transaction.objects.for_user(user.id)
+        for term in query.split():
+            scan = scan.filter(description__icontains=term)
+        icontains = timed(lambda: list(scan.values_list('id', flat=True)))
+        print(f"{query:<22} {len(resp.data):>8,} {fts * 1000:>8.1f} {icontains * 1000:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Mixed read/write throughput against one SQLite file from several worker
+processes, under the stock settings and DJANGO_SQLITE_PROFILE=production.
+
+Each worker sends 80% reads (accounts list, category balances) and 20%
+transaction creates for its own user for a fixed duration.
+"""
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+WORKERS = 4
+SECONDS = 5
+USERS = WORKERS
+
+
+def worker(db_path, user_id, result_queue):
+    from benchmarks.common import setup_django
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connections
+    from rest_framework.test import APIClient
+    from budget.models import Account, Category
+
+    connections['default'].settings_dict['NAME'] = db_path
+    user = User.objects.get(pk=user_id)
+    account = Account.objects.filter(user=user).first()
+    category = Category.objects.filter(user=user).first()
+    client = APIClient()
+    client.force_authenticate(user)
+
+    reads = writes = errors = 0
+    rng = random.Random(user_id)
+    deadline = time.perf_counter() + SECONDS
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < 0.2:
+                response = client.post('/api/transactions/', {
+                    'account': account.id, 'category': category.id,
+                    'transaction_type': 'expense', 'amount': '1.00',
+                }, format='json')
+                writes += response.status_code == 201
+            else:
+                path = '/api/accounts/' if rng.random() < 0.5 else '/api/categories/balances/'
+                response = client.get(path)
+                reads += response.status_code == 200
+        except Exception:
+            errors += 1
+    result_queue.put((reads, writes, errors))
+
+
+def seed(db_path):
+    from benchmarks.common import create_test_db, make_user, setup_django
+    setup_django()
+    from django.db import connections
+    from budget.models import Account, BudgetAllocation, Category
+
+    create_test_db(db_path)
+    user_ids = []
+    for i in range(USERS):
+        user = make_user(f'bench{i}')
+        account = Account.objects.create(user=user, name='Checking', balance=100000)
+        for name in ['Rent', 'Groceries', 'Fun']:
+            category = Category.objects.create(user=user, name=name)
+            BudgetAllocation.objects.create(account=account, category=category, amount=1000)
+        user_ids.append(user.id)
+    connections.close_all()
+    return user_ids
+
+
+def run_profile(profile):
+    os.environ['DJANGO_SQLITE_PROFILE'] = profile
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / 'bench.sqlite3')
+        with ctx.Pool(1) as pool:
+            user_ids = pool.apply(seed, (db_path,))
+        results = ctx.Queue()
+        procs = [ctx.Process(target=worker, args=(db_path, uid, results)) for uid in user_ids]
+        for proc in procs:
+            proc.start()
+        totals = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+    reads, writes, errors = (sum(column) for column in zip(*totals))
+    print(f"{profile:<12} {WORKERS} workers: {reads / SECONDS:>8.1f} reads/s  "
+          f"{writes / SECONDS:>8.1f} writes/s  {errors} errors")
+
+
+if __name__ == '__main__':
+    for profile in ['default', 'production']:
+        run_profile(profile)
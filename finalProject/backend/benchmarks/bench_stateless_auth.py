@@ -0,0 +1,46 @@
+"""
+Requests/second on GET /api/accounts/ with JWTAuthentication (loads the User
+row on every request) versus JWTStatelessUserAuthentication + LazyTokenUser.
+"""
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, report, run_for, setup_django
+
+setup_django()
+
+from rest_framework.test import APIClient  # noqa: E402
+from rest_framework_simplejwt.authentication import (  # noqa: E402
+    JWTAuthentication, JWTStatelessUserAuthentication,
+)
+
+from budget.authentication import tokens_for_user  # noqa: E402
+from budget.models import Account  # noqa: E402
+from budget.views import AccountViewSet  # noqa: E402
+
+ITERATIONS = 2000
+
+
+def main():
+    create_test_db()
+    user = make_user()
+    for i in range(5):
+        Account.objects.create(user=user, name=f'Account {i}', balance=Decimal('100.00'))
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user)['access']}")
+
+    def request():
+        response = client.get('/api/accounts/')
+        assert response.status_code == 200, response.status_code
+
+    for label, auth_class in [
+        ('JWTAuthentication (User row per request)', JWTAuthentication),
+        ('JWTStatelessUserAuthentication', JWTStatelessUserAuthentication),
+    ]:
+        AccountViewSet.authentication_classes = [auth_class]
+        run_for(request, 100)
+        report(label, ITERATIONS, run_for(request, ITERATIONS))
+
+
+if __name__ == '__main__':
+    main()
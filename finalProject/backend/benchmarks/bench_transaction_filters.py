@@ -0,0 +1,109 @@
+"""
+Response time of filtered GET /api/transactions/ on a 1M-row transactions
+table: ten users with 100,000 transactions each over four years, 30
+categories and 3 accounts apiece. Pass a smaller total row count as the
+first argument for a quicker run.
+
+Each filter is timed through the API, and its SQLite query plan is printed,
+so a filter that falls back to a table scan shows up.
+"""
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from benchmarks.common import create_test_db, make_user, setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from budget.filters import transaction_lookups  # noqa: E402
+from budget.models import Account, Category, Transaction  # noqa: E402
+
+USERS = 10
+CATEGORIES = 30
+ACCOUNTS = 3
+DAYS = 4 * 365
+ITERATIONS = 20
+
+
+def seed(rows):
+    date_field = Transaction._meta.get_field('date')
+    date_field.auto_now_add = False
+    now = timezone.now()
+    try:
+        users = []
+        for u in range(USERS):
+            user = make_user(f'bench{u}')
+            accounts = [Account.objects.create(user=user, name=f'Account {i}') for i in range(ACCOUNTS)]
+            categories = [Category.objects.create(user=user, name=f'Category {i}') for i in range(CATEGORIES)]
+            per_user = rows // USERS
+            Transaction.objects.bulk_create((
+                Transaction(
+                    user=user, account=accounts[i % ACCOUNTS], category=categories[i % CATEGORIES],
+                    transaction_type='income' if i % 25 == 0 else 'expense',
+                    amount=Decimal(i * 7 % 50000) / 100, date=now - timedelta(minutes=i * DAYS * 1440 // per_user),
+                )
+                for i in range(per_user)
+            ), batch_size=5000)
+            users.append((user, accounts, categories))
+        return users
+    finally:
+        date_field.auto_now_add = True
+
+
+def timed(func):
+    best = float('inf')
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    create_test_db()
+    user, accounts, categories = seed(rows)[USERS // 2]
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    print(f"{Transaction.objects.count():,} transactions")
+
+    today = timezone.localdate()
+    week_ago = (today - timedelta(days=7)).isoformat()
+    year_ago = (today - timedelta(days=365)).isoformat()
+    queries = {
+        'last week': {'date_from': week_ago},
+        'income, last year': {'transaction_type': 'income', 'date_from': year_ago},
+        'category, last year': {'category': categories[3].id, 'date_from': year_ago},
+        'account + category, week': {'account': accounts[1].id, 'category': categories[4].id, 'date_from': week_ago},
+        'amount 499-500': {'amount_min': '499', 'amount_max': '500'},
+        'expense, 250-251, year': {
+            'transaction_type': 'expense', 'amount_min': '250', 'amount_max': '251', 'date_from': year_ago,
+        },
+    }
+
+    client = APIClient()
+    client.force_authenticate(user)
+    print(f"{'filter':<28} {'rows':>7} {'ms/request':>11}  plan")
+    for label, params in queries.items():
+        resp = client.get('/api/transactions/', params)
+        assert resp.status_code == 200, resp.data
+        seconds = timed(lambda: client.get('/api/transactions/', params))
+        plan = Transaction.objects.for_user(user.id).filter(**transaction_lookups(
+            {key: str(value) for key, value in params.items()}
+        )).explain()
+        plan = next(line for line in plan.splitlines() if 'budget_transaction' in line).split(' ', 3)[-1]
+        print(f"{label:<28} {len(resp.data):>7,} {seconds * 1000:>11.2f}  {plan}")
+
+    start = time.perf_counter()
+    for _ in range(100_000):
+        transaction_lookups({'transaction_type': 'expense', 'date_from': year_ago, 'amount_min': '10'})
+    print(f"parse 3 filters: {(time.perf_counter() - start) * 10:.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
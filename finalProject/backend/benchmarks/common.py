@@ -0,0 +1,48 @@
+"""
+Shared setup for the benchmark scripts.
+
+Run a benchmark from the backend directory, e.g.
+`python -m benchmarks.bench_stateless_auth`. Each script works against a
+throwaway test database, never against db.sqlite3.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'budgetapp.settings')
+    import django
+    django.setup()
+
+
+def create_test_db(name=None):
+    """Create and migrate the test database; pass a file path to share it across processes."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    if name is not None:
+        connection.settings_dict['TEST']['NAME'] = str(name)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def make_user(username='bench', password='bench-pass-123'):
+    from django.contrib.auth.models import User
+    return User.objects.create_user(username=username, email=f'{username}@bench.test', password=password)
+
+
+def run_for(func, iterations):
+    """Call func `iterations` times and return elapsed seconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return time.perf_counter() - start
+
+
+def report(label, count, seconds, unit='req/s'):
+    print(f"{label:<45} {count / seconds:>12,.1f} {unit}  ({seconds * 1000:,.1f} ms total)")
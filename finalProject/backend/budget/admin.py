@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Account, Category, BudgetAllocation, Transaction
+from .models import Account, Category, BudgetAllocation, CategorizationRule, Job, RecurringTransaction, Transaction
+from .search import matching
 
 
 @admin.register(Account)
@@ -26,4 +27,33 @@ class BudgetAllocationAdmin(admin.ModelAdmin):
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['user', 'transaction_type', 'amount', 'category', 'account', 'date']
     list_filter = ['transaction_type', 'user', 'category', 'date']
+    # Descriptions go through the full-text index (budget.search) instead of an
+    # icontains scan, matching word prefixes so a partly typed word still finds.
+    search_fields = ['user__username']
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= matching(queryset, search_term, prefix=True)
+        return results, may_have_duplicates
+
+
+@admin.register(CategorizationRule)
+class CategorizationRuleAdmin(admin.ModelAdmin):
+    list_display = ['pattern', 'match_type', 'category', 'user', 'priority']
+    list_filter = ['match_type', 'user']
+    search_fields = ['pattern', 'user__username']
+
+
+@admin.register(RecurringTransaction)
+class RecurringTransactionAdmin(admin.ModelAdmin):
+    list_display = ['description', 'transaction_type', 'amount', 'frequency', 'interval', 'next_run', 'active', 'user']
+    list_filter = ['transaction_type', 'frequency', 'active', 'user']
     search_fields = ['description', 'user__username']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'status', 'user', 'priority', 'attempts', 'progress', 'total', 'created_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'user__username']
@@ -4,3 +4,41 @@ from django.apps import AppConfig
 class BudgetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'budget'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_migrate, post_save
+        from .categorization import rules_changed
+        from .events import account_saved
+        from .search import install as install_search
+        from .sharding import seed_shard_sequences
+
+        post_migrate.connect(seed_shard_sequences, sender=self)
+        post_migrate.connect(install_search, sender=self)
+        rule = self.get_model('CategorizationRule')
+        post_save.connect(rules_changed, sender=rule)
+        post_delete.connect(rules_changed, sender=rule)
+        post_save.connect(account_saved, sender=self.get_model('Account'))
+
+
+def warm_up():
+    """
+    Build the lazily-created singletons at boot instead of on the first request
+    each worker serves: the URLconf (which imports every view, serializer and
+    DRF module), the password validators and the password hasher. With a
+    preloading server (gunicorn --preload) forked workers share the result.
+
+    Called from the WSGI and ASGI entry points, so only server processes pay
+    for it; migrate and the other management commands don't.
+    """
+    from django.contrib.auth.hashers import get_hasher
+    from django.contrib.auth.password_validation import (
+        CommonPasswordValidator, get_default_password_validators,
+    )
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+
+    for validator in get_default_password_validators():
+        if isinstance(validator, CommonPasswordValidator):
+            validator.passwords = frozenset(validator.passwords)
+    get_hasher()
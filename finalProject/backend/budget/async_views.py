@@ -0,0 +1,161 @@
+"""
+Async-native endpoints, served without a worker thread under ASGI.
+
+These are plain Django views rather than DRF views, which are sync-only, and
+return the same payloads as their DRF counterparts in views.py.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models import Sum
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from . import checkpoints
+from .authentication import averify_credentials, tokens_for_user
+from .models import Account, BudgetAllocation, Category, Transaction
+from .routers import pin_to_primary, recently_wrote, record_write, unpin
+from .serializers import AccountSerializer, RegisterSerializer, UserSerializer
+from .sharding import ashard_for_user
+
+
+def _authenticate(request):
+    """
+    Set `request.user` from the Bearer token; return an error response if it
+    is missing or invalid. Always stateless, so it never queries the database.
+    """
+    try:
+        result = JWTStatelessUserAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed) as exc:
+        detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+        return JsonResponse(detail, encoder=JSONEncoder, status=exc.status_code)
+    if result is None:
+        return JsonResponse({'detail': NotAuthenticated.default_detail}, encoder=JSONEncoder, status=401)
+    request.user = result[0]
+    return None
+
+
+def _read_view(view):
+    """
+    Authenticate a GET endpoint and apply the same primary pinning as
+    PrimaryAfterWriteMixin for users with a recent write.
+    """
+    async def wrapper(request, *args, **kwargs):
+        error = _authenticate(request)
+        if error is not None:
+            return error
+        token = pin_to_primary(recently_wrote(request.user.id))
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            unpin(token)
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return require_GET(wrapper)
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    """LoginView with the password check awaited on the hashing pool."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    user = await averify_credentials(data.get('username'), data.get('password'), request)
+    if user is None:
+        return JsonResponse({'error': 'Invalid credentials'}, status=401)
+    record_write(user.id)
+    return JsonResponse({
+        'user': UserSerializer(user).data,
+        'tokens': tokens_for_user(user),
+    })
+
+
+@csrf_exempt
+@require_POST
+async def register(request):
+    """RegisterView with the password hash awaited on the hashing pool."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    serializer = RegisterSerializer(data=data)
+    # Validation queries for taken usernames and emails.
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, encoder=JSONEncoder, status=400)
+    try:
+        user = await serializer.acreate(serializer.validated_data)
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, encoder=JSONEncoder, status=400)
+    record_write(user.id)
+    return JsonResponse({
+        'user': UserSerializer(user).data,
+        'tokens': tokens_for_user(user),
+    }, status=201)
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+@_read_view
+async def account_list(request):
+    """GET /accounts/ on the async ORM."""
+    shard = await ashard_for_user(request.user.id)
+    accounts = await _alist(Account.objects.for_user(request.user.id, shard))
+    data = AccountSerializer(accounts, many=True, context={'request': request}).data
+    return JsonResponse(data, encoder=JSONEncoder, safe=False)
+
+
+async def _totals_by_category(queryset):
+    totals = queryset.values('category').annotate(total=Sum('amount')).order_by()
+    return {row['category']: row['total'] async for row in totals}
+
+
+@_read_view
+async def category_balances(request):
+    """
+    GET /categories/balances/. Once the latest checkpoint's period_end is
+    read, the categories, that checkpoint and both sets of totals since it are
+    awaited together, and the totals come grouped
+    by category rather than as two queries per category.
+    """
+    user_id = request.user.id
+    shard = await ashard_for_user(user_id)
+    end = await checkpoints.alatest_end(user_id, shard)
+    categories, allocated, spent, frozen = await asyncio.gather(
+        _alist(Category.objects.for_user(user_id, shard)),
+        _totals_by_category(checkpoints.since_checkpoint(
+            BudgetAllocation.objects.on_user_shard(user_id, shard).filter(category__user_id=user_id),
+            'allocated_at', end,
+        )),
+        _totals_by_category(checkpoints.since_checkpoint(
+            Transaction.objects.on_user_shard(user_id, shard).filter(category__user_id=user_id,
+                                                                     transaction_type='expense'),
+            'date', end,
+        )),
+        _alist(checkpoints.latest(user_id, end, shard).values('category', 'allocated', 'spent')),
+    )
+    frozen = {row['category']: row for row in frozen}
+    balances = []
+    for category in categories:
+        closed = frozen.get(category.id, {})
+        category_allocated = (allocated.get(category.id) or 0) + closed.get('allocated', 0)
+        category_spent = (spent.get(category.id) or 0) + closed.get('spent', 0)
+        balances.append({
+            'category_id': category.id,
+            'category_name': category.name,
+            'allocated': str(category_allocated),
+            'spent': str(category_spent),
+            'available': str(category_allocated - category_spent),
+        })
+    return JsonResponse(balances, safe=False)
@@ -0,0 +1,123 @@
+"""
+The one-time account balance rebuild: allocations used to be taken out of
+account balances, and no longer are, so each account existing from before
+that change gets the sum of its allocations added back. Accounts created
+since (see `cutover`) were never short of their allocations and are left
+alone.
+
+Users are taken in ranges of consecutive ids. For each range and ledger
+database, one grouped query sums the allocations of the accounts not yet
+rebuilt, an AccountBalanceRebuild row records each account's sum, and
+batched UPDATEs add the recorded sums to the balances in the database (as
+increments, so concurrent writes to a balance are kept), and each balance
+moved gets a ledger event (budget.events), all in one transaction. The
+markers make a rebuild idempotent, and they are its checkpoint: rerunning it
+after an interruption picks up the accounts still unmarked.
+
+`verify` recounts a range's rebuilt accounts: each marker should hold the
+sum of the allocations made up to its rebuild.
+"""
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import F, OuterRef, Subquery, Sum
+
+from . import events
+from .models import Account, AccountBalanceRebuild, BudgetAllocation
+from .sharding import shard_for_user
+
+ZERO = Decimal('0')
+
+# Applied when the rebuild was introduced, with the allocation logic it corrects already in place.
+CUTOVER_MIGRATION = ('budget', '0009_account_balance_rebuilds')
+
+
+def _by_shard(user_ids):
+    shards = {}
+    for user_id in user_ids:
+        shards.setdefault(shard_for_user(user_id), []).append(user_id)
+    return shards.items()
+
+
+def cutover():
+    """
+    When the default database got CUTOVER_MIGRATION; None if it never did.
+    Taken from the default database for every shard, since accounts keep
+    their created_at when moved between shards.
+    """
+    app, name = CUTOVER_MIGRATION
+    recorded = MigrationRecorder(connections[DEFAULT_DB_ALIAS]).migration_qs.filter(app=app, name=name)
+    return recorded.values_list('applied', flat=True).first()
+
+
+def _pre_cutover(using, users, cutoff):
+    """These users' accounts on `using` created before `cutoff`, the only ones a rebuild touches."""
+    accounts = Account.objects.using(using).filter(user_id__in=users)
+    return accounts.filter(created_at__lt=cutoff) if cutoff else accounts.none()
+
+
+def _allocation_totals(allocations):
+    return dict(allocations.values('account').annotate(total=Sum('amount')).order_by().values_list('account', 'total'))
+
+
+def rebuild(user_ids, batch_size=1000, dry_run=False):
+    """
+    Add back the allocations of these users' accounts not rebuilt yet.
+    Returns (accounts, amount added); with dry_run, what it would be, and
+    nothing is written.
+    """
+    rebuilt, added = 0, ZERO
+    cutoff = cutover()
+    for using, users in _by_shard(user_ids):
+        with transaction.atomic(using=using):
+            pending = _pre_cutover(using, users, cutoff).filter(balance_rebuild__isnull=True)
+            owners = dict(pending.values_list('id', 'user_id'))
+            account_ids = list(owners)
+            if not account_ids:
+                continue
+            totals = _allocation_totals(BudgetAllocation.objects.using(using).filter(account__in=account_ids))
+            rebuilt += len(account_ids)
+            added += sum(totals.values(), ZERO)
+            if dry_run:
+                continue
+            # A concurrent rebuild of the same account fails here and rolls this one back.
+            AccountBalanceRebuild.objects.using(using).bulk_create(
+                [AccountBalanceRebuild(account_id=account_id, added=totals.get(account_id, ZERO))
+                 for account_id in account_ids],
+                batch_size=batch_size,
+            )
+            added_by_marker = AccountBalanceRebuild.objects.using(using).filter(account=OuterRef('pk')).values('added')
+            for start in range(0, len(account_ids), batch_size):
+                # The opening balance moves too: this isn't drift (see budget.reconciliation).
+                Account.objects.using(using).filter(id__in=account_ids[start:start + batch_size]).update(
+                    balance=F('balance') + Subquery(added_by_marker),
+                    opening_balance=F('opening_balance') + Subquery(added_by_marker),
+                )
+            by_user = {}
+            for account_id, amount in totals.items():
+                by_user.setdefault(owners[account_id], {})[account_id] = amount
+            for user_id, amounts in by_user.items():
+                events.accounts_adjusted(user_id, amounts)
+    return rebuilt, added
+
+
+def verify(user_ids):
+    """
+    Check these users' accounts from before the cutover. Returns [(account
+    id, marked amount, recounted amount)] for each account whose marker
+    disagrees with its allocations up to the rebuild, with None as the marked
+    amount for accounts not rebuilt at all.
+    """
+    problems = []
+    cutoff = cutover()
+    for using, users in _by_shard(user_ids):
+        accounts = _pre_cutover(using, users, cutoff)
+        recounted = _allocation_totals(BudgetAllocation.objects.using(using).filter(
+            account__in=accounts, allocated_at__lte=F('account__balance_rebuild__rebuilt_at'),
+        ))
+        for account_id, marked in accounts.order_by('id').values_list('id', 'balance_rebuild__added'):
+            expected = recounted.get(account_id, ZERO)
+            if marked is None or marked != expected:
+                problems.append((account_id, marked, expected))
+    return problems
@@ -0,0 +1,68 @@
+"""
+Run several API calls inside one HTTP request (POST /api/batch/).
+
+Each sub-request is dispatched straight to its view, without the middleware
+stack, using the batch request's already-authenticated user and token. All of
+them run on the calling thread, so they share its database connections.
+Response bodies are returned as data and rendered once, with the batch.
+"""
+import io
+import json
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+from rest_framework.response import Response
+
+# Request headers a sub-request inherits from the batch request. Authorization
+# is only read by the async views, which authenticate statelessly.
+_INHERITED_META = (
+    'SERVER_NAME', 'SERVER_PORT', 'REMOTE_ADDR',
+    'HTTP_HOST', 'HTTP_ACCEPT_LANGUAGE', 'HTTP_AUTHORIZATION',
+)
+
+
+def build_subrequest(request, method, path, body=None):
+    """A WSGIRequest for `method path`, pre-authenticated as `request.user`."""
+    url = urlsplit(path)
+    payload = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in request.META.items() if key in _INHERITED_META
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': io.BytesIO(payload),
+        'wsgi.url_scheme': request.scheme,
+    })
+    subrequest = WSGIRequest(environ)
+    # DRF's Request skips its authenticators when these are set.
+    subrequest._force_auth_user = request.user
+    subrequest._force_auth_token = request.auth
+    return subrequest
+
+
+def dispatch(subrequest):
+    """Call the view for `subrequest`; return (status, data)."""
+    try:
+        match = resolve(subrequest.path_info)
+    except Resolver404:
+        return 404, {'detail': 'Not found.'}
+
+    view = match.func
+    if iscoroutinefunction(view):
+        view = async_to_sync(view)
+    response = view(subrequest, *match.args, **match.kwargs)
+
+    if isinstance(response, Response):
+        return response.status_code, response.data
+    content = getattr(response, 'content', b'')
+    try:
+        return response.status_code, json.loads(content) if content else None
+    except ValueError:
+        return response.status_code, content.decode(response.charset, 'replace')
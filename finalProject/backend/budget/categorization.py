@@ -0,0 +1,370 @@
+"""
+Auto-categorization: each user's CategorizationRule rows, compiled into one
+matcher that picks a category from a transaction's description.
+
+Rules are tried in order (lowest `priority`, then oldest), and the first one
+that matches wins. Matching ignores case. A `contains` rule matches when its
+pattern appears anywhere in the description, a `regex` rule when `re.search`
+finds it. Regexes that could backtrack for exponential time are refused when
+the rule is saved (`regex_problem`).
+
+All rules share one Aho-Corasick automaton, so a description is read once
+whatever the number of rules. It holds each `contains` pattern, and for each
+`regex` rule a piece of text every match must contain; a regex only runs when
+its text turned up, and only if it comes before the best `contains` rule.
+
+The compiled matcher is kept per process. A version token in the default
+cache, replaced whenever a user's rules change, tells every worker to
+recompile. As with budget.routers, the cache must be shared between workers
+for that to hold across processes.
+
+New transactions without a category are categorized when they are created
+(TransactionSerializer). `categorize_uncategorized` and
+`manage.py categorize_transactions` do the same for existing ones;
+`rules/apply/` queues it as a job (`categorize_job`, see budget.jobs).
+"""
+import re
+import uuid
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+from collections import OrderedDict, deque
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from . import checkpoints, events, jobs, rollups
+from .models import CategorizationRule, Category, Transaction
+from .sharding import ledger_atomic
+
+CACHED_MATCHERS = 1024
+
+NO_RULE = float('inf')
+
+_matchers = OrderedDict()
+_matchers_lock = Lock()
+
+
+def _version_key(user_id):
+    return f'budget:categorization-rules:{user_id}'
+
+
+def invalidate(user_id):
+    """Make every worker recompile the user's rules on next use."""
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def _version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_version_key(user_id), version, None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, 'POSSESSIVE_REPEAT', None)}
+
+
+def _parts(op, av):
+    """The subpatterns nested in one parsed regex item."""
+    if op in _REPEATS:
+        return [av[2]]
+    if op is sre_constants.SUBPATTERN:
+        return [av[3]]
+    if op is sre_constants.BRANCH:
+        return av[1]
+    if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [av[1]]
+    if op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+        return [av]
+    return []
+
+
+def _backtracks(items, repeated):
+    """Whether `items`, repeated or not, can be matched in exponentially many ways."""
+    for op, av in items:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return "Backreferences aren't allowed."
+        varies = (op in _REPEATS and av[0] != av[1]) or op is sre_constants.BRANCH
+        if repeated and varies:
+            return (
+                "Repeating a group that contains a quantifier or an alternation, as in (a+)+ or (a|b)*, "
+                "can make matching take exponential time, so it isn't allowed."
+            )
+        for part in _parts(op, av):
+            problem = _backtracks(part, repeated or (op in _REPEATS and av[1] > 1))
+            if problem:
+                return problem
+    return None
+
+
+def regex_problem(pattern):
+    """
+    Why the user's regex `pattern` is refused, or None. re has no time limit,
+    so patterns that can backtrack exponentially (nested quantifiers,
+    repeated alternations) and backreferences are refused outright.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as exc:
+        return f"Invalid regular expression: {exc}"
+    return _backtracks(parsed, repeated=False)
+
+
+def required_text(pattern):
+    """
+    Casefolded ASCII text that every match of the regex `pattern` contains,
+    or '' when that can't be told from a simple reading of the pattern:
+    the longest run of plain characters outside groups, in a pattern with no
+    alternation.
+    """
+    if '|' in pattern or re.compile(pattern).flags & re.VERBOSE:
+        return ''
+    runs, run, depth, i = [], '', 0, 0
+    while i < len(pattern):
+        char = pattern[i]
+        literal = None
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if escaped in ('x', 'u', 'U', 'N') or escaped.isdigit():
+                return ''
+            if escaped and not escaped.isalnum():
+                literal = escaped
+            i += 2
+        elif char == '[':
+            i += 1
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif char in '*+?{':
+            # The character before is optional or repeated: keep it out.
+            run = run[:-1]
+            if char == '{' and '}' in pattern[i:]:
+                i = pattern.index('}', i)
+            i += 1
+        else:
+            depth += {'(': 1, ')': -1}.get(char, 0)
+            if char not in '().^$':
+                literal = char
+            i += 1
+        if literal is not None and depth == 0 and literal.isascii():
+            run += literal
+        else:
+            runs.append(run)
+            run = ''
+    runs.append(run)
+    return max(runs, key=len).casefold()
+
+
+class _Automaton:
+    """
+    Aho-Corasick over casefolded text. Reading a text reports the lowest
+    `contains` rule index found, and the regex rules whose required text was
+    found (see required_text).
+    """
+
+    def __init__(self, contains, gates):
+        goto = [{}]
+        first = [NO_RULE]
+        gated = [()]
+
+        def state_for(text):
+            state = 0
+            for char in text:
+                following = goto[state].get(char)
+                if following is None:
+                    following = len(goto)
+                    goto[state][char] = following
+                    goto.append({})
+                    first.append(NO_RULE)
+                    gated.append(())
+                state = following
+            return state
+
+        for index, text in contains:
+            state = state_for(text)
+            first[state] = min(first[state], index)
+        for index, text in gates:
+            state = state_for(text)
+            gated[state] += (index,)
+
+        # Complete the transitions breadth first, so each state's fallback
+        # (a shallower state) is finished before the state itself.
+        delta = [dict(edges) for edges in goto]
+        fallback = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            first[state] = min(first[state], first[fallback[state]])
+            gated[state] += gated[fallback[state]]
+            for char, following in goto[state].items():
+                fallback[following] = delta[fallback[state]].get(char, 0)
+                queue.append(following)
+            for char, following in delta[fallback[state]].items():
+                delta[state].setdefault(char, following)
+        for edges in delta:
+            # re.IGNORECASE matches the dotless i to i, casefold() doesn't.
+            if 'i' in edges:
+                edges['\u0131'] = edges['i']
+
+        self.delta = delta
+        # One lookup per character: None where nothing ends.
+        self.found = [
+            (first[state], gated[state]) if first[state] != NO_RULE or gated[state] else None
+            for state in range(len(goto))
+        ]
+
+    def read(self, text):
+        delta, found = self.delta, self.found
+        state, best, gates = 0, NO_RULE, set()
+        for char in text:
+            state = delta[state].get(char, 0)
+            hit = found[state]
+            if hit is not None:
+                if hit[0] < best:
+                    best = hit[0]
+                gates.update(hit[1])
+        return best, gates
+
+
+class Matcher:
+    """A user's rules, compiled. `category_for(description)` returns a category id or None."""
+
+    def __init__(self, rules):
+        self.categories = [category_id for _, _, category_id in rules]
+        contains, gates = [], []
+        # (index, search, gated) for the regex rules, in order.
+        self.regexes = []
+        for index, (pattern, match_type, _) in enumerate(rules):
+            if match_type == CategorizationRule.REGEX:
+                if regex_problem(pattern):
+                    # Saved before patterns were checked; never run it.
+                    continue
+                text = required_text(pattern)
+                if text:
+                    gates.append((index, text))
+                self.regexes.append((index, re.compile(pattern, re.IGNORECASE).search, bool(text)))
+            else:
+                contains.append((index, pattern.casefold()))
+        self.automaton = _Automaton(contains, gates)
+
+    def __bool__(self):
+        return bool(self.categories)
+
+    def category_for(self, description):
+        if not description:
+            return None
+        best, gates = self.automaton.read(description.casefold())
+        for index, search, gated in self.regexes:
+            if index >= best:
+                break
+            if (not gated or index in gates) and search(description):
+                best = index
+                break
+        return None if best == NO_RULE else self.categories[best]
+
+
+def compile_rules(user_id):
+    rules = CategorizationRule.objects.for_user(user_id).order_by('priority', 'id')
+    return Matcher(list(rules.values_list('pattern', 'match_type', 'category_id')))
+
+
+def matcher_for(user_id):
+    """The user's compiled rules, recompiled only when they have changed."""
+    version = _version(user_id)
+    with _matchers_lock:
+        cached = _matchers.get(user_id)
+        if cached is not None and cached[0] == version:
+            _matchers.move_to_end(user_id)
+            return cached[1]
+    matcher = compile_rules(user_id)
+    with _matchers_lock:
+        _matchers[user_id] = (version, matcher)
+        _matchers.move_to_end(user_id)
+        while len(_matchers) > CACHED_MATCHERS:
+            _matchers.popitem(last=False)
+    return matcher
+
+
+def category_for(user_id, description):
+    """The Category the user's rules give `description`, or None."""
+    category_id = matcher_for(user_id).category_for(description)
+    if category_id is None:
+        return None
+    return Category.objects.for_user(user_id).filter(pk=category_id).first()
+
+
+def categorize_uncategorized(user_id, batch_size=1000, progress=None):
+    """
+    Apply the user's rules to their transactions without a category; returns
+    how many were categorized. `progress(read, total)` is called after each
+    batch.
+    """
+    matcher = matcher_for(user_id)
+    if not matcher:
+        return 0
+    uncategorized = Transaction.objects.for_user(user_id).filter(category__isnull=True).exclude(description='')
+    total = uncategorized.count() if progress else None
+    categorized = 0
+    read = 0
+    last = 0
+    # Paged by id rather than iterated with a cursor: the updates take rows
+    # out of the set being read.
+    while True:
+        batch = list(
+            uncategorized.filter(pk__gt=last).order_by('pk').values_list('pk', 'description', 'date')[:batch_size]
+        )
+        if not batch:
+            return categorized
+        if progress:
+            read += len(batch)
+            progress(read, total)
+        last = batch[-1][0]
+        matched = {}
+        earliest = None
+        for pk, description, date in batch:
+            category_id = matcher.category_for(description)
+            if category_id is not None:
+                matched[pk] = category_id
+                earliest = date if earliest is None else min(earliest, date)
+        if not matched:
+            continue
+        with ledger_atomic(user_id):
+            # Still uncategorized: a concurrent edit may have set one since.
+            transactions = Transaction.objects.for_user(user_id)
+            ids = list(transactions.filter(pk__in=matched, category__isnull=True).values_list('pk', flat=True))
+            if not ids:
+                continue
+            by_category = {}
+            for pk in ids:
+                by_category.setdefault(matched[pk], []).append(pk)
+            moving = transactions.filter(pk__in=ids)
+            moving.update(category_id=Case(
+                *(When(pk__in=pks, then=Value(category_id)) for category_id, pks in by_category.items())
+            ))
+            rollups.categorized(user_id, moving)
+            events.transactions_categorized(user_id, moving)
+            checkpoints.invalidate(user_id, earliest)
+            categorized += len(ids)
+
+
+def categorize_job(job, user_id):
+    """The job `rules/apply/` queues: categorize_uncategorized, reporting its progress."""
+    categorized = categorize_uncategorized(user_id, progress=lambda read, total: jobs.report(job, read, total))
+    return {'categorized': categorized}
+
+
+def rules_changed(sender, instance, **kwargs):
+    """post_save / post_delete hook for CategorizationRule (see BudgetConfig.ready)."""
+    # After commit, so no worker recompiles the old rules under the new version.
+    transaction.on_commit(lambda: invalidate(instance.user_id), using=instance._state.db)
+
@@ -0,0 +1,142 @@
+"""
+Ledger checkpoints: each user's allocated and spent totals per category,
+frozen as of a month end (LedgerCheckpoint).
+
+The ledger totals (budget.ledger) read the user's latest checkpoint and add
+only the allocations and expenses dated on or after its period_end, through
+the date indexes, instead of summing everything since the beginning.
+`manage.py close_ledger_period` writes the checkpoints, each one from the
+user's previous checkpoint plus the month's rows, and with --verify recounts
+the latest ones from scratch.
+
+A checkpoint holds only while the rows dated before its period_end stay as
+they are. Writes that change or remove such rows (editing or deleting an old
+transaction or allocation, deleting an account or category, categorizing old
+transactions) call `invalidate`, which drops the user's checkpoints from that
+point on; the next close writes them again. Changes made outside the API
+(the admin, raw SQL) are not tracked; --verify finds them.
+"""
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import BudgetAllocation, LedgerCheckpoint, Transaction
+from .rollups import add_months, month_of
+from .sharding import ledger_atomic
+
+ZERO = Decimal('0')
+
+# Stands in for "no checkpoint yet": every row is dated after it.
+BEGINNING = datetime(1, 1, 2, tzinfo=dt_timezone.utc)
+
+
+def period_end(month):
+    """Start of the month after `month` in the current time zone: the end of the period it closes."""
+    return timezone.make_aware(datetime.combine(add_months(month, 1), time.min))
+
+
+def last_closed_month():
+    """The month before the current one, the latest that can be closed."""
+    return add_months(month_of(timezone.now()), -1)
+
+
+def latest_end(user_id, shard=None):
+    """period_end of the user's latest checkpoint, or BEGINNING when they have none."""
+    checkpoints = LedgerCheckpoint.objects.for_user(user_id, shard).order_by('-period_end')
+    return checkpoints.values_list('period_end', flat=True).first() or BEGINNING
+
+
+async def alatest_end(user_id, shard):
+    """latest_end for async views, which resolve the `shard` first."""
+    checkpoints = LedgerCheckpoint.objects.for_user(user_id, shard).order_by('-period_end')
+    return await checkpoints.values_list('period_end', flat=True).afirst() or BEGINNING
+
+
+def since_checkpoint(queryset, date_field, end):
+    """
+    `queryset` narrowed to rows dated on or after the checkpoint at `end`
+    (from `latest_end`, read once per report so every query in it agrees on
+    the checkpoint even when the ledger is closed meanwhile).
+    """
+    return queryset.filter(**{f'{date_field}__gte': end})
+
+
+def latest(user_id, end, shard=None):
+    """The user's checkpoint rows at `end` (from `latest_end`); none without a query before the first."""
+    if end == BEGINNING:
+        return LedgerCheckpoint.objects.none()
+    return LedgerCheckpoint.objects.for_user(user_id, shard).filter(period_end=end)
+
+
+def _add(totals, rows, column):
+    for row in rows.values('category').annotate(total=Sum('amount')).order_by():
+        totals.setdefault(row['category'], [ZERO, ZERO])[column] += row['total']
+
+
+def _totals(user_id, start, end, base=None):
+    """{category: [allocated, spent]}: `base` plus the rows dated in [start, end)."""
+    totals = {category: list(amounts) for category, amounts in (base or {}).items()}
+    allocations = BudgetAllocation.objects.for_user(user_id).filter(allocated_at__lt=end)
+    expenses = Transaction.objects.for_user(user_id).filter(transaction_type='expense', date__lt=end)
+    if start is not None:
+        allocations = allocations.filter(allocated_at__gte=start)
+        expenses = expenses.filter(date__gte=start)
+    _add(totals, allocations, 0)
+    _add(totals, expenses, 1)
+    return totals
+
+
+def _stored(rows):
+    return {row.category_id: [row.allocated, row.spent] for row in rows}
+
+
+def close(user_id, end):
+    """
+    Write the user's checkpoint at `end` from their latest earlier one plus
+    the rows since. Returns how many rows were written, or None when the
+    ledger is already closed through `end` or later.
+    """
+    checkpoints = LedgerCheckpoint.objects.for_user(user_id)
+    with ledger_atomic(user_id):
+        if checkpoints.filter(period_end__gte=end).exists():
+            return None
+        previous = checkpoints.filter(period_end__lt=end).order_by('-period_end').first()
+        if previous is None:
+            totals = _totals(user_id, None, end)
+        else:
+            base = _stored(checkpoints.filter(period_end=previous.period_end))
+            totals = _totals(user_id, previous.period_end, end, base)
+        LedgerCheckpoint.objects.using(checkpoints.db).bulk_create(
+            LedgerCheckpoint(user_id=user_id, category_id=category, period_end=end, allocated=allocated, spent=spent)
+            for category, (allocated, spent) in totals.items()
+        )
+    return len(totals)
+
+
+def verify(user_id):
+    """
+    Recount the user's latest checkpoint from scratch. Returns
+    [(category, stored [allocated, spent], recounted)] for each category
+    that disagrees; empty when it holds or there is no checkpoint.
+    """
+    rows = list(latest(user_id, latest_end(user_id)))
+    if not rows:
+        return []
+    stored = _stored(rows)
+    recounted = _totals(user_id, None, rows[0].period_end)
+    missing = [ZERO, ZERO]
+    return [
+        (category, stored.get(category, missing), recounted.get(category, missing))
+        for category in sorted(stored.keys() | recounted.keys(), key=lambda c: (c is not None, c))
+        if stored.get(category, missing) != recounted.get(category, missing)
+    ]
+
+
+def invalidate(user_id, moment=None):
+    """Drop the user's checkpoints covering `moment` (all of them if None), after a change to rows dated then."""
+    checkpoints = LedgerCheckpoint.objects.for_user(user_id)
+    if moment is not None:
+        checkpoints = checkpoints.filter(period_end__gt=moment)
+    checkpoints.delete()
@@ -0,0 +1,339 @@
+"""
+The ledger event log (LedgerEvent): every change the API makes to a user's
+balances or category totals, appended in the same transaction as the write
+and never updated afterwards.
+
+An event is a posting against one account and category: how much it moves
+the account's balance, the category's allocations and its spending.
+Creating or deleting a transaction or allocation appends one event; editing
+one appends two, the first taking out the row as it was; moving money
+appends one per side. Each user's events are numbered 1, 2, ... from their
+LedgerStream row, which an append updates first: appends for one user queue
+behind each other, and once an event's number is visible every lower one is
+committed.
+
+Balances and category totals are projections of the log, the events summed
+per account and category. `replay` streams them from the user's
+LedgerSnapshot on, so it reads only the events appended since; `snapshot`
+writes a new one. Account.balance is the stored copy of the balance
+projection: `append` moves it by each event's amount in an UPDATE
+(balance = balance + x) instead of reading and saving the account.
+`manage.py rebuild_ledger_projections` replays the logs, sets drifted
+balances back and takes the snapshots. Category totals are still read
+through budget.checkpoints; --verify checks them against the projection.
+
+Rows that cascade away are left out of the projection instead of being
+cancelled by events: postings against a deleted account count for nothing,
+and spending in a deleted category counts as uncategorized, as its
+transactions become. Balances from before the log began are each user's
+first snapshot (migration 0011); accounts bulk-created or written with raw
+SQL since have no events, and show up as drift.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .ledger import LedgerTotals
+from .models import Account, Category, LedgerEvent, LedgerSnapshot, LedgerStream
+from .money import money
+from .sharding import shard_for_user
+
+ZERO = Decimal('0')
+
+# One event's amounts; the keys of a projection are (account, category).
+Posting = namedtuple('Posting', 'account category balance allocated spent')
+
+Projection = namedtuple('Projection', 'sequence balances categories')
+
+
+def _ledger(model, user_id):
+    """The user's rows of `model` on the database their ledger is written to (never a replica)."""
+    return model.objects.using(shard_for_user(user_id)).filter(user_id=user_id)
+
+
+def transaction_posting(txn, sign=1):
+    amount = txn.amount * sign
+    signed = amount if txn.transaction_type == 'income' else -amount
+    spent = amount if txn.transaction_type == 'expense' else ZERO
+    return Posting(txn.account_id, txn.category_id, signed, ZERO, spent)
+
+
+def allocation_posting(allocation, sign=1):
+    return Posting(allocation.account_id, allocation.category_id, ZERO, allocation.amount * sign, ZERO)
+
+
+def _advance(using, user_id, count):
+    """Move the user's stream on by `count`; their new version, or None without a stream row yet."""
+    connection = connections[using]
+    if not connection.features.can_return_columns_from_insert:
+        streams = LedgerStream.objects.using(using).filter(user_id=user_id)
+        if not streams.update(version=F('version') + count):
+            return None
+        return streams.values_list('version', flat=True).get()
+    # Backends that return columns from an INSERT (PostgreSQL, SQLite 3.35+)
+    # do from an UPDATE too: one statement instead of two.
+    table = connection.ops.quote_name(LedgerStream._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET version = version + %s WHERE user_id = %s RETURNING version', [count, user_id],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _reserve(user_id, count):
+    """The user's next `count` event numbers. Their stream row stays locked until the transaction ends."""
+    using = shard_for_user(user_id)
+    version = _advance(using, user_id, count)
+    if version is None:
+        try:
+            with transaction.atomic(using=using):
+                LedgerStream.objects.using(using).create(user_id=user_id, version=count)
+            version = count
+        except IntegrityError:
+            # Another request created it first.
+            version = _advance(using, user_id, count)
+    return range(version - count + 1, version + 1)
+
+
+def append(user_id, events, move_balances=True, batch_size=1000):
+    """
+    Append `events`, [(kind, object id, Posting)], to the user's log, and
+    unless `move_balances` is False (the caller has written the balance
+    already), add their amounts to the stored balances.
+    """
+    if not events:
+        return
+    using = shard_for_user(user_id)
+    # No savepoint: nothing here is worth keeping if a statement fails.
+    with transaction.atomic(using=using, savepoint=False):
+        sequences = _reserve(user_id, len(events))
+        LedgerEvent.objects.using(using).bulk_create([
+            LedgerEvent(
+                user_id=user_id, sequence=sequence, kind=kind, object_id=object_id,
+                account_id=posting.account, category_id=posting.category,
+                balance=posting.balance, allocated=posting.allocated, spent=posting.spent,
+            )
+            for sequence, (kind, object_id, posting) in zip(sequences, events)
+        ], batch_size=batch_size)
+        if not move_balances:
+            return
+        moved = {}
+        for _, _, posting in events:
+            moved[posting.account] = moved.get(posting.account, ZERO) + posting.balance
+        now = timezone.now()
+        for account_id, amount in moved.items():
+            if amount:
+                Account.objects.using(using).filter(pk=account_id).update(
+                    balance=F('balance') + money(amount), updated_at=now,
+                )
+
+
+def transaction_created(txn):
+    append(txn.user_id, [(LedgerEvent.TRANSACTION_CREATED, txn.pk, transaction_posting(txn))])
+
+
+def transaction_updated(before, after):
+    append(after.user_id, [
+        (LedgerEvent.TRANSACTION_UPDATED, after.pk, transaction_posting(before, sign=-1)),
+        (LedgerEvent.TRANSACTION_UPDATED, after.pk, transaction_posting(after)),
+    ])
+
+
+def transaction_deleted(txn):
+    append(txn.user_id, [(LedgerEvent.TRANSACTION_DELETED, txn.pk, transaction_posting(txn, sign=-1))])
+
+
+def transactions_categorized(user_id, transactions):
+    """`transactions` (a queryset) have just been moved out of uncategorized into their categories."""
+    events = []
+    for txn in transactions.only('id', 'account_id', 'category_id', 'transaction_type', 'amount'):
+        uncategorized = transaction_posting(txn, sign=-1)._replace(category=None)
+        events.append((LedgerEvent.TRANSACTION_UPDATED, txn.pk, uncategorized))
+        events.append((LedgerEvent.TRANSACTION_UPDATED, txn.pk, transaction_posting(txn)))
+    append(user_id, events)
+
+
+def allocation_created(user_id, allocation):
+    append(user_id, [(LedgerEvent.ALLOCATION_CREATED, allocation.pk, allocation_posting(allocation))])
+
+
+def money_moved(user_id, source, target):
+    """`source` and `target` are the two allocations moving money between categories makes."""
+    append(user_id, [
+        (LedgerEvent.ALLOCATION_MOVED, source.pk, allocation_posting(source)),
+        (LedgerEvent.ALLOCATION_MOVED, target.pk, allocation_posting(target)),
+    ])
+
+
+def allocation_updated(user_id, before, after):
+    append(user_id, [
+        (LedgerEvent.ALLOCATION_UPDATED, after.pk, allocation_posting(before, sign=-1)),
+        (LedgerEvent.ALLOCATION_UPDATED, after.pk, allocation_posting(after)),
+    ])
+
+
+def allocation_deleted(user_id, allocation):
+    append(user_id, [
+        (LedgerEvent.ALLOCATION_DELETED, allocation.pk, allocation_posting(allocation, sign=-1)),
+    ])
+
+
+def accounts_adjusted(user_id, amounts):
+    """The user's balances have just been set by hand or rebuilt, moving them by `amounts`, {account id: amount}."""
+    append(user_id, [
+        (LedgerEvent.ACCOUNT_ADJUSTED, account_id, Posting(account_id, None, amount, ZERO, ZERO))
+        for account_id, amount in amounts.items() if amount
+    ], move_balances=False)
+
+
+def account_saved(sender, instance, created, raw=False, **kwargs):
+    """post_save hook for Account (see BudgetConfig.ready): a new account's balance is its opening event."""
+    if created and not raw:
+        posting = Posting(instance.pk, None, instance.balance, ZERO, ZERO)
+        append(instance.user_id, [(LedgerEvent.ACCOUNT_OPENED, instance.pk, posting)], move_balances=False)
+
+
+def _add(pairs, account, category, balance, allocated, spent):
+    totals = pairs.get((account, category))
+    if totals is None:
+        pairs[(account, category)] = [balance, allocated, spent]
+    else:
+        totals[0] += balance
+        totals[1] += allocated
+        totals[2] += spent
+
+
+def replay(user_id, through=None, chunk_size=2000):
+    """
+    (sequence, {(account, category): [balance, allocated, spent]}): the
+    user's snapshot plus the events after it, streamed in order, up to
+    `through` if given. `sequence` is the last event included.
+    """
+    columns = ('sequence', 'account', 'category', 'balance', 'allocated', 'spent')
+    sequence, pairs = 0, {}
+    for sequence, *posting in _ledger(LedgerSnapshot, user_id).values_list(*columns):
+        _add(pairs, *posting)
+    tail = _ledger(LedgerEvent, user_id).filter(sequence__gt=sequence)
+    if through is not None:
+        tail = tail.filter(sequence__lte=through)
+    for sequence, *posting in tail.order_by('sequence').values_list(*columns).iterator(chunk_size=chunk_size):
+        _add(pairs, *posting)
+    return sequence, pairs
+
+
+def project(user_id, chunk_size=2000):
+    """
+    The user's Projection: the balance of each of their accounts and
+    [allocated, spent] per category (None for uncategorized).
+    """
+    sequence, pairs = replay(user_id, chunk_size=chunk_size)
+    accounts = set(_ledger(Account, user_id).values_list('id', flat=True))
+    categories = set(_ledger(Category, user_id).values_list('id', flat=True))
+    balances = dict.fromkeys(accounts, ZERO)
+    totals = {}
+    for (account, category), (balance, allocated, spent) in pairs.items():
+        if account not in accounts:
+            continue
+        balances[account] += balance
+        if category not in categories:
+            # Deleting a category deletes its allocations and uncategorizes its transactions.
+            category, allocated = None, ZERO
+        category_totals = totals.setdefault(category, [ZERO, ZERO])
+        category_totals[0] += allocated
+        category_totals[1] += spent
+    return Projection(sequence, balances, totals)
+
+
+def _lock_stream(user_id):
+    """The user's event count, with appends held off until the transaction ends."""
+    return _ledger(LedgerStream, user_id).select_for_update().values_list('version', flat=True).first() or 0
+
+
+def snapshot(user_id, chunk_size=2000):
+    """
+    Replace the user's snapshot with one at their latest event. Returns its
+    sequence, or None when there is nothing new since the last one.
+    """
+    using = shard_for_user(user_id)
+    with transaction.atomic(using=using):
+        through = _lock_stream(user_id)
+        snapshots = _ledger(LedgerSnapshot, user_id)
+        if not through or snapshots.filter(sequence__gte=through).exists():
+            return None
+        sequence, pairs = replay(user_id, through=through, chunk_size=chunk_size)
+        accounts = set(_ledger(Account, user_id).values_list('id', flat=True))
+        snapshots.delete()
+        LedgerSnapshot.objects.using(using).bulk_create([
+            LedgerSnapshot(
+                user_id=user_id, sequence=sequence, account_id=account, category_id=category,
+                balance=balance, allocated=allocated, spent=spent,
+            )
+            # Deleted accounts can't come back; their postings can go.
+            for (account, category), (balance, allocated, spent) in pairs.items() if account in accounts
+        ], batch_size=chunk_size)
+    return sequence
+
+
+def drifted(user_id, projection=None):
+    """[(account, stored balance, projected balance)] for the user's accounts that disagree with their log."""
+    projection = projection or project(user_id)
+    stored = _ledger(Account, user_id).values_list('id', 'balance')
+    return [
+        (account_id, balance, projection.balances[account_id])
+        for account_id, balance in stored.order_by('id')
+        if account_id in projection.balances and balance != projection.balances[account_id]
+    ]
+
+
+def correct(user_id):
+    """Set the user's drifted balances back to their projection, with appends held off; returns the drifts fixed."""
+    using = shard_for_user(user_id)
+    with transaction.atomic(using=using):
+        _lock_stream(user_id)
+        fixed = drifted(user_id)
+        for account_id, _, projected in fixed:
+            Account.objects.using(using).filter(pk=account_id).update(balance=projected)
+    return fixed
+
+
+def category_mismatches(user_id, projection):
+    """
+    [(category, [allocated, spent] as budget.ledger reads them, projected)]
+    for each of the user's categories where the two disagree.
+    """
+    totals = LedgerTotals(user_id)
+    read = {
+        category: [totals.allocated.get(category) or ZERO, totals.spent.get(category) or ZERO]
+        for category in totals.allocated.keys() | totals.spent.keys()
+    }
+    missing = [ZERO, ZERO]
+    return [
+        (category, read.get(category, missing), projection.categories.get(category, missing))
+        for category in sorted(read.keys() | projection.categories.keys(), key=lambda c: (c is not None, c))
+        if read.get(category, missing) != projection.categories.get(category, missing)
+    ]
+
+
+def rebuild(user_ids, verify=False, take_snapshots=False, chunk_size=2000):
+    """
+    Replay these users' logs. Returns (drifted balances [(user, account,
+    stored, projected)], category mismatches [(user, category, read,
+    projected)], snapshots written). Drifted balances are set back, unless
+    `verify`, which leaves them and checks the category totals as well.
+    """
+    balances, categories, snapshots = [], [], 0
+    for user_id in user_ids:
+        projection = project(user_id, chunk_size=chunk_size)
+        if verify:
+            balances += [(user_id, *drift) for drift in drifted(user_id, projection)]
+            categories += [(user_id, *mismatch) for mismatch in category_mismatches(user_id, projection)]
+        elif drifted(user_id, projection):
+            # Recounted under the lock, so appends made meanwhile aren't undone.
+            balances += [(user_id, *drift) for drift in correct(user_id)]
+        if take_snapshots and snapshot(user_id, chunk_size=chunk_size) is not None:
+            snapshots += 1
+    return balances, categories, snapshots
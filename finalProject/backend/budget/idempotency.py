@@ -0,0 +1,118 @@
+"""
+Idempotency keys for the writes flaky connections retry: creating a
+transaction or an allocation, and moving money.
+
+A client sends the same `Idempotency-Key` header with every attempt at one
+write. The first attempt runs as usual, and its response is stored under the
+user and key (IdempotencyKey) in the same transaction as the write, on the
+user's ledger database. Retries within IDEMPOTENCY_KEY_SECONDS get that
+response back, marked `Idempotent-Replayed: true`, without validating or
+writing anything again.
+
+The key row is inserted before the view runs, and its transaction stays open
+until the response is stored. A duplicate that arrives meanwhile waits on
+that insert (PostgreSQL on the unique index, SQLite on the write lock), then
+replays what the first attempt committed instead of running the write
+again. If the database gives up waiting first (SQLite's busy timeout), the
+duplicate gets a 409 and can retry later. Only successful responses are
+kept: a failed attempt rolls back with its key, and a retry runs afresh.
+Reusing a key for a different request (method, path or parsed body) gets a
+422.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.http import QueryDict
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .sharding import shard_for_user
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def _canonical(data):
+    # request.data rather than request.body, which is gone once a parser has
+    # read the stream. Sorted keys: the same payload hashes the same however
+    # the client ordered it.
+    if isinstance(data, QueryDict):
+        data = dict(data.lists())
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), default=str).encode()
+
+
+def fingerprint(request):
+    """SHA-256 of the request's method, path and parsed body."""
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), _canonical(request.data)):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def replay(stored, digest):
+    if stored.fingerprint != digest:
+        return Response(
+            {'error': f'{HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(stored.response, status=stored.status_code)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """Run a viewset method at most once per Idempotency-Key; retries get the stored response."""
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(view, request, *args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'error': f'{HEADER} must be 1 to 255 characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.user.id
+        using = shard_for_user(user_id)
+        keys = IdempotencyKey.objects.using(using).filter(user_id=user_id)
+        digest = fingerprint(request)
+        now = timezone.now()
+        record = None
+        try:
+            # A committed key always has its response: a plain read serves most retries.
+            stored = keys.filter(key=key, expires_at__gt=now).first()
+            if stored is not None:
+                return replay(stored, digest)
+            with transaction.atomic(using=using):
+                keys.filter(expires_at__lte=now).delete()
+                try:
+                    with transaction.atomic(using=using):
+                        record = IdempotencyKey.objects.using(using).create(
+                            user_id=user_id, key=key, fingerprint=digest,
+                            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_SECONDS),
+                        )
+                except IntegrityError:
+                    # Stored by the attempt we have just waited for.
+                    return replay(keys.get(key=key), digest)
+
+                response = view_method(view, request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    record.status_code = response.status_code
+                    record.response = response.data
+                    record.save(update_fields=['status_code', 'response'])
+                else:
+                    transaction.set_rollback(True, using=using)
+        except OperationalError:
+            if record is not None:
+                raise
+            # Timed out waiting for the lock another attempt holds ("database is locked").
+            return Response(
+                {'error': f'A request with this {HEADER} is in progress'}, status=status.HTTP_409_CONFLICT,
+            )
+        return response
+    return wrapper
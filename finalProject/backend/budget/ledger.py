@@ -0,0 +1,77 @@
+"""
+Ledger totals: how much has been allocated to and spent from each category,
+and how much is left to budget.
+
+Category balances, the dashboard, allocation validation and moving money all
+need the same sums. They come from here with one grouped query per table,
+instead of one aggregate per category for every caller. Each sum starts from
+the user's latest checkpoint (see budget.checkpoints) and only adds the rows
+dated after it.
+"""
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from . import checkpoints
+from .models import Account, BudgetAllocation, Transaction
+
+ZERO = Decimal('0')
+
+
+def _by_category(queryset):
+    rows = queryset.values('category').annotate(total=Sum('amount')).order_by()
+    return {row['category']: row['total'] for row in rows}
+
+
+def account_balance(user_id):
+    """Sum of the user's account balances."""
+    return Account.objects.for_user(user_id).aggregate(total=Sum('balance'))['total'] or ZERO
+
+
+class LedgerTotals:
+    """
+    Allocated and spent amounts per category for one user, optionally only
+    for `categories`. Spending without a category is kept under None.
+    """
+
+    def __init__(self, user_id, categories=None):
+        end = checkpoints.latest_end(user_id)
+        allocations = checkpoints.since_checkpoint(BudgetAllocation.objects.for_user(user_id), 'allocated_at', end)
+        expenses = checkpoints.since_checkpoint(
+            Transaction.objects.for_user(user_id).filter(transaction_type='expense'), 'date', end
+        )
+        frozen = checkpoints.latest(user_id, end)
+        if categories is not None:
+            allocations = allocations.filter(category__in=categories)
+            expenses = expenses.filter(category__in=categories)
+            frozen = frozen.filter(category__in=categories)
+        self.allocated = _by_category(allocations)
+        self.spent = _by_category(expenses)
+        for row in frozen.values('category', 'allocated', 'spent'):
+            category = row['category']
+            self.allocated[category] = self.allocated.get(category, ZERO) + row['allocated']
+            self.spent[category] = self.spent.get(category, ZERO) + row['spent']
+
+    def category(self, category_id):
+        """(allocated, spent, available) for one category."""
+        allocated = self.allocated.get(category_id) or ZERO
+        spent = self.spent.get(category_id) or ZERO
+        return allocated, spent, allocated - spent
+
+    def balances(self, categories):
+        """The /categories/balances/ rows for `categories`."""
+        rows = []
+        for category in categories:
+            allocated, spent, available = self.category(category.id)
+            rows.append({
+                'category_id': category.id,
+                'category_name': category.name,
+                'allocated': str(allocated),
+                'spent': str(spent),
+                'available': str(available),
+            })
+        return rows
+
+    def available_to_budget(self, balance):
+        """`balance` (all accounts) less everything allocated, plus everything spent."""
+        return balance - sum(self.allocated.values(), ZERO) + sum(self.spent.values(), ZERO)
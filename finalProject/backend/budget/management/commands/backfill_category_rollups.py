@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from budget.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the monthly per-category rollups the reports read, from each "
+        "user's transactions. Run once after adding rollups, or to repair them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id').values_list('id', flat=True)
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        total = 0
+        for user_id in users.iterator():
+            written = rebuild(user_id, batch_size=options['batch_size'])
+            total += written
+            if written:
+                self.stdout.write(f"User {user_id}: {written} rollups")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} rollups."))
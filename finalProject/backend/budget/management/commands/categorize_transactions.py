@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from budget.categorization import categorize_uncategorized
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply each user's categorization rules to their transactions that "
+        "have no category yet. Run after importing transactions or adding rules."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id').values_list('id', flat=True)
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        total = 0
+        for user_id in users.iterator():
+            categorized = categorize_uncategorized(user_id, batch_size=options['batch_size'])
+            total += categorized
+            if categorized:
+                self.stdout.write(f"User {user_id}: {categorized} transactions")
+
+        self.stdout.write(self.style.SUCCESS(f"Categorized {total} transactions."))
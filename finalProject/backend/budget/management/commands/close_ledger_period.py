@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from budget import checkpoints
+
+
+def _in_worker(func, user_id):
+    try:
+        return func(user_id)
+    finally:
+        # Each worker thread opened its own connections.
+        connections.close_all()
+
+
+def _ledger_on_sqlite():
+    return any(connections[alias].vendor == 'sqlite' for alias in settings.LEDGER_SHARDS or [DEFAULT_DB_ALIAS])
+
+
+class Command(BaseCommand):
+    help = (
+        "Close the ledger through the end of a month: store each user's allocated "
+        "and spent totals per category as of then, so balances only add up what "
+        "came after. With --verify, recount the latest checkpoints from scratch "
+        "instead and report any that disagree."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help='Last month to close, YYYY-MM. Defaults to last month.')
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only this user id (repeatable).')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Users processed in parallel. Closing runs one user at a time on SQLite, which takes one writer.',
+        )
+        parser.add_argument('--verify', action='store_true')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id').values_list('id', flat=True)
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+        users = list(users)
+
+        if options['verify']:
+            results = self.run(checkpoints.verify, users, options['workers'])
+            mismatched = 0
+            for user_id, differences in zip(users, results):
+                if differences:
+                    mismatched += 1
+                for category, stored, recounted in differences:
+                    self.stdout.write(self.style.ERROR(
+                        f"User {user_id}, category {category}: checkpoint has {stored[0]} allocated / "
+                        f"{stored[1]} spent, recount gives {recounted[0]} / {recounted[1]}"
+                    ))
+            if mismatched:
+                raise CommandError(f"{mismatched} users' checkpoints disagree with a recount.")
+            self.stdout.write(self.style.SUCCESS(f"Checked {len(users)} users' checkpoints."))
+            return
+
+        if options['through']:
+            try:
+                month = datetime.strptime(options['through'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--through must be YYYY-MM.')
+            if month > checkpoints.last_closed_month():
+                raise CommandError(f"{options['through']} has not ended yet.")
+        else:
+            month = checkpoints.last_closed_month()
+        end = checkpoints.period_end(month)
+
+        workers = options['workers']
+        if workers > 1 and _ledger_on_sqlite():
+            # Concurrent write transactions on SQLite fail with "database is locked".
+            workers = 1
+        results = self.run(lambda user_id: checkpoints.close(user_id, end), users, workers)
+        closed = 0
+        for user_id, written in zip(users, results):
+            if written is not None:
+                closed += 1
+                self.stdout.write(f"User {user_id}: {written} categories")
+        self.stdout.write(self.style.SUCCESS(f"Closed {month:%Y-%m} for {closed} users."))
+
+    def run(self, func, users, workers):
+        if workers <= 1:
+            return [func(user_id) for user_id in users]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda user_id: _in_worker(func, user_id), users))
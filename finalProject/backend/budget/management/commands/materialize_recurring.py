@@ -0,0 +1,45 @@
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from budget import recurring, workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the recurring transactions and scheduled allocations that have come "
+        "due, each dated when it was due, catching up on every occurrence missed "
+        "since the last run. Safe to run while another run is still going."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Schedules claimed and written at a time.')
+        parser.add_argument('--workers', type=int, default=4, help='Processes claiming batches on each database.')
+        parser.add_argument(
+            '--lease-seconds', type=int, default=300,
+            help='How long a claimed batch is left to its run before another may take it.',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        databases = settings.LEDGER_SHARDS or [DEFAULT_DB_ALIAS]
+        # One cutoff for every worker, so none of them chases occurrences falling due as it runs.
+        run = partial(
+            recurring.run, until=timezone.now(), batch_size=options['batch_size'],
+            lease_seconds=options['lease_seconds'],
+        )
+        tasks = [using for using in databases for _ in range(max(options['workers'], 1))]
+        schedules, occurrences = 0, 0
+        for using, (claimed, written) in workers.run(run, tasks, options['workers']):
+            schedules += claimed
+            occurrences += written
+            if claimed:
+                self.stdout.write(f"{using}: {claimed} schedules, {written} occurrences written")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Materialized {occurrences} occurrences from {schedules} schedules in {elapsed:.1f}s."
+        ))
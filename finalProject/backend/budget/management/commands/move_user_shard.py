@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models.sql import InsertQuery
+from budget.models import (
+    Account, AccountBalanceRebuild, Category, BudgetAllocation, Transaction, CategoryMonthRollup, CategorizationRule,
+    IdempotencyKey, LedgerCheckpoint, LedgerEvent, LedgerSnapshot, LedgerStream, RecurringTransaction,
+)
+from budget.sharding import set_assignment, shard_for_user, shared_cache
+
+# Parents before children so foreign keys resolve on the target.
+LEDGER_MODELS = [
+    Account, Category, BudgetAllocation, Transaction, CategoryMonthRollup, CategorizationRule, LedgerCheckpoint,
+    AccountBalanceRebuild, LedgerStream, LedgerEvent, LedgerSnapshot, IdempotencyKey, RecurringTransaction,
+]
+
+
+def copy_rows(model, queryset, target, batch_size):
+    """Insert the queryset's rows on `target` unchanged: same ids, same timestamps."""
+    fields = model._meta.concrete_fields
+    batch_size = min(batch_size, connections[target].ops.bulk_batch_size(fields, [None] * batch_size))
+    copied = 0
+    batch = []
+
+    def flush():
+        query = InsertQuery(model)
+        # raw=True keeps auto_now/auto_now_add from overwriting the timestamps.
+        query.insert_values(fields, batch, raw=True)
+        query.get_compiler(using=target).execute_sql()
+
+    for obj in queryset.iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) == batch_size:
+            flush()
+            copied += len(batch)
+            batch = []
+    if batch:
+        flush()
+        copied += len(batch)
+    return copied
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a user's budget ledger to another shard. Reads keep working "
+        "throughout; writes get a 503 until the copy is switched over."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int)
+        parser.add_argument('target', help='Shard alias from settings.LEDGER_SHARDS, e.g. ledger_2.')
+        parser.add_argument(
+            '--grace', type=float, default=None,
+            help='Seconds to wait for in-flight writes and cached assignments after blocking new writes '
+                 '(default: LEDGER_ASSIGNMENT_CACHE_SECONDS + 2; never less than that setting).',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        user_id = options['user_id']
+        target = options['target']
+        if target not in settings.LEDGER_SHARDS:
+            raise CommandError(f"Unknown shard '{target}'. Configured: {', '.join(settings.LEDGER_SHARDS) or 'none'}.")
+        if not shared_cache():
+            raise CommandError(
+                "The default cache is local to each process, so servers would keep writing to the old shard "
+                "from their own copy of the assignment. Configure a shared cache (BUDGET_CACHE_URL)."
+            )
+        cached_for = settings.LEDGER_ASSIGNMENT_CACHE_SECONDS
+        grace = cached_for + 2 if options['grace'] is None else options['grace']
+        if grace < cached_for:
+            raise CommandError(
+                f"--grace must be at least LEDGER_ASSIGNMENT_CACHE_SECONDS ({cached_for}) so no process still "
+                "routes writes by an assignment cached before the move started."
+            )
+
+        source = shard_for_user(user_id)
+        if source == target:
+            self.stdout.write(self.style.WARNING(f"User {user_id} is already on {target}."))
+            return
+
+        set_assignment(user_id, source, moving=True)
+        time.sleep(grace)
+
+        try:
+            with transaction.atomic(using=target):
+                for model in LEDGER_MODELS:
+                    rows = model.objects.using(source).filter(**{model.ledger_user_lookup: user_id})
+                    copied = copy_rows(model, rows, target, options['batch_size'])
+                    on_target = model.objects.using(target).filter(**{model.ledger_user_lookup: user_id}).count()
+                    if copied != rows.count() or on_target != copied:
+                        raise CommandError(f"{model.__name__}: copied {copied} rows but found {on_target} on {target}.")
+                    self.stdout.write(f"{model._meta.verbose_name_plural}: {copied}")
+        except Exception:
+            set_assignment(user_id, source, moving=False)
+            raise
+
+        set_assignment(user_id, target, moving=False)
+
+        with transaction.atomic(using=source):
+            for model in reversed(LEDGER_MODELS):
+                model.objects.using(source).filter(**{model.ledger_user_lookup: user_id}).delete()
+
+        self.stdout.write(self.style.SUCCESS(f"Moved user {user_id} from {source} to {target}."))
@@ -1,35 +1,69 @@
+import time
 from decimal import Decimal
-from django.core.management.base import BaseCommand
-from django.db.models import Sum
-from budget.models import Account, BudgetAllocation
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from budget import balances, workers
 
 
 class Command(BaseCommand):
     help = (
         "Rebuild account balances by adding back all budget allocation amounts. "
         "Use this once after switching to the new allocation logic where allocations "
-        "no longer change cash balances."
+        "no longer change cash balances. Only accounts created before budget migration "
+        "0009 was applied are touched. Accounts already rebuilt are skipped, so an "
+        "interrupted run can simply be started again. With --verify, check the "
+        "rebuilt accounts instead."
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users per range, and rows per bulk write.')
+        parser.add_argument('--workers', type=int, default=4, help='User ranges processed in parallel processes.')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be added without writing.')
+        parser.add_argument('--verify', action='store_true')
+
     def handle(self, *args, **options):
-        accounts = Account.objects.all()
-        if not accounts.exists():
-            self.stdout.write(self.style.WARNING("No accounts found. Nothing to rebuild."))
-            return
+        users = User.objects.order_by('id').values_list('id', flat=True)
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+        users = list(users)
+        size = options['batch_size']
+        ranges = [users[i:i + size] for i in range(0, len(users), size)]
 
-        for account in accounts:
-            allocation_sum = (
-                BudgetAllocation.objects.filter(account=account).aggregate(total=Sum("amount"))[
-                    "total"
-                ]
-                or Decimal("0")
-            )
-            original_balance = account.balance
-            account.balance = original_balance + allocation_sum
-            account.save(update_fields=["balance"])
+        if options['verify']:
+            mismatched = 0
+            for _, problems in workers.run(balances.verify, ranges, options['workers']):
+                mismatched += len(problems)
+                for account_id, marked, recounted in problems:
+                    if marked is None:
+                        self.stdout.write(self.style.ERROR(f"Account {account_id}: not rebuilt"))
+                    else:
+                        self.stdout.write(self.style.ERROR(
+                            f"Account {account_id}: {marked} added, allocations up to the rebuild sum to {recounted}"
+                        ))
+            if mismatched:
+                raise CommandError(f"{mismatched} accounts failed verification.")
+            self.stdout.write(self.style.SUCCESS(f"Checked {len(users)} users' accounts."))
+            return
 
+        dry_run = options['dry_run']
+        rebuild = partial(balances.rebuild, batch_size=size, dry_run=dry_run)
+        rebuilt, added = 0, Decimal('0')
+        start = time.perf_counter()
+        for user_ids, (accounts, amount) in workers.run(rebuild, ranges, options['workers']):
+            rebuilt += accounts
+            added += amount
+            rate = rebuilt / max(time.perf_counter() - start, 1e-9)
             self.stdout.write(
-                f"{account.name}: +{allocation_sum} -> {account.balance}"
+                f"Users {user_ids[0]}-{user_ids[-1]}: {accounts} accounts, +{amount} "
+                f"({rebuilt} so far, {rate:,.0f} accounts/s)"
             )
 
-        self.stdout.write(self.style.SUCCESS("Account balances rebuilt."))
+        if not rebuilt:
+            self.stdout.write(self.style.WARNING("No accounts left to rebuild."))
+        elif dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Dry run: would rebuild {rebuilt} accounts, adding {added}."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Account balances rebuilt: {rebuilt} accounts, added {added}."))
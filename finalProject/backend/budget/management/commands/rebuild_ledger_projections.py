@@ -0,0 +1,68 @@
+import time
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from budget import events, workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay each user's ledger events from their latest snapshot and set any stored "
+        "account balance that disagrees back to the projected one. With --snapshot, "
+        "also replace the snapshots so the next replay starts from here. With --verify, "
+        "only report the balances and category totals that disagree with the events."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users per range.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Events read per round trip.')
+        parser.add_argument('--workers', type=int, default=4, help='User ranges replayed in parallel processes.')
+        parser.add_argument('--snapshot', action='store_true', help='Write new snapshots after replaying.')
+        parser.add_argument('--verify', action='store_true')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id').values_list('id', flat=True)
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+        users = list(users)
+        size = options['batch_size']
+        ranges = [users[i:i + size] for i in range(0, len(users), size)]
+
+        verify = options['verify']
+        rebuild = partial(
+            events.rebuild, verify=verify, take_snapshots=options['snapshot'] and not verify,
+            chunk_size=options['chunk_size'],
+        )
+        replayed, drifted, mismatched, snapshots = 0, 0, 0, 0
+        start = time.perf_counter()
+        for user_ids, (balances, categories, written) in workers.run(rebuild, ranges, options['workers']):
+            replayed += len(user_ids)
+            drifted += len(balances)
+            mismatched += len(categories)
+            snapshots += written
+            for user_id, account_id, stored, projected in balances:
+                self.stdout.write(self.style.ERROR(
+                    f"Account {account_id} (user {user_id}): balance {stored}, events give {projected}"
+                    + ("" if verify else ", corrected")
+                ))
+            for user_id, category, read, projected in categories:
+                self.stdout.write(self.style.ERROR(
+                    f"User {user_id}, category {category}: {read[0]} allocated / {read[1]} spent, "
+                    f"events give {projected[0]} / {projected[1]}"
+                ))
+            rate = replayed / max(time.perf_counter() - start, 1e-9)
+            self.stdout.write(f"Users {user_ids[0]}-{user_ids[-1]} replayed ({replayed} so far, {rate:,.0f} users/s)")
+
+        elapsed = time.perf_counter() - start
+        if verify:
+            if drifted or mismatched:
+                raise CommandError(
+                    f"{drifted} balances and {mismatched} category totals disagree with the ledger events."
+                )
+            self.stdout.write(self.style.SUCCESS(f"Checked {replayed} users' projections in {elapsed:.1f}s."))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {replayed} users in {elapsed:.1f}s: {drifted} balances corrected, {snapshots} snapshots written."
+        ))
@@ -0,0 +1,82 @@
+import csv
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from budget import reconciliation, workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every account's stored balance against its opening balance plus its "
+        "transactions and report the accounts that drifted. With --fix, set drifted "
+        "balances back and record opening balances for accounts that have none yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Only this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=500000, help='Transaction ids per range.')
+        parser.add_argument('--workers', type=int, default=4, help='Ranges summed in parallel processes.')
+        parser.add_argument('--fix', action='store_true', help='Correct drifted balances.')
+        parser.add_argument('--report', help='Also write the drifted accounts to this CSV file.')
+
+    def handle(self, *args, **options):
+        users = options['users']
+        fix = options['fix']
+        start = time.perf_counter()
+        databases = settings.LEDGER_SHARDS or [DEFAULT_DB_ALIAS]
+
+        nets = {using: {} for using in databases}
+        tasks = [
+            task for using in databases for task in reconciliation.transaction_ranges(using, options['batch_size'])
+        ]
+        net_by_account = partial(reconciliation.net_by_account, user_ids=users)
+        for (using, first, last), sums in workers.run(net_by_account, tasks, options['workers']):
+            merged = nets[using]
+            for account_id, net in sums.items():
+                merged[account_id] = merged.get(account_id, 0) + net
+            self.stdout.write(f"{using}: transactions {first}-{last} summed, {len(sums)} accounts")
+
+        drifts, without_opening = [], 0
+        for using in databases:
+            for candidate in reconciliation.candidates(using, nets[using], users):
+                drift = reconciliation.correct(using, candidate.account) if fix \
+                    else reconciliation.recheck(using, candidate.account)
+                if drift is None:
+                    # Written to while the scan ran; it holds now.
+                    continue
+                drifts.append(drift)
+                self.stdout.write(self.style.ERROR(
+                    f"Account {drift.account} (user {drift.user}): balance {drift.stored}, "
+                    f"transactions give {drift.expected} ({drift.stored - drift.expected:+})"
+                    + (", corrected" if fix else "")
+                ))
+            if fix:
+                recorded = reconciliation.record_openings(using, users)
+                if recorded:
+                    self.stdout.write(f"{using}: recorded opening balances for {recorded} accounts")
+            else:
+                without_opening += reconciliation.without_opening(using, users).count()
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as report:
+                writer = csv.writer(report)
+                writer.writerow(['account', 'user', 'balance', 'expected', 'drift', 'corrected'])
+                for drift in drifts:
+                    writer.writerow([
+                        drift.account, drift.user, drift.stored, drift.expected, drift.stored - drift.expected, fix,
+                    ])
+
+        elapsed = time.perf_counter() - start
+        if without_opening:
+            self.stdout.write(self.style.WARNING(
+                f"{without_opening} accounts have no opening balance yet and were not checked; "
+                f"--fix records them from their current balances."
+            ))
+        if drifts and not fix:
+            raise CommandError(f"{len(drifts)} accounts drifted ({elapsed:.1f}s). Run with --fix to correct them.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled in {elapsed:.1f}s: {len(drifts)} accounts drifted" + (", all corrected." if fix else ".")
+        ))
@@ -0,0 +1,32 @@
+import time
+from functools import partial
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+from budget import jobs, workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background job queue (see budget.jobs) in a pool of worker "
+        "processes, until stopped. With --burst, exit once nothing is left to run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker processes.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue has nothing due.')
+        parser.add_argument(
+            '--poll-seconds', type=float, default=1.0, help='How often an idle worker checks the queue.',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        work = partial(jobs.work, burst=options['burst'], poll_seconds=options['poll_seconds'])
+        names = [uuid4().hex for _ in range(max(options['workers'], 1))]
+        ran = 0
+        for name, count in workers.run(work, names, options['workers']):
+            ran += count
+            self.stdout.write(f"Worker {name[:8]} ran {count} jobs")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs in {elapsed:.1f}s."))
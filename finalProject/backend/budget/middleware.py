@@ -0,0 +1,223 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+Works like django.middleware.gzip.GZipMiddleware, with these differences:
+- It also offers zstd and brotli ("br") when the `zstandard` / `brotli`
+  packages are installed, preferring them in settings order.
+- It leaves bodies under MIN_SIZE alone, where compression costs more CPU
+  than it saves bytes.
+- It compresses streaming responses chunk by chunk, flushing after each
+  chunk so the client still receives them as they are produced.
+
+Responses are skipped when they:
+- are already encoded (a view or a lower middleware compressed them),
+- carry `Cache-Control: no-transform`,
+- are 206/304,
+- have a content type outside TYPES,
+- come from EXCLUDE_PATHS.
+
+Already-cached payloads aren't compressed again as long as the cache sits
+above this middleware (UpdateCacheMiddleware before it in MIDDLEWARE,
+FetchFromCacheMiddleware after it). The cache then stores the compressed
+body under a key that varies on Accept-Encoding. A hit is answered before
+this middleware runs. A per-view cache (cache_page) sits below it and
+stores the identity body, so its hits are compressed again.
+
+Put endpoints that return secrets next to user input (the auth endpoints
+return tokens) in EXCLUDE_PATHS: compressing them would open them to
+BREACH-style length attacks.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+DEFAULTS = {
+    'ENCODINGS': ['zstd', 'br', 'gzip'],
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    'ZSTD_LEVEL': 3,
+    'TYPES': ['application/json', 'text/', 'application/javascript', 'image/svg+xml'],
+    'EXCLUDE_PATHS': [],
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_COMPRESSION', {})}
+
+
+class _Gzip:
+    def __init__(self, config):
+        self.level = config['GZIP_LEVEL']
+
+    def compress(self, data):
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def compressor(self):
+        return _GzipStream(zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS))
+
+
+class _GzipStream:
+    def __init__(self, compressobj):
+        self.compressobj = compressobj
+
+    def compress(self, chunk):
+        return self.compressobj.compress(chunk) + self.compressobj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressobj.flush()
+
+
+class _Brotli:
+    def __init__(self, config):
+        self.quality = config['BROTLI_QUALITY']
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def compressor(self):
+        return _BrotliStream(brotli.Compressor(quality=self.quality))
+
+
+class _BrotliStream:
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def compress(self, chunk):
+        return self.compressor.process(chunk) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, config):
+        self.zstd = zstandard.ZstdCompressor(level=config['ZSTD_LEVEL'])
+
+    def compress(self, data):
+        return self.zstd.compress(data)
+
+    def compressor(self):
+        return _ZstdStream(self.zstd.compressobj())
+
+
+class _ZstdStream:
+    def __init__(self, compressobj):
+        self.compressobj = compressobj
+
+    def compress(self, chunk):
+        return self.compressobj.compress(chunk) + self.compressobj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressobj.flush()
+
+
+CODECS = {'gzip': _Gzip}
+if brotli is not None:
+    CODECS['br'] = _Brotli
+if zstandard is not None:
+    CODECS['zstd'] = _Zstd
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate(header, encodings):
+    """The accepted one of `encodings` with the highest q, ties going to the earliest; or None."""
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _stream(codec, chunks):
+    compressor = codec.compressor()
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.finish()
+
+
+async def _astream(codec, chunks):
+    compressor = codec.compressor()
+    async for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = _config()
+        self.min_size = config['MIN_SIZE']
+        self.types = tuple(config['TYPES'])
+        self.exclude_paths = tuple(config['EXCLUDE_PATHS'])
+        self.encodings = [name for name in config['ENCODINGS'] if name in CODECS]
+        self.codecs = {name: CODECS[name](config) for name in self.encodings}
+
+    def _skip(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (206, 304):
+            return True
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return True
+        if not response.get('Content-Type', '').startswith(self.types):
+            return True
+        if self.exclude_paths and request.path.startswith(self.exclude_paths):
+            return True
+        return not response.streaming and len(response.content) < self.min_size
+
+    def process_response(self, request, response):
+        if self._skip(request, response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if encoding is None:
+            return response
+        codec = self.codecs[encoding]
+
+        if response.streaming:
+            stream = _astream if response.is_async else _stream
+            response.streaming_content = stream(codec, response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = codec.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:30
+
+import budget.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0004_transaction_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionSearchIndex',
+            fields=[
+                ('transaction', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='budget.transaction')),
+                ('document', budget.search.MatchField(db_column='budget_transaction_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'budget_transaction_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0005_transaction_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorizationRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pattern', models.CharField(max_length=255)),
+                ('match_type', models.CharField(choices=[('contains', 'Contains'), ('regex', 'Regular expression')], default='contains', max_length=10)),
+                ('priority', models.PositiveIntegerField(default=0, help_text='Lower runs first.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['priority', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('category__isnull', True)), fields=['user', 'id'], name='budget_txn_user_uncategorized'),
+        ),
+        migrations.AddField(
+            model_name='categorizationrule',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='budget.category'),
+        ),
+        migrations.AddField(
+            model_name='categorizationrule',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='categorization_rules', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='categorizationrule',
+            index=models.Index(fields=['user', 'priority'], name='budget_rule_user_priority'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0006_categorization_rules'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_end', models.DateTimeField(help_text='The totals cover rows dated before this.')),
+                ('allocated', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-period_end'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='budgetallocation',
+            name='account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='budget.account'),
+        ),
+        migrations.AddIndex(
+            model_name='budgetallocation',
+            index=models.Index(fields=['account', 'allocated_at'], name='budget_alloc_account_date'),
+        ),
+        migrations.AddField(
+            model_name='ledgercheckpoint',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='budget.category'),
+        ),
+        migrations.AddField(
+            model_name='ledgercheckpoint',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_checkpoints', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='ledgercheckpoint',
+            index=models.Index(fields=['user', 'period_end'], name='budget_checkpoint_user_end'),
+        ),
+        migrations.AddConstraint(
+            model_name='ledgercheckpoint',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'period_end'), name='budget_checkpoint_user_category_end'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+"""
+Store amounts as integer cents (budget.money.MoneyField).
+
+Each decimal column is widened so it can hold its values times 100, scaled
+in place, then turned into a bigint; the values are whole numbers by then, so
+the type change is exact on every backend. Reversing divides them back.
+"""
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Round
+
+import budget.money
+
+# (model, field, max_digits, default)
+MONEY_FIELDS = [
+    ('account', 'balance', 10, 0),
+    ('budgetallocation', 'amount', 10, None),
+    ('transaction', 'amount', 10, None),
+    ('categorymonthrollup', 'income', 14, 0),
+    ('categorymonthrollup', 'expense', 14, 0),
+    ('ledgercheckpoint', 'allocated', 14, 0),
+    ('ledgercheckpoint', 'spent', 14, 0),
+]
+
+MODELS = list(dict.fromkeys(model for model, *_ in MONEY_FIELDS))
+
+
+def _defaults(default):
+    return {} if default is None else {'default': default}
+
+
+def _fields(model_name):
+    return [field for model, field, *_ in MONEY_FIELDS if model == model_name]
+
+
+def _scaler(model_name, scale):
+    def scale_amounts(apps, schema_editor):
+        model = apps.get_model('budget', model_name)
+        model.objects.using(schema_editor.connection.alias).update(
+            **{field: scale(F(field)) for field in _fields(model_name)}
+        )
+    return scale_amounts
+
+
+def _to_cents(amount):
+    return Round(amount * 100)
+
+
+def _from_cents(amount):
+    return amount * Value(Decimal('0.01'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0007_ledger_checkpoints'),
+    ]
+
+    operations = [
+        *(
+            migrations.AlterField(
+                model_name=model, name=field,
+                field=models.DecimalField(decimal_places=2, max_digits=max_digits + 2, **_defaults(default)),
+            )
+            for model, field, max_digits, default in MONEY_FIELDS
+        ),
+        *(
+            migrations.RunPython(
+                _scaler(model, _to_cents), _scaler(model, _from_cents), hints={'model_name': model},
+            )
+            for model in MODELS
+        ),
+        *(
+            migrations.AlterField(
+                model_name=model, name=field,
+                field=budget.money.MoneyField(
+                    **({} if max_digits == 10 else {'max_digits': max_digits}), **_defaults(default)
+                ),
+            )
+            for model, field, max_digits, default in MONEY_FIELDS
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:51
+
+import budget.money
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0008_money_in_cents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountBalanceRebuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added', budget.money.MoneyField(help_text='Allocations added back to the balance.', max_digits=14)),
+                ('rebuilt_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='balance_rebuild', to='budget.account')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:55
+
+import budget.money
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0009_account_balance_rebuilds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='opening_balance',
+            field=budget.money.MoneyField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,116 @@
+"""
+The ledger event log (budget.events). The log starts empty; what the ledger
+held before it is each user's first snapshot, at sequence 0: balances,
+allocations and spending summed per account and category.
+"""
+from decimal import Decimal
+
+import budget.money
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, Q, Sum, When
+
+ZERO = Decimal('0')
+
+
+def initial_snapshots(apps, schema_editor):
+    using = schema_editor.connection.alias
+    Account = apps.get_model('budget', 'Account')
+    BudgetAllocation = apps.get_model('budget', 'BudgetAllocation')
+    Transaction = apps.get_model('budget', 'Transaction')
+    LedgerSnapshot = apps.get_model('budget', 'LedgerSnapshot')
+
+    pairs = {}
+
+    def add(user, account, category, balance=ZERO, allocated=ZERO, spent=ZERO):
+        totals = pairs.setdefault((user, account, category), [ZERO, ZERO, ZERO])
+        totals[0] += balance
+        totals[1] += allocated
+        totals[2] += spent
+
+    signed = Case(
+        When(transaction_type='income', then=F('amount')), default=-F('amount'),
+        output_field=budget.money.MoneyField(),
+    )
+    transactions = Transaction.objects.using(using).values('user', 'account', 'category').annotate(
+        net=Sum(signed), spent=Sum('amount', filter=Q(transaction_type='expense'), default=ZERO),
+    ).order_by()
+    nets = {}
+    for row in transactions.iterator():
+        add(row['user'], row['account'], row['category'], balance=row['net'], spent=row['spent'])
+        nets[row['account']] = nets.get(row['account'], ZERO) + row['net']
+    allocations = BudgetAllocation.objects.using(using).values('account__user', 'account', 'category').annotate(
+        total=Sum('amount'),
+    ).order_by()
+    for row in allocations.iterator():
+        add(row['account__user'], row['account'], row['category'], allocated=row['total'])
+    # Whatever the transactions don't explain is the account's opening balance.
+    for account_id, user_id, balance in Account.objects.using(using).values_list('id', 'user', 'balance').iterator():
+        add(user_id, account_id, None, balance=balance - nets.get(account_id, ZERO))
+
+    LedgerSnapshot.objects.using(using).bulk_create(
+        (
+            LedgerSnapshot(
+                user_id=user, sequence=0, account_id=account, category_id=category,
+                balance=balance, allocated=allocated, spent=spent,
+            )
+            for (user, account, category), (balance, allocated, spent) in pairs.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0010_account_opening_balance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveBigIntegerField(help_text='The last event included.')),
+                ('balance', budget.money.MoneyField(default=0, max_digits=14)),
+                ('allocated', budget.money.MoneyField(default=0, max_digits=14)),
+                ('spent', budget.money.MoneyField(default=0, max_digits=14)),
+                ('account', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='budget.account')),
+                ('category', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='budget.category')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerStream',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_stream', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveBigIntegerField(help_text="Position in the user's log, from 1.")),
+                ('kind', models.CharField(choices=[('account.opened', 'Account opened'), ('account.adjusted', 'Account balance adjusted'), ('transaction.created', 'Transaction created'), ('transaction.updated', 'Transaction updated'), ('transaction.deleted', 'Transaction deleted'), ('allocation.created', 'Allocation created'), ('allocation.updated', 'Allocation updated'), ('allocation.moved', 'Money moved'), ('allocation.deleted', 'Allocation deleted')], max_length=24)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('balance', budget.money.MoneyField(default=0, help_text="Change to the account's balance.", max_digits=14)),
+                ('allocated', budget.money.MoneyField(default=0, help_text="Change to the category's allocations.", max_digits=14)),
+                ('spent', budget.money.MoneyField(default=0, help_text="Change to the category's spending.", max_digits=14)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='budget.account')),
+                ('category', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='budget.category')),
+                ('user', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'sequence'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'sequence'), name='budget_event_user_sequence')],
+            },
+        ),
+        migrations.RunPython(
+            initial_snapshots, migrations.RunPython.noop, hints={'model_name': 'ledgersnapshot'},
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:32
+
+import budget.money
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0012_idempotency_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='budgetallocation',
+            name='allocated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='RecurringTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense'), ('allocation', 'Allocation')], max_length=10)),
+                ('amount', budget.money.MoneyField()),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], default='monthly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1, help_text='Every this many days, weeks, months or years.')),
+                ('starts_at', models.DateTimeField(help_text='When the first occurrence is due.')),
+                ('ends_at', models.DateTimeField(blank=True, help_text='No occurrences after this.', null=True)),
+                ('occurrences', models.PositiveIntegerField(default=0, help_text='How many have been written so far.')),
+                ('next_run', models.DateTimeField(help_text='When the next occurrence is due.')),
+                ('active', models.BooleanField(default=True)),
+                ('claimed_by', models.CharField(blank=True, max_length=32)),
+                ('lease_until', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_transactions', to='budget.account')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recurring_transactions', to='budget.category')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='recurring_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['next_run'],
+                'indexes': [models.Index(condition=models.Q(('active', True)), fields=['next_run'], name='budget_recurring_due')],
+            },
+        ),
+    ]
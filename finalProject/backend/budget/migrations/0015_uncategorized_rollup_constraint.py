@@ -0,0 +1,41 @@
+"""
+One rollup row per user and month for uncategorized transactions. The
+(user, category, month) constraint lets NULL categories repeat, so concurrent
+first writes could each create a row; those are merged before the constraint
+goes on.
+"""
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_uncategorized(apps, schema_editor):
+    using = schema_editor.connection.alias
+    CategoryMonthRollup = apps.get_model('budget', 'CategoryMonthRollup')
+    rows = CategoryMonthRollup.objects.using(using).filter(category__isnull=True)
+    duplicated = rows.values('user', 'month').annotate(rows=Count('id')).filter(rows__gt=1).order_by()
+    for key in list(duplicated):
+        group = rows.filter(user_id=key['user'], month=key['month'])
+        totals = group.aggregate(income=Sum('income'), expense=Sum('expense'), count=Sum('count'))
+        keep = group.order_by('id').first()
+        group.exclude(pk=keep.pk).delete()
+        group.filter(pk=keep.pk).update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budget', '0014_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_uncategorized, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='categorymonthrollup',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('category__isnull', True)), fields=('user', 'month'),
+                name='budget_rollup_user_uncategorized_month',
+            ),
+        ),
+    ]
@@ -1,26 +1,75 @@
+import calendar
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .money import MoneyField
+from .search import MatchField
+from .sharding import shard_for_user
+
+
+class LedgerQuerySet(models.QuerySet):
+    def for_user(self, user_id, shard=None):
+        """The user's rows, read from the database holding their ledger."""
+        return self.on_user_shard(user_id, shard).filter(**{self.model.ledger_user_lookup: user_id})
+
+    def on_user_shard(self, user_id, shard=None):
+        # Without shards, leave the choice to the routers (replicas included).
+        # Async views pass the `shard` they resolved with ashard_for_user.
+        if not settings.LEDGER_SHARDS:
+            return self
+        return self.using(shard or shard_for_user(user_id))
+
+    def create(self, **kwargs):
+        # QuerySet.create routes without the instance, so with no database
+        # chosen a row would land on the request's shard or the default
+        # database; save() lets the router place it by its user or account.
+        if settings.LEDGER_SHARDS and self._db is None:
+            obj = self.model(**kwargs)
+            obj.save(force_insert=True)
+            return obj
+        return super().create(**kwargs)
 
 
 class Account(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='accounts')
+    # db_constraint=False: with ledger shards the users table lives elsewhere.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='accounts', db_constraint=False)
     name = models.CharField(max_length=100)
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    balance = MoneyField(default=0)
+    # What balance was before any transaction, as budget.reconciliation
+    # checks it. Null until known (accounts from before it was recorded).
+    opening_balance = MoneyField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
     class Meta:
         ordering = ['-created_at']
 
     def __str__(self):
         return f"{self.name} - ${self.balance}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.opening_balance is None:
+            self.opening_balance = self.balance
+        super().save(*args, **kwargs)
+
 
 class Category(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories', db_constraint=False)
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
     class Meta:
         ordering = ['name']
         verbose_name_plural = 'Categories'
@@ -31,12 +80,19 @@ class Category(models.Model):
 
 class BudgetAllocation(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='allocations')
-    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='allocations')
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
-    allocated_at = models.DateTimeField(auto_now_add=True)
+    # Indexed by budget_alloc_account_date below instead of on its own.
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='allocations', db_index=False)
+    amount = MoneyField()
+    # A default rather than auto_now_add, so budget.recurring can date occurrences when they were due.
+    allocated_at = models.DateTimeField(default=timezone.now)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'account__user_id'
 
     class Meta:
         ordering = ['-allocated_at']
+        # Allocations since the latest checkpoint (budget.checkpoints).
+        indexes = [models.Index(fields=['account', 'allocated_at'], name='budget_alloc_account_date')]
 
     def __str__(self):
         return f"{self.category.name}: ${self.amount}"
@@ -48,16 +104,404 @@ class Transaction(models.Model):
         ('expense', 'Expense'),
     ]
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions')
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions')
-    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='transactions')
+    # The foreign keys are indexed by the composite indexes in Meta instead of on their own.
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='transactions', db_constraint=False, db_index=False
+    )
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions', db_index=False
+    )
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='transactions', db_index=False)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField()
     description = models.CharField(max_length=255, blank=True)
-    date = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add, so budget.recurring can date occurrences when they were due.
+    date = models.DateTimeField(default=timezone.now)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
 
     class Meta:
         ordering = ['-date']
+        # One per filter the list takes (budget.filters), each ending in date
+        # where it can so the default ordering needs no sort.
+        indexes = [
+            models.Index(fields=['user', 'date'], name='budget_txn_user_date'),
+            models.Index(fields=['user', 'transaction_type', 'date'], name='budget_txn_user_type_date'),
+            models.Index(fields=['category', 'date'], name='budget_txn_category_date'),
+            models.Index(fields=['account', 'date'], name='budget_txn_account_date'),
+            models.Index(fields=['user', 'amount'], name='budget_txn_user_amount'),
+            # Pages of uncategorized rows for budget.categorization, in id order.
+            models.Index(
+                fields=['user', 'id'], condition=models.Q(category__isnull=True), name='budget_txn_user_uncategorized'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type}: ${self.amount} - {self.description}"
+
+
+class TransactionSearchIndex(models.Model):
+    """Read-only view of the SQLite full-text index budget.search maintains."""
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_index'
+    )
+    document = MatchField(db_column='budget_transaction_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'budget_transaction_fts'
+
+
+class CategoryMonthRollup(models.Model):
+    """A user's income and spending in one category and month, kept current by budget.rollups."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_rollups', db_constraint=False)
+    # Null for uncategorized transactions.
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='rollups')
+    month = models.DateField(help_text='First day of the month.')
+    income = MoneyField(max_digits=14, default=0)
+    expense = MoneyField(max_digits=14, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
+    class Meta:
+        ordering = ['-month']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'month'], name='budget_rollup_user_category_month'),
+            # NULLs are distinct in the constraint above, so uncategorized rows need their own.
+            models.UniqueConstraint(
+                fields=['user', 'month'], condition=models.Q(category__isnull=True),
+                name='budget_rollup_user_uncategorized_month',
+            ),
+        ]
+        indexes = [models.Index(fields=['user', 'month'], name='budget_rollup_user_month')]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.category_id}: +${self.income} -${self.expense}"
+
+
+class LedgerCheckpoint(models.Model):
+    """A user's allocated and spent totals per category up to period_end, written by budget.checkpoints."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_checkpoints', db_constraint=False)
+    # Null for uncategorized spending.
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True, related_name='checkpoints'
+    )
+    period_end = models.DateTimeField(help_text='The totals cover rows dated before this.')
+    allocated = MoneyField(max_digits=14, default=0)
+    spent = MoneyField(max_digits=14, default=0)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
+    class Meta:
+        ordering = ['-period_end']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'category', 'period_end'], name='budget_checkpoint_user_category_end'
+            ),
+        ]
+        indexes = [models.Index(fields=['user', 'period_end'], name='budget_checkpoint_user_end')]
+
+    def __str__(self):
+        return f"{self.period_end:%Y-%m-%d} {self.category_id}: ${self.allocated} / ${self.spent}"
+
+
+class AccountBalanceRebuild(models.Model):
+    """Marks an account whose balance budget.balances has already rebuilt, and by how much."""
+    account = models.OneToOneField(Account, on_delete=models.CASCADE, related_name='balance_rebuild')
+    added = MoneyField(max_digits=14, help_text='Allocations added back to the balance.')
+    rebuilt_at = models.DateTimeField(auto_now_add=True)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'account__user_id'
+
+    def __str__(self):
+        return f"{self.account_id}: +${self.added}"
+
+
+class LedgerStream(models.Model):
+    """The head of a user's ledger event log: how many events budget.events has appended to it."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='ledger_stream', db_constraint=False)
+    version = models.PositiveBigIntegerField(default=0)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.version}"
+
+
+class LedgerEvent(models.Model):
+    """One change to a user's balances or category totals, appended by budget.events and never updated."""
+    ACCOUNT_OPENED = 'account.opened'
+    ACCOUNT_ADJUSTED = 'account.adjusted'
+    TRANSACTION_CREATED = 'transaction.created'
+    TRANSACTION_UPDATED = 'transaction.updated'
+    TRANSACTION_DELETED = 'transaction.deleted'
+    ALLOCATION_CREATED = 'allocation.created'
+    ALLOCATION_UPDATED = 'allocation.updated'
+    ALLOCATION_MOVED = 'allocation.moved'
+    ALLOCATION_DELETED = 'allocation.deleted'
+    KINDS = [
+        (ACCOUNT_OPENED, 'Account opened'),
+        (ACCOUNT_ADJUSTED, 'Account balance adjusted'),
+        (TRANSACTION_CREATED, 'Transaction created'),
+        (TRANSACTION_UPDATED, 'Transaction updated'),
+        (TRANSACTION_DELETED, 'Transaction deleted'),
+        (ALLOCATION_CREATED, 'Allocation created'),
+        (ALLOCATION_UPDATED, 'Allocation updated'),
+        (ALLOCATION_MOVED, 'Money moved'),
+        (ALLOCATION_DELETED, 'Allocation deleted'),
+    ]
+
+    # Indexed by budget_event_user_sequence below instead of on its own.
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='ledger_events', db_constraint=False, db_index=False
+    )
+    sequence = models.PositiveBigIntegerField(help_text="Position in the user's log, from 1.")
+    kind = models.CharField(max_length=24, choices=KINDS)
+    # The transaction or allocation the event is about.
+    object_id = models.BigIntegerField(null=True, blank=True)
+    # DO_NOTHING without constraints: events outlive the rows they mention.
+    account = models.ForeignKey(
+        Account, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    category = models.ForeignKey(
+        Category, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, db_index=False,
+        related_name='+'
+    )
+    balance = MoneyField(max_digits=14, default=0, help_text="Change to the account's balance.")
+    allocated = MoneyField(max_digits=14, default=0, help_text="Change to the category's allocations.")
+    spent = MoneyField(max_digits=14, default=0, help_text="Change to the category's spending.")
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
+    class Meta:
+        ordering = ['user', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'sequence'], name='budget_event_user_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}#{self.sequence} {self.kind}"
+
+
+class LedgerSnapshot(models.Model):
+    """
+    A user's events up to `sequence` summed per account and category, written
+    by budget.events. Each user has at most one, replaced by the next.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_snapshots', db_constraint=False)
+    sequence = models.PositiveBigIntegerField(help_text='The last event included.')
+    account = models.ForeignKey(
+        Account, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    category = models.ForeignKey(
+        Category, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, db_index=False,
+        related_name='+'
+    )
+    balance = MoneyField(max_digits=14, default=0)
+    allocated = MoneyField(max_digits=14, default=0)
+    spent = MoneyField(max_digits=14, default=0)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
+    def __str__(self):
+        return f"{self.user_id}@{self.sequence} {self.account_id}/{self.category_id}: ${self.balance}"
+
+
+class CategorizationRule(models.Model):
+    """Puts transactions whose description matches `pattern` in `category` (see budget.categorization)."""
+    CONTAINS = 'contains'
+    REGEX = 'regex'
+    MATCH_TYPES = [
+        (CONTAINS, 'Contains'),
+        (REGEX, 'Regular expression'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categorization_rules', db_constraint=False)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='rules')
+    pattern = models.CharField(max_length=255)
+    match_type = models.CharField(max_length=10, choices=MATCH_TYPES, default=CONTAINS)
+    priority = models.PositiveIntegerField(default=0, help_text='Lower runs first.')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
+    class Meta:
+        ordering = ['priority', 'id']
+        indexes = [models.Index(fields=['user', 'priority'], name='budget_rule_user_priority')]
+
+    def __str__(self):
+        return f"{self.pattern} -> {self.category_id}"
+
+    def clean(self):
+        if self.match_type == self.REGEX:
+            from .categorization import regex_problem
+            try:
+                re.compile(self.pattern)
+            except re.error as exc:
+                raise ValidationError({'pattern': f"Invalid regular expression: {exc}"})
+            problem = regex_problem(self.pattern)
+            if problem:
+                raise ValidationError({'pattern': problem})
+
+
+class RecurringTransaction(models.Model):
+    """
+    A transaction, or an allocation, repeated on a schedule. budget.recurring
+    writes each occurrence once it is due.
+    """
+    ALLOCATION = 'allocation'
+    TYPES = Transaction.TRANSACTION_TYPES + [(ALLOCATION, 'Allocation')]
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+    YEARLY = 'yearly'
+    FREQUENCIES = [
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+        (MONTHLY, 'Monthly'),
+        (YEARLY, 'Yearly'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_transactions', db_constraint=False)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='recurring_transactions')
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True, related_name='recurring_transactions'
+    )
+    transaction_type = models.CharField(max_length=10, choices=TYPES)
+    amount = MoneyField()
+    description = models.CharField(max_length=255, blank=True)
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES, default=MONTHLY)
+    interval = models.PositiveSmallIntegerField(default=1, help_text='Every this many days, weeks, months or years.')
+    starts_at = models.DateTimeField(help_text='When the first occurrence is due.')
+    ends_at = models.DateTimeField(null=True, blank=True, help_text='No occurrences after this.')
+    occurrences = models.PositiveIntegerField(default=0, help_text='How many have been written so far.')
+    next_run = models.DateTimeField(help_text='When the next occurrence is due.')
+    active = models.BooleanField(default=True)
+    # The scheduler run working on this row, until lease_until.
+    claimed_by = models.CharField(max_length=32, blank=True)
+    lease_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
+    class Meta:
+        ordering = ['next_run']
+        # The rows the scheduler looks for.
+        indexes = [
+            models.Index(fields=['next_run'], condition=models.Q(active=True), name='budget_recurring_due'),
+        ]
+
+    def __str__(self):
+        return f"{self.frequency} {self.transaction_type}: ${self.amount} - {self.description}"
+
+    def occurrence(self, n):
+        """When occurrence `n` (from 0) is due. Monthly and yearly ones keep starts_at's day, or the month's last."""
+        steps = n * self.interval
+        if self.frequency == self.DAILY:
+            return self.starts_at + timedelta(days=steps)
+        if self.frequency == self.WEEKLY:
+            return self.starts_at + timedelta(weeks=steps)
+        start = timezone.localtime(self.starts_at)
+        index = start.year * 12 + start.month - 1 + steps * (12 if self.frequency == self.YEARLY else 1)
+        year, month = index // 12, index % 12 + 1
+        return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+    def set_next_run(self):
+        """Point next_run at the next occurrence, and deactivate the row once past ends_at."""
+        self.next_run = self.occurrence(self.occurrences)
+        if self.ends_at is not None and self.next_run > self.ends_at:
+            self.active = False
+
+    def save(self, *args, **kwargs):
+        self.set_next_run()
+        super().save(*args, **kwargs)
+
+
+class IdempotencyKey(models.Model):
+    """A write made with an Idempotency-Key header, and the response budget.idempotency replays to its retries."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys', db_constraint=False)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text='SHA-256 of the method, path and body.')
+    # Null only inside the transaction that is still running the request.
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    objects = LedgerQuerySet.as_manager()
+    ledger_user_lookup = 'user_id'
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'key'], name='budget_idempotency_user_key')]
+        indexes = [models.Index(fields=['user', 'expires_at'], name='budget_idempotency_user_expiry')]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
+
+
+class LedgerShardAssignment(models.Model):
+    """Pins a user's ledger to a shard other than its hashed one (see budget.sharding)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='ledger_shard')
+    alias = models.CharField(max_length=100)
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.alias}"
+
+
+class Job(models.Model):
+    """Work too slow for a request, queued for `manage.py run_jobs` (see budget.jobs)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    task = models.CharField(max_length=255, help_text='Dotted path of the function that does the job.')
+    arguments = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    priority = models.SmallIntegerField(default=0, help_text='Lower runs first.')
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text='Not claimed before this (retry backoff).')
+    # The worker running the job, until lease_until.
+    claimed_by = models.CharField(max_length=64, blank=True)
+    lease_until = models.DateTimeField(null=True, blank=True)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The queue, in the order workers claim it.
+            models.Index(fields=['priority', 'id'], condition=models.Q(status='queued'), name='budget_job_queue'),
+            models.Index(fields=['lease_until'], condition=models.Q(status='running'), name='budget_job_leases'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
@@ -0,0 +1,91 @@
+"""
+Money stored as integer cents.
+
+`MoneyField` keeps amounts in a BIGINT column of minor units. SQLite then
+stores and sums plain integers instead of REALs that Django rounds back into
+Decimals row by row, and PostgreSQL sums bigints instead of numerics. Python
+code and the API still deal in two-place Decimals: amounts become cents on
+the way in (lookups, saves) and Decimals on the way out, once per row or per
+aggregate.
+
+Inside queries a money column holds cents, so a Python amount combined with
+one in an F() expression has to go through `money()`, which gives it the
+column's conversion.
+"""
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+
+from django import forms
+from django.core import exceptions
+from django.db import models
+from django.db.models import Value
+
+CENT = Decimal('0.01')
+
+
+def to_cents(amount):
+    """`amount` (Decimal, int, str or float) as an integer number of cents, rounded half to even."""
+    if isinstance(amount, float):
+        amount = str(amount)
+    return int(Decimal(amount).quantize(CENT, rounding=ROUND_HALF_EVEN).scaleb(2))
+
+
+def from_cents(cents):
+    """Integer cents (or a database sum of them) as a two-place Decimal."""
+    return Decimal(cents).scaleb(-2)
+
+
+def money(amount):
+    """A Python amount as a query value in cents, for F() arithmetic on money columns."""
+    return Value(amount, output_field=MoneyField())
+
+
+class MoneyField(models.BigIntegerField):
+    description = 'Amount of money, stored in cents'
+    default_error_messages = {'invalid': '“%(value)s” value must be a decimal number.'}
+    # Read by DRF and forms, which present the field as a decimal.
+    decimal_places = 2
+
+    def __init__(self, *args, max_digits=10, **kwargs):
+        self.max_digits = max_digits
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.max_digits != 10:
+            kwargs['max_digits'] = self.max_digits
+        return name, path, args, kwargs
+
+    @property
+    def validators(self):
+        # The bigint range is in cents; max_digits bounds the amount instead.
+        return [*self.default_validators, *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else from_cents(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_EVEN)
+        except (InvalidOperation, ValueError):
+            raise exceptions.ValidationError(
+                self.error_messages['invalid'], code='invalid', params={'value': value},
+            )
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        try:
+            return to_cents(value)
+        except (InvalidOperation, TypeError, ValueError) as exc:
+            raise exc.__class__(f"Field '{self.name}' expected an amount but got {value!r}.") from exc
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': self.decimal_places,
+            **kwargs,
+        })
@@ -0,0 +1,12 @@
+from rest_framework import permissions
+
+from .sharding import LedgerMoving, ledger_is_moving
+
+
+class LedgerWritable(permissions.BasePermission):
+    """Refuse writes with a 503 while `move_user_shard` is copying the user's ledger."""
+
+    def has_permission(self, request, view):
+        if request.method not in permissions.SAFE_METHODS and ledger_is_moving(request.user.id):
+            raise LedgerMoving()
+        return True
@@ -0,0 +1,129 @@
+"""
+Balance reconciliation: check each account's stored balance against its
+transactions.
+
+A balance should be its opening balance (Account.opening_balance) plus the
+account's income less its expenses. The API keeps it that way as it writes
+transactions, and editing the balance through the API, or rebuilding it with
+rebuild_account_balances, moves the opening balance along. Anything else
+(admin edits, raw SQL, a bug) shows up as drift.
+
+`manage.py reconcile_balances` splits each ledger database's transactions
+into id ranges. Worker processes stream the per-account sums of their
+ranges (`net_by_account`); the sums for an account are added up and
+compared with the stored balances, read in chunks (`candidates`). Each
+account that looks off is then recounted on its own (`recheck`), so writes
+made while the scan ran aren't reported as drift. `correct` sets a drifted
+balance back under a row lock.
+
+Accounts from before opening balances were recorded have none yet:
+`record_openings` takes their current balance as correct and works the
+opening balance back from it.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, ExpressionWrapper, F, Max, Min, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Account, Transaction
+from .money import MoneyField
+
+ZERO = Decimal('0')
+
+Drift = namedtuple('Drift', 'account user stored expected')
+
+# Income adds to the balance, expenses take from it.
+SIGNED_AMOUNT = Case(
+    When(transaction_type='income', then=F('amount')),
+    default=-F('amount'),
+    output_field=MoneyField(),
+)
+
+
+def transaction_ranges(using, size):
+    """[(using, first id, last id)] covering the transactions on `using`, `size` ids each."""
+    bounds = Transaction.objects.using(using).aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return []
+    return [
+        (using, first, min(first + size - 1, bounds['last']))
+        for first in range(bounds['first'], bounds['last'] + 1, size)
+    ]
+
+
+def net_by_account(task, user_ids=None):
+    """{account id: income less expenses} over one transaction id range."""
+    using, first, last = task
+    transactions = Transaction.objects.using(using).filter(id__gte=first, id__lte=last)
+    if user_ids:
+        transactions = transactions.filter(user_id__in=user_ids)
+    sums = transactions.values('account').annotate(net=Sum(SIGNED_AMOUNT)).order_by()
+    return dict(sums.values_list('account', 'net'))
+
+
+def candidates(using, nets, user_ids=None, chunk_size=5000):
+    """
+    Yield a Drift for each account whose stored balance disagrees with
+    `nets`, the merged `net_by_account` sums. Accounts without an opening
+    balance are skipped.
+    """
+    accounts = Account.objects.using(using).filter(opening_balance__isnull=False).order_by()
+    if user_ids:
+        accounts = accounts.filter(user_id__in=user_ids)
+    rows = accounts.values_list('id', 'user_id', 'balance', 'opening_balance')
+    for account_id, user_id, balance, opening in rows.iterator(chunk_size=chunk_size):
+        expected = opening + nets.get(account_id, ZERO)
+        if balance != expected:
+            yield Drift(account_id, user_id, balance, expected)
+
+
+def _account_net(using):
+    """Subquery: the outer account's income less expenses, 0 without transactions."""
+    net = Transaction.objects.using(using).filter(account=OuterRef('pk')).order_by().values('account').annotate(
+        net=Sum(SIGNED_AMOUNT),
+    ).values('net')
+    return Coalesce(Subquery(net), Value(ZERO), output_field=MoneyField())
+
+
+def recheck(using, account_id, lock=False):
+    """The account's Drift counted from its transactions alone, or None if its balance holds."""
+    accounts = Account.objects.using(using).filter(pk=account_id, opening_balance__isnull=False)
+    if lock:
+        accounts = accounts.select_for_update()
+    row = accounts.annotate(
+        expected=ExpressionWrapper(F('opening_balance') + _account_net(using), output_field=MoneyField()),
+    ).values_list('user_id', 'balance', 'expected').first()
+    if row is None:
+        return None
+    user_id, balance, expected = row
+    return Drift(account_id, user_id, balance, expected) if balance != expected else None
+
+
+def correct(using, account_id):
+    """Set a drifted balance back to opening balance + transactions; returns the Drift fixed, or None."""
+    with transaction.atomic(using=using):
+        drift = recheck(using, account_id, lock=True)
+        if drift is not None:
+            Account.objects.using(using).filter(pk=account_id).update(balance=drift.expected)
+        return drift
+
+
+def without_opening(using, user_ids=None):
+    """Accounts with no opening balance recorded yet."""
+    accounts = Account.objects.using(using).filter(opening_balance__isnull=True)
+    if user_ids:
+        accounts = accounts.filter(user_id__in=user_ids)
+    return accounts
+
+
+def record_openings(using, user_ids=None, chunk_size=5000):
+    """Give accounts without an opening balance the one their current balance implies; returns how many."""
+    ids = list(without_opening(using, user_ids).values_list('id', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        # One statement per chunk, so a transaction written meanwhile is either in both sides or neither.
+        Account.objects.using(using).filter(id__in=ids[start:start + chunk_size], opening_balance__isnull=True).update(
+            opening_balance=F('balance') - _account_net(using),
+        )
+    return len(ids)
@@ -0,0 +1,135 @@
+"""
+Recurring transactions and scheduled allocations (RecurringTransaction).
+
+`manage.py materialize_recurring` writes every occurrence that has come due
+since the last run, each dated when it was due, so a scheduler that was down
+for a week catches up in one run. A batch of schedules is written in one
+transaction with a constant number of statements however many occurrences
+it holds: the transactions and allocations are bulk-created, each user's
+events appended together (one UPDATE per account they move, see
+budget.events), and the monthly rollups updated once per category and month.
+
+Runs may overlap (a cron that fires again before the last one finished, or
+several worker processes): a run claims a batch of due schedules by stamping
+its token and a lease on them in one UPDATE that only matches schedules that
+are unclaimed or whose lease has run out, and writes only the ones it got.
+Writing a batch locks them again and rechecks the claim, then releases it
+along with the new next_run. Claims a run leaves behind (it died, or the
+user's ledger was being moved) expire with their lease and go to the next
+run.
+
+Scheduled allocations are written whatever is available to budget at the
+time, as a plan the user made in advance.
+"""
+from datetime import timedelta
+from uuid import uuid4
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import checkpoints, events, rollups
+from .models import BudgetAllocation, LedgerEvent, RecurringTransaction, Transaction
+from .sharding import ledger_is_moving, shard_for_user
+
+
+def due(using, until):
+    """Schedules on `using` with an occurrence due by `until` that no run holds."""
+    now = timezone.now()
+    return RecurringTransaction.objects.using(using).filter(active=True, next_run__lte=until).filter(
+        Q(lease_until__isnull=True) | Q(lease_until__lte=now)
+    )
+
+
+def claim(using, token, until, lease_seconds, limit):
+    """Claim up to `limit` due schedules for the run `token`; the ids it got."""
+    ids = list(due(using, until).order_by('next_run').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    # Rechecked in the UPDATE: a concurrent run gets the rows it claimed first.
+    due(using, until).filter(id__in=ids).update(
+        claimed_by=token, lease_until=timezone.now() + timedelta(seconds=lease_seconds),
+    )
+    return list(
+        RecurringTransaction.objects.using(using).filter(id__in=ids, claimed_by=token).values_list('id', flat=True)
+    )
+
+
+def occurrence(schedule, when):
+    """The transaction or allocation `schedule` makes at `when`."""
+    if schedule.transaction_type == RecurringTransaction.ALLOCATION:
+        return BudgetAllocation(
+            account_id=schedule.account_id, category_id=schedule.category_id, amount=schedule.amount,
+            allocated_at=when,
+        )
+    return Transaction(
+        user_id=schedule.user_id, account_id=schedule.account_id, category_id=schedule.category_id,
+        transaction_type=schedule.transaction_type, amount=schedule.amount, description=schedule.description,
+        date=when,
+    )
+
+
+def _record(user_id, transactions, allocations, batch_size):
+    """Post one user's new occurrences to their ledger: events, balances, rollups and checkpoints."""
+    events.append(user_id, [
+        (LedgerEvent.TRANSACTION_CREATED, txn.pk, events.transaction_posting(txn)) for txn in transactions
+    ] + [
+        (LedgerEvent.ALLOCATION_CREATED, allocation.pk, events.allocation_posting(allocation))
+        for allocation in allocations
+    ], batch_size=batch_size)
+    rollups.add_transactions(user_id, transactions)
+    dates = [txn.date for txn in transactions] + [allocation.allocated_at for allocation in allocations]
+    checkpoints.invalidate(user_id, min(dates))
+
+
+def materialize(using, token, ids, until, batch_size=1000):
+    """
+    Write the occurrences due by `until` of the schedules `ids` claimed by
+    `token`, and release them. Returns how many occurrences were written.
+    """
+    written = {}
+    with transaction.atomic(using=using):
+        schedules = list(
+            RecurringTransaction.objects.using(using).select_for_update().filter(id__in=ids, claimed_by=token)
+        )
+        for schedule in schedules:
+            if ledger_is_moving(schedule.user_id) or shard_for_user(schedule.user_id) != using:
+                # Left claimed until the lease runs out, by when the move has finished.
+                continue
+            rows = written.setdefault(schedule.user_id, ([], []))
+            while schedule.active and schedule.next_run <= until:
+                row = occurrence(schedule, schedule.next_run)
+                rows[isinstance(row, BudgetAllocation)].append(row)
+                schedule.occurrences += 1
+                schedule.set_next_run()
+            schedule.claimed_by, schedule.lease_until = '', None
+
+        Transaction.objects.using(using).bulk_create(
+            [txn for transactions, _ in written.values() for txn in transactions], batch_size=batch_size,
+        )
+        BudgetAllocation.objects.using(using).bulk_create(
+            [allocation for _, allocations in written.values() for allocation in allocations], batch_size=batch_size,
+        )
+        for user_id, (transactions, allocations) in written.items():
+            if transactions or allocations:
+                _record(user_id, transactions, allocations, batch_size)
+        RecurringTransaction.objects.using(using).bulk_update(
+            schedules, ['occurrences', 'next_run', 'active', 'claimed_by', 'lease_until'], batch_size=batch_size,
+        )
+    return sum(len(transactions) + len(allocations) for transactions, allocations in written.values())
+
+
+def run(using, until=None, batch_size=500, lease_seconds=300):
+    """
+    Claim and write batches of schedules on `using` until none is due by
+    `until` (now by default). Returns (schedules, occurrences) written.
+    """
+    until = until or timezone.now()
+    token = uuid4().hex
+    schedules = occurrences = 0
+    while True:
+        ids = claim(using, token, until, lease_seconds, batch_size)
+        if not ids:
+            return schedules, occurrences
+        schedules += len(ids)
+        occurrences += materialize(using, token, ids, until, batch_size)
@@ -0,0 +1,137 @@
+"""
+Monthly income and spending per category (CategoryMonthRollup) for reports.
+
+Every transaction written through the API is added to (or taken out of) its
+category's row for its month, in the same transaction as the write. The
+reports then read at most one row per category per month instead of scanning
+transactions. `manage.py backfill_category_rollups` rebuilds them from the
+transactions.
+
+Months are taken in the current time zone, as TruncMonth does.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import CategoryMonthRollup, Transaction
+from .money import money
+from .sharding import shard_for_user
+
+ZERO = Decimal('0')
+
+
+def _writable(model, user_id):
+    """The user's rows of `model` on the database their ledger is written to (never a replica)."""
+    return model.objects.using(shard_for_user(user_id)).filter(**{model.ledger_user_lookup: user_id})
+
+
+def month_of(moment):
+    """First day of `moment`'s month."""
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _apply(user_id, category_id, month, income, expense, count):
+    rows = _writable(CategoryMonthRollup, user_id).filter(category_id=category_id, month=month)
+    changes = {
+        'income': F('income') + money(income), 'expense': F('expense') + money(expense), 'count': F('count') + count,
+    }
+    if rows.update(**changes):
+        if count < 0:
+            rows.filter(count=0).delete()
+        return
+    try:
+        with transaction.atomic(using=rows.db):
+            CategoryMonthRollup.objects.using(rows.db).create(
+                user_id=user_id, category_id=category_id, month=month,
+                income=income, expense=expense, count=count,
+            )
+    except IntegrityError:
+        # Another request created the row first.
+        rows.update(**changes)
+
+
+def add_transaction(txn, sign=1):
+    amount = txn.amount * sign
+    income, expense = (amount, ZERO) if txn.transaction_type == 'income' else (ZERO, amount)
+    _apply(txn.user_id, txn.category_id, month_of(txn.date), income, expense, sign)
+
+
+def remove_transaction(txn):
+    add_transaction(txn, sign=-1)
+
+
+def add_transactions(user_id, transactions):
+    """Add a batch of the user's new transactions, with one update per category and month."""
+    totals = {}
+    for txn in transactions:
+        key = (txn.category_id, month_of(txn.date))
+        income, expense, count = totals.get(key, (ZERO, ZERO, 0))
+        if txn.transaction_type == 'income':
+            income += txn.amount
+        else:
+            expense += txn.amount
+        totals[key] = (income, expense, count + 1)
+    for (category_id, month), (income, expense, count) in totals.items():
+        _apply(user_id, category_id, month, income, expense, count)
+
+
+def monthly_totals(transactions):
+    """Transactions grouped into rollup rows: category, month, income, expense, count."""
+    return transactions.values(
+        'category', rollup_month=TruncMonth('date', output_field=DateField()),
+    ).annotate(
+        income=Sum('amount', filter=Q(transaction_type='income'), default=ZERO),
+        expense=Sum('amount', filter=Q(transaction_type='expense'), default=ZERO),
+        count=Count('id'),
+    ).order_by()
+
+
+def categorized(user_id, transactions):
+    """Move `transactions`' totals from uncategorized to the categories they have just been given."""
+    uncategorized = {}
+    for row in monthly_totals(transactions):
+        month = row['rollup_month']
+        _apply(user_id, row['category'], month, row['income'], row['expense'], row['count'])
+        income, expense, count = uncategorized.get(month, (ZERO, ZERO, 0))
+        uncategorized[month] = (income + row['income'], expense + row['expense'], count + row['count'])
+    for month, (income, expense, count) in uncategorized.items():
+        _apply(user_id, None, month, -income, -expense, -count)
+
+
+def remove_account(account):
+    """Take out the transactions deleting `account` will cascade to."""
+    for row in monthly_totals(_writable(Transaction, account.user_id).filter(account=account)):
+        _apply(account.user_id, row['category'], row['rollup_month'], -row['income'], -row['expense'], -row['count'])
+
+
+def uncategorize(category):
+    """Move `category`'s totals to uncategorized, as deleting it does to its transactions."""
+    rollups = _writable(CategoryMonthRollup, category.user_id).filter(category=category)
+    for rollup in rollups:
+        _apply(category.user_id, None, rollup.month, rollup.income, rollup.expense, rollup.count)
+    rollups.delete()
+
+
+def rebuild(user_id, batch_size=1000):
+    """Recompute a user's rollups from their transactions; returns how many rows were written."""
+    rollups = [
+        CategoryMonthRollup(
+            user_id=user_id, category_id=row['category'], month=row['rollup_month'],
+            income=row['income'], expense=row['expense'], count=row['count'],
+        )
+        for row in monthly_totals(_writable(Transaction, user_id))
+    ]
+    using = shard_for_user(user_id)
+    with transaction.atomic(using=using):
+        _writable(CategoryMonthRollup, user_id).delete()
+        CategoryMonthRollup.objects.using(using).bulk_create(rollups, batch_size=batch_size)
+    return len(rollups)
@@ -0,0 +1,121 @@
+"""
+Database routing: per-user ledger shards, then primary/replica.
+
+LedgerShardRouter sends the ledger models to the shard holding the owning
+user's ledger (see budget.sharding) and has no opinion on anything else.
+
+PrimaryReplicaRouter sends other reads to a replica from
+settings.DATABASE_REPLICAS unless the current context is pinned to the
+primary. Writes, and every read inside a `transaction.atomic` block, always
+use the primary.
+
+`PrimaryAfterWriteMixin` (views.py) pins write requests, and pins all requests
+from a user for REPLICA_STICKY_SECONDS after that user's last successful
+write, so clients read their own writes while replicas catch up. The
+stickiness marker lives in the default cache, which must be shared between
+workers (Redis, memcached, database cache) for it to hold across processes.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .sharding import current_shard, shard_for_user
+
+LEDGER_MODELS = (
+    'account', 'category', 'budgetallocation', 'transaction', 'categorymonthrollup', 'categorizationrule',
+    'ledgercheckpoint', 'accountbalancerebuild', 'ledgerstream', 'ledgerevent', 'ledgersnapshot', 'idempotencykey',
+    'recurringtransaction',
+)
+
+_pinned = ContextVar('budget_db_pinned', default=False)
+
+
+def _sticky_key(user_id):
+    return f'budget:primary-pin:{user_id}'
+
+
+def pin_to_primary(pinned=True):
+    """Pin (or unpin) reads in the current context; returns a token for `unpin`."""
+    return _pinned.set(pinned)
+
+
+def unpin(token):
+    _pinned.reset(token)
+
+
+def record_write(user_id):
+    if settings.DATABASE_REPLICAS:
+        cache.set(_sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def recently_wrote(user_id):
+    return bool(settings.DATABASE_REPLICAS) and cache.get(_sticky_key(user_id), False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary's rows.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def _is_ledger(model):
+    return model._meta.app_label == 'budget' and model._meta.model_name in LEDGER_MODELS
+
+
+class LedgerShardRouter:
+    """
+    Queries pick their shard explicitly through `LedgerQuerySet.for_user`;
+    saves and related lookups find it from the instance hint, and anything
+    else falls back to the shard `LedgerShardMixin` set for the request.
+    """
+
+    def _db_for_instance(self, instance):
+        if instance is None:
+            return current_shard()
+        # A user hints their own ledger rows: `Account(user=user)`, `user.accounts`.
+        if instance._meta.label_lower == settings.AUTH_USER_MODEL.lower():
+            return shard_for_user(instance.pk)
+        if instance._state.db:
+            return instance._state.db
+        user_id = getattr(instance, 'user_id', None)
+        if user_id is not None:
+            return shard_for_user(user_id)
+        account = instance._state.fields_cache.get('account')
+        if account is not None:
+            return account._state.db
+        return current_shard()
+
+    def db_for_read(self, model, **hints):
+        if settings.LEDGER_SHARDS and _is_ledger(model):
+            return self._db_for_instance(hints.get('instance'))
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if settings.LEDGER_SHARDS and _is_ledger(type(obj1)) and _is_ledger(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in settings.LEDGER_SHARDS:
+            return None
+        return app_label == 'budget' and model_name in LEDGER_MODELS
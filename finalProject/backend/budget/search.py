@@ -0,0 +1,158 @@
+"""
+Full-text search over transaction descriptions.
+
+SQLite: an external-content FTS5 table, budget_transaction_fts, indexes each
+transaction's description and user id. Triggers on budget_transaction keep it
+in sync. Queries join it through the unmanaged TransactionSearchIndex model.
+The match includes the user id, so FTS only returns the searching user's
+rows. PostgreSQL: a GIN index on to_tsvector('simple', description).
+
+`install` runs after every migrate (see BudgetConfig.ready). It is
+idempotent. On SQLite it rebuilds the index when the triggers are missing,
+e.g. after a migration remade the transactions table. Other backends fall
+back to `icontains`.
+
+Search text is split into words, and a row must contain all of them. Results
+are ordered best match first (bm25 / ts_rank), then newest first. With
+`prefix` the words match the start of a word too ("coff" finds "coffee"), as
+the admin's search box needs.
+"""
+import re
+
+from django.db import connections, router
+from django.db import models
+from django.db.models import BooleanField, F, FloatField, Lookup, Q
+from django.db.models.expressions import RawSQL
+
+_WORD = re.compile(r'\w+')
+
+FTS_TABLE = 'budget_transaction_fts'
+
+_SQLITE_TRIGGERS = {
+    'budget_transaction_fts_ai': f"""
+        CREATE TRIGGER budget_transaction_fts_ai AFTER INSERT ON budget_transaction BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+        END""",
+    'budget_transaction_fts_ad': f"""
+        CREATE TRIGGER budget_transaction_fts_ad AFTER DELETE ON budget_transaction BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, user_id)
+            VALUES ('delete', old.id, old.description, old.user_id);
+        END""",
+    'budget_transaction_fts_au': f"""
+        CREATE TRIGGER budget_transaction_fts_au AFTER UPDATE OF description, user_id ON budget_transaction BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, user_id)
+            VALUES ('delete', old.id, old.description, old.user_id);
+            INSERT INTO {FTS_TABLE}(rowid, description, user_id) VALUES (new.id, new.description, new.user_id);
+        END""",
+}
+
+_POSTGRES_INDEX = (
+    "CREATE INDEX IF NOT EXISTS budget_txn_description_fts "
+    "ON budget_transaction USING GIN (to_tsvector('simple', description))"
+)
+
+
+def install(using, **kwargs):
+    """post_migrate hook: create the search index and its triggers where missing."""
+    from .models import Transaction
+
+    if not router.allow_migrate_model(using, Transaction):
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(_POSTGRES_INDEX)
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                           [f'{FTS_TABLE}%'])
+            existing = {name for name, in cursor.fetchall()}
+            missing = [name for name in _SQLITE_TRIGGERS if name not in existing]
+            if not missing and FTS_TABLE in existing:
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"description, user_id, content='budget_transaction', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            for name in missing:
+                cursor.execute(_SQLITE_TRIGGERS[name])
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def words(text):
+    return _WORD.findall(text.lower())
+
+
+def _fts5_query(terms, user_id, prefix=False):
+    star = '*' if prefix else ''
+    quoted = ' '.join(f'"{term}"{star}' for term in terms)
+    query = f'description:({quoted})'
+    return query if user_id is None else f'user_id:"{int(user_id)}" AND {query}'
+
+
+class MatchField(models.TextField):
+    """An FTS5 table's hidden column of the same name, which takes `__match`."""
+
+
+@MatchField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+def _conditions(queryset, text, user_id, prefix=False):
+    """(filter condition, rank expression or None) for `text`; None if it has no words."""
+    terms = words(text)
+    if not terms:
+        return None
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        # Joined rather than used in a subquery, so FTS5 works out bm25's
+        # statistics once per query instead of once per row.
+        return Q(search_index__document__match=_fts5_query(terms, user_id, prefix)), F('search_index__rank')
+    if vendor == 'postgresql':
+        if prefix:
+            # The terms are \w+ words, so they need no quoting inside to_tsquery.
+            tsquery, query = "to_tsquery('simple', %s)", ' & '.join(f'{term}:*' for term in terms)
+        else:
+            tsquery, query = "plainto_tsquery('simple', %s)", ' '.join(terms)
+        matched = RawSQL(f"to_tsvector('simple', description) @@ {tsquery}", [query], output_field=BooleanField())
+        # ts_rank grows with relevance; negate it so both backends sort ascending.
+        rank = RawSQL(
+            f"-ts_rank(to_tsvector('simple', description), {tsquery})", [query], output_field=FloatField()
+        )
+        return matched, rank
+    condition = Q()
+    for term in terms:
+        condition &= Q(description__icontains=term)
+    return condition, None
+
+
+def matching(queryset, text, user_id=None, prefix=False):
+    """
+    `queryset` narrowed to rows whose description contains every word of
+    `text`, and empty when `text` has no words. The match runs in a subquery,
+    so the result can be OR-ed with other filters (FTS5 refuses MATCH inside
+    an OR).
+    """
+    conditions = _conditions(queryset, text, user_id, prefix)
+    if conditions is None:
+        return queryset.none()
+    matched = queryset.model._base_manager.using(queryset.db).filter(conditions[0]).values('pk')
+    return queryset.filter(pk__in=matched)
+
+
+def search(queryset, text, user_id=None):
+    """`matching`, ordered best match first, then newest first."""
+    conditions = _conditions(queryset, text, user_id)
+    if conditions is None:
+        return queryset.none()
+    condition, rank = conditions
+    queryset = queryset.filter(condition)
+    if rank is None:
+        return queryset
+    return queryset.annotate(search_rank=rank).order_by('search_rank', '-date')
@@ -1,14 +1,58 @@
-from decimal import Decimal
+from asgiref.sync import sync_to_async
 from rest_framework import serializers
-from rest_framework.validators import UniqueValidator
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.contrib.auth.password_validation import validate_password
-from django.db.models import Sum
-from .models import Account, Category, BudgetAllocation, Transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from .authentication import ahash_password, hash_password
+from .categorization import category_for
+from .fieldsets import SparseFieldsMixin
+from .ledger import LedgerTotals, account_balance
+from .models import Account, Category, BudgetAllocation, CategorizationRule, Job, RecurringTransaction, Transaction
+from .money import MoneyField
+
+
+class OwnerField(serializers.ReadOnlyField):
+    """
+    The owning user's username. Rows served to their owner take it from the
+    request user, so listing them never loads `User` (which may live on
+    another database than a sharded ledger).
+    """
+
+    def get_attribute(self, instance):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and instance.user_id == user.id:
+            return user.username
+        return instance.user.username
+
 
+class LedgerRelatedFieldsMixin:
+    """Resolve related ledger ids on the database holding the request user's ledger."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            for field in fields.values():
+                queryset = getattr(field, 'queryset', None)
+                if hasattr(queryset, 'on_user_shard'):
+                    field.queryset = queryset.on_user_shard(request.user.id)
+        return fields
 
-class AccountSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.username')
+
+class MoneyFieldsMixin:
+    """Serialize MoneyField columns as decimal amounts rather than the cents they are stored in."""
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        MoneyField: serializers.DecimalField,
+    }
+
+
+class AccountSerializer(SparseFieldsMixin, MoneyFieldsMixin, serializers.ModelSerializer):
+    user = OwnerField()
 
     class Meta:
         model = Account
@@ -16,8 +60,8 @@ class AccountSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class CategorySerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.username')
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user = OwnerField()
 
     class Meta:
         model = Category
@@ -25,7 +69,8 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class BudgetAllocationSerializer(serializers.ModelSerializer):
+class BudgetAllocationSerializer(SparseFieldsMixin, LedgerRelatedFieldsMixin, MoneyFieldsMixin,
+                                 serializers.ModelSerializer):
     category_name = serializers.ReadOnlyField(source='category.name')
     account_name = serializers.ReadOnlyField(source='account.name')
 
@@ -42,9 +87,9 @@ class BudgetAllocationSerializer(serializers.ModelSerializer):
         amount = data.get('amount')
 
         if user:
-            if account and account.user != user:
+            if account and account.user_id != user.id:
                 raise serializers.ValidationError("Account does not belong to the authenticated user.")
-            if category and category.user != user:
+            if category and category.user_id != user.id:
                 raise serializers.ValidationError("Category does not belong to the authenticated user.")
 
         if amount <= 0:
@@ -52,20 +97,7 @@ class BudgetAllocationSerializer(serializers.ModelSerializer):
 
         # Calculate Available to Budget (total account balance - total allocated + total spent)
         if user:
-            total_account_balance = Account.objects.filter(user=user).aggregate(
-                total=Sum('balance')
-            )['total'] or Decimal('0')
-
-            total_allocated = BudgetAllocation.objects.filter(
-                account__user=user
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-            total_spent = Transaction.objects.filter(
-                user=user,
-                transaction_type='expense'
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-            available_to_budget = total_account_balance - total_allocated + total_spent
+            available_to_budget = LedgerTotals(user.id).available_to_budget(account_balance(user.id))
 
             if amount > available_to_budget:
                 available_display = format(available_to_budget, '.2f')
@@ -77,8 +109,8 @@ class BudgetAllocationSerializer(serializers.ModelSerializer):
         return data
 
 
-class TransactionSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.username')
+class TransactionSerializer(SparseFieldsMixin, LedgerRelatedFieldsMixin, MoneyFieldsMixin, serializers.ModelSerializer):
+    user = OwnerField()
     category_name = serializers.ReadOnlyField(source='category.name')
     account_name = serializers.ReadOnlyField(source='account.name')
 
@@ -99,7 +131,10 @@ class TransactionSerializer(serializers.ModelSerializer):
         if account is None:
             raise serializers.ValidationError("Account is required.")
 
-        if user and account.user != user:
+        if category is None and self.instance is None and user:
+            category = data['category'] = category_for(user.id, data.get('description'))
+
+        if user and account.user_id != user.id:
             raise serializers.ValidationError("Account does not belong to the authenticated user.")
 
         if amount <= 0:
@@ -109,14 +144,112 @@ class TransactionSerializer(serializers.ModelSerializer):
             if category is None:
                 raise serializers.ValidationError("Category is required for expenses.")
 
-            if user and category.user != user:
+            if user and category.user_id != user.id:
                 raise serializers.ValidationError("Category does not belong to the authenticated user.")
-        elif transaction_type == 'income' and category is not None and user and category.user != user:
+        elif transaction_type == 'income' and category is not None and user and category.user_id != user.id:
             raise serializers.ValidationError("Category does not belong to the authenticated user.")
 
         return data
 
 
+class RecurringTransactionSerializer(SparseFieldsMixin, LedgerRelatedFieldsMixin, MoneyFieldsMixin,
+                                     serializers.ModelSerializer):
+    category_name = serializers.ReadOnlyField(source='category.name')
+    account_name = serializers.ReadOnlyField(source='account.name')
+
+    # Changing these would move occurrences already written.
+    SCHEDULE_FIELDS = ['frequency', 'interval', 'starts_at']
+
+    class Meta:
+        model = RecurringTransaction
+        fields = ['id', 'category', 'category_name', 'account', 'account_name', 'transaction_type', 'amount',
+                  'description', 'frequency', 'interval', 'starts_at', 'ends_at', 'occurrences', 'next_run',
+                  'active', 'created_at']
+        read_only_fields = ['id', 'occurrences', 'next_run', 'created_at']
+
+    def validate(self, data):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+
+        def value(name):
+            return data[name] if name in data else getattr(self.instance, name, None)
+
+        account = value('account')
+        category = value('category')
+
+        if user:
+            if account and account.user_id != user.id:
+                raise serializers.ValidationError("Account does not belong to the authenticated user.")
+            if category and category.user_id != user.id:
+                raise serializers.ValidationError("Category does not belong to the authenticated user.")
+
+        if value('amount') <= 0:
+            raise serializers.ValidationError("Amount must be greater than zero.")
+
+        if value('interval') is not None and value('interval') < 1:
+            raise serializers.ValidationError("Interval must be at least 1.")
+
+        if value('transaction_type') in ('expense', RecurringTransaction.ALLOCATION) and category is None:
+            raise serializers.ValidationError("Category is required for expenses and allocations.")
+
+        if value('ends_at') is not None and value('starts_at') and value('ends_at') < value('starts_at'):
+            raise serializers.ValidationError("The schedule must end after it starts.")
+
+        if self.instance is not None and self.instance.occurrences and any(
+            name in data and data[name] != getattr(self.instance, name) for name in self.SCHEDULE_FIELDS
+        ):
+            raise serializers.ValidationError(
+                "The schedule of a recurring transaction that has run can't change. End it and create a new one."
+            )
+
+        return data
+
+
+class CategorizationRuleSerializer(SparseFieldsMixin, LedgerRelatedFieldsMixin, serializers.ModelSerializer):
+    category_name = serializers.ReadOnlyField(source='category.name')
+
+    class Meta:
+        model = CategorizationRule
+        fields = ['id', 'category', 'category_name', 'pattern', 'match_type', 'priority', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+    def validate_pattern(self, value):
+        if not value.strip():
+            raise serializers.ValidationError("Pattern must not be blank.")
+        return value
+
+    def validate(self, data):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        category = data.get('category')
+        if user and category and category.user_id != user.id:
+            raise serializers.ValidationError("Category does not belong to the authenticated user.")
+
+        rule = CategorizationRule(
+            pattern=data.get('pattern', getattr(self.instance, 'pattern', '')),
+            match_type=data.get('match_type', getattr(self.instance, 'match_type', CategorizationRule.CONTAINS)),
+        )
+        try:
+            rule.clean()
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.message_dict)
+        return data
+
+
+class JobSerializer(serializers.ModelSerializer):
+    # The exception, without the traceback (that stays in the admin).
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'task', 'status', 'attempts', 'max_attempts', 'progress', 'total', 'result', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_error(self, job):
+        return job.error.strip().splitlines()[-1] if job.error else ''
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -125,10 +258,9 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class RegisterSerializer(serializers.ModelSerializer):
-    email = serializers.EmailField(
-        required=True,
-        validators=[UniqueValidator(queryset=User.objects.all())]
-    )
+    # Uniqueness of username and email is checked together in validate().
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(required=True)
     password = serializers.CharField(
         write_only=True,
         required=True,
@@ -136,6 +268,8 @@ class RegisterSerializer(serializers.ModelSerializer):
     )
     password_confirm = serializers.CharField(write_only=True, required=True)
 
+    username_taken = User._meta.get_field('username').error_messages['unique']
+
     class Meta:
         model = User
         fields = ['username', 'email', 'password', 'password_confirm']
@@ -143,13 +277,36 @@ class RegisterSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         if attrs['password'] != attrs['password_confirm']:
             raise serializers.ValidationError({"password": "Passwords do not match"})
+
+        # Checked as stored, so names differing only in Unicode form collide.
+        attrs['username'] = User.normalize_username(attrs['username'])
+        attrs['email'] = User.objects.normalize_email(attrs['email'])
+        errors = {}
+        taken = User.objects.filter(
+            Q(username=attrs['username']) | Q(email=attrs['email'])
+        ).values_list('username', 'email')
+        for username, email in taken:
+            if username == attrs['username']:
+                errors['username'] = [self.username_taken]
+            if email == attrs['email']:
+                errors['email'] = ['This field must be unique.']
+        if errors:
+            raise serializers.ValidationError(errors)
         return attrs
 
-    def create(self, validated_data):
-        validated_data.pop('password_confirm')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password']
-        )
+    def _save(self, validated_data, encoded_password):
+        user = User(username=validated_data['username'], email=validated_data['email'], password=encoded_password)
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            # A concurrent registration took the username after validate().
+            raise serializers.ValidationError({'username': [self.username_taken]})
         return user
+
+    def create(self, validated_data):
+        return self._save(validated_data, hash_password(validated_data['password']))
+
+    async def acreate(self, validated_data):
+        """create() with the hash awaited on the hashing pool (async_views.register)."""
+        return await sync_to_async(self._save)(validated_data, await ahash_password(validated_data['password']))
@@ -0,0 +1,149 @@
+"""
+Per-user placement of the budget ledger across settings.LEDGER_SHARDS.
+
+Every ledger row belongs to exactly one user, so each user's accounts,
+categories, allocations and transactions live together on one database,
+chosen by a stable hash of the user id. `LedgerShardAssignment` rows (on the
+default database) override the hash for users moved by `move_user_shard`.
+Each process caches a user's assignment in the default cache for
+LEDGER_ASSIGNMENT_CACHE_SECONDS, so moves need a cache shared by every
+process (see `shared_cache`).
+
+With no shards configured every user maps to the default database and the
+rest of this module is inert.
+"""
+import zlib
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from rest_framework.exceptions import APIException
+
+# Each shard allocates primary keys from its own range so rows keep their ids
+# when a user is moved to another shard.
+SHARD_ID_RANGE = 10 ** 12
+
+_request_shard = ContextVar('budget_request_shard', default=None)
+
+
+class LedgerMoving(APIException):
+    status_code = 503
+    default_detail = 'Your budget is being moved. Try again in a few seconds.'
+    default_code = 'ledger_moving'
+
+
+def _assignment_key(user_id):
+    return f'budget:ledger-shard:{user_id}'
+
+
+def hashed_shard(user_id):
+    shards = settings.LEDGER_SHARDS
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def _assignment(user_id):
+    """(alias, moving) for the user: the override row if any, else the hash."""
+    cached = cache.get(_assignment_key(user_id))
+    if cached is None:
+        from .models import LedgerShardAssignment
+        row = LedgerShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(
+            user_id=user_id
+        ).values_list('alias', 'moving').first()
+        cached = row or (hashed_shard(user_id), False)
+        cache.set(_assignment_key(user_id), cached, settings.LEDGER_ASSIGNMENT_CACHE_SECONDS)
+    return cached
+
+
+def shard_for_user(user_id):
+    if not settings.LEDGER_SHARDS:
+        return DEFAULT_DB_ALIAS
+    return _assignment(user_id)[0]
+
+
+async def ashard_for_user(user_id):
+    """shard_for_user for async views: looking up the assignment may query the database."""
+    if not settings.LEDGER_SHARDS:
+        return DEFAULT_DB_ALIAS
+    return await sync_to_async(shard_for_user)(user_id)
+
+
+def use_user_shard(user_id):
+    """
+    Send ledger queries with no other routing hint (e.g. DRF's
+    `QuerySet.create`) to this user's shard for the current context.
+    Returns a token for `release_user_shard`.
+    """
+    return _request_shard.set(shard_for_user(user_id) if settings.LEDGER_SHARDS else None)
+
+
+def release_user_shard(token):
+    _request_shard.reset(token)
+
+
+def current_shard():
+    return _request_shard.get()
+
+
+def ledger_is_moving(user_id):
+    return bool(settings.LEDGER_SHARDS) and _assignment(user_id)[1]
+
+
+def shared_cache():
+    """Whether the default cache is seen by every process, not a copy per process."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def set_assignment(user_id, alias, moving):
+    from .models import LedgerShardAssignment
+    LedgerShardAssignment.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={'alias': alias, 'moving': moving},
+    )
+    cache.delete(_assignment_key(user_id))
+
+
+def ledger_atomic(user_id):
+    """transaction.atomic on the database holding this user's ledger."""
+    return transaction.atomic(using=shard_for_user(user_id))
+
+
+def atomic_ledger(view_method):
+    """@transaction.atomic for viewset methods, on the request user's ledger database."""
+    @wraps(view_method)
+    def wrapper(view, *args, **kwargs):
+        with ledger_atomic(view.request.user.id):
+            return view_method(view, *args, **kwargs)
+    return wrapper
+
+
+def seed_shard_sequences(using, **kwargs):
+    """
+    post_migrate hook: start each shard's id sequences at its own range so
+    ids stay unique across shards.
+    """
+    if using not in settings.LEDGER_SHARDS:
+        return
+    from .routers import LEDGER_MODELS
+    from django.apps import apps
+
+    base = (settings.LEDGER_SHARDS.index(using) + 1) * SHARD_ID_RANGE
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model_name in LEDGER_MODELS:
+            table = apps.get_model('budget', model_name)._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s AND seq < %s', [table, base])
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, base, table],
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {table})))",
+                    [base],
+                )
@@ -1,9 +1,53 @@
+import gzip
+import re
+import tempfile
+import threading
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, time, timedelta
 from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.signals import user_login_failed
 from django.contrib.auth.models import User
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
-from .models import Account, Category, BudgetAllocation, Transaction
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
+from .admin import TransactionAdmin
+from .authentication import tokens_for_user
+from .categorization import Matcher, regex_problem
+from .filters import transaction_lookups
+from .idempotency import fingerprint
+from .middleware import CompressionMiddleware
+from . import balances, checkpoints, events, jobs, recurring, rollups
+from .models import (
+    Account, AccountBalanceRebuild, Category, BudgetAllocation, CategoryMonthRollup, IdempotencyKey, Job,
+    LedgerCheckpoint, LedgerEvent, LedgerSnapshot, RecurringTransaction, Transaction,
+)
+from .renderers import ORJSONParser, ORJSONRenderer
+from .serializers import BudgetAllocationSerializer, RegisterSerializer, TransactionSerializer
+from .search import install as install_search
+from .routers import PrimaryReplicaRouter, pin_to_primary, unpin
+from .sharding import (
+    SHARD_ID_RANGE, hashed_shard, release_user_shard, set_assignment, shard_for_user, use_user_shard,
+)
+from django.conf import settings
+from django.contrib.admin.sites import AdminSite
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
 from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.cache import CacheMiddleware
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from types import SimpleNamespace
+from unittest import skipIf, skipUnless
+from unittest.mock import patch
 
 
 API_PREFIX = "/api"
@@ -13,7 +57,28 @@ def api_url(path: str) -> str:
     return f"{API_PREFIX}{path}"
 
 
-class AuthTests(APITestCase):
+@contextmanager
+def captured_queries(aliases):
+    """The queries run on any of the databases `aliases` inside the block."""
+    queries = []
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in sorted(aliases)]
+        yield queries
+    for context in contexts:
+        queries.extend(context.captured_queries)
+
+
+class LedgerTestCase(APITestCase):
+    """APITestCase that may also query the ledger shards, when BUDGET_LEDGER_SHARDS configures them."""
+    databases = {DEFAULT_DB_ALIAS, *settings.LEDGER_SHARDS}
+
+    def use_ledger_of(self, user):
+        """Send the test's own ledger queries to `user`'s shard, as their requests are."""
+        self.ledger_db = shard_for_user(user.id)
+        self.addCleanup(release_user_shard, use_user_shard(user.id))
+
+
+class AuthTests(LedgerTestCase):
     def test_register_login_and_me(self):
         register_payload = {
             "username": "testuser",
@@ -36,7 +101,187 @@ class AuthTests(APITestCase):
         self.assertEqual(me_resp.data["username"], "testuser")
 
 
-class BaseBudgetTestCase(APITestCase):
+class RegistrationTests(LedgerTestCase):
+    def register(self, username, email):
+        return self.client.post(
+            api_url("/auth/register/"),
+            {"username": username, "email": email, "password": "StrongPass123!", "password_confirm": "StrongPass123!"},
+            format="json",
+        )
+
+    def test_duplicates_rejected_with_one_query(self):
+        User.objects.create_user("frank", email="frank@test.com", password="pass1234!")
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.register("frank", "frank@test.com")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("username", resp.data)
+        self.assertIn("email", resp.data)
+
+        resp = self.register("frank2", "frank@test.com")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn("username", resp.data)
+
+    def test_usernames_compared_as_stored(self):
+        User.objects.create_user("fiona", password="pass1234!")
+        # "ﬁ" is a ligature that NFKC normalization turns into "fi".
+        resp = self.register("ﬁona", "fiona@test.com")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("username", resp.data)
+
+    def test_concurrent_registration_is_rejected(self):
+        # The other registration commits between this one's check and its insert.
+        with patch.object(RegisterSerializer, "validate", lambda serializer, attrs: attrs):
+            User.objects.create_user("frank", password="pass1234!")
+            for path in ["/auth/register/", "/auth/register/async/"]:
+                resp = self.client.post(api_url(path), {
+                    "username": "frank", "email": "frank@test.com",
+                    "password": "StrongPass123!", "password_confirm": "StrongPass123!",
+                }, format="json")
+                self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(resp.json(), {"username": ["A user with that username already exists."]})
+
+    def test_common_passwords_preloaded(self):
+        from django.contrib.auth.password_validation import (
+            CommonPasswordValidator, get_default_password_validators,
+        )
+        from .apps import warm_up
+
+        warm_up()
+        common = next(v for v in get_default_password_validators() if isinstance(v, CommonPasswordValidator))
+        self.assertIsInstance(common.passwords, frozenset)
+
+
+class PasswordHashingTests(LedgerTestCase):
+    def test_login_rehashes_legacy_hash(self):
+        user = User.objects.create(username="dave", password=make_password("pass1234!", hasher="pbkdf2_sha256"))
+        resp = self.client.post(api_url("/auth/login/"), {"username": "dave", "password": "pass1234!"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith(f"{get_hasher().algorithm}$"))
+
+    def test_wrong_password_keeps_hash(self):
+        encoded = make_password("pass1234!", hasher="pbkdf2_sha256")
+        user = User.objects.create(username="dave", password=encoded)
+        resp = self.client.post(api_url("/auth/login/"), {"username": "dave", "password": "nope"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+        user.refresh_from_db()
+        self.assertEqual(user.password, encoded)
+
+    def test_async_login(self):
+        User.objects.create_user("erin", password="pass1234!")
+        resp = self.client.post(
+            api_url("/auth/login/async/"), {"username": "erin", "password": "pass1234!"}, format="json"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()["user"]["username"], "erin")
+        self.assertIn("access", resp.json()["tokens"])
+
+        bad = self.client.post(
+            api_url("/auth/login/async/"), {"username": "erin", "password": "wrong"}, format="json"
+        )
+        self.assertEqual(bad.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_async_register(self):
+        payload = {
+            "username": "gina", "email": "gina@test.com", "password": "StrongPass123!",
+            "password_confirm": "StrongPass123!",
+        }
+        resp = self.client.post(api_url("/auth/register/async/"), payload, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.json()["user"]["username"], "gina")
+        self.assertIn("access", resp.json()["tokens"])
+        self.assertTrue(User.objects.get(username="gina").check_password("StrongPass123!"))
+
+        again = self.client.post(api_url("/auth/register/async/"), payload, format="json")
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("username", again.json())
+
+    def test_login_goes_through_authenticate(self):
+        User.objects.create_user("frank", password="pass1234!", is_active=False)
+        failed = []
+        user_login_failed.connect(lambda sender, credentials, **kwargs: failed.append(credentials["username"]),
+                                  weak=False, dispatch_uid="test-login-failed")
+        self.addCleanup(user_login_failed.disconnect, dispatch_uid="test-login-failed")
+        for path in ("/auth/login/", "/auth/login/async/"):
+            resp = self.client.post(api_url(path), {"username": "frank", "password": "pass1234!"}, format="json")
+            self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(failed, ["frank", "frank"])
+
+
+class StatelessAuthTests(LedgerTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("carol", email="carol@test.com", password="pass1234!")
+        self.use_ledger_of(self.user)
+        access = tokens_for_user(self.user)["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_list_does_not_load_user_row(self):
+        Account.objects.create(user=self.user, name="Checking", balance=Decimal("10"))
+        Account.objects.create(user=self.user, name="Savings", balance=Decimal("20"))
+        with captured_queries(self.databases) as queries:
+            resp = self.client.get(api_url("/accounts/"))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.data), 2)
+        self.assertEqual(len(queries), 1)
+
+    def test_untracked_attributes_load_lazily(self):
+        resp = self.client.get(api_url("/auth/me/"))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data["id"], self.user.id)
+        self.assertEqual(resp.data["email"], "carol@test.com")
+
+    def test_create_assigns_token_user(self):
+        resp = self.client.post(api_url("/accounts/"), {"name": "Savings", "balance": "5.00"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data["user"], "carol")
+        self.assertTrue(Account.objects.filter(user=self.user, name="Savings").exists())
+
+
+class AsyncReadTests(LedgerTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("frank", password="pass1234!")
+        self.use_ledger_of(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user)['access']}")
+        account = Account.objects.create(user=self.user, name="Checking", balance=Decimal("500.00"))
+        Account.objects.create(user=self.user, name="Savings", balance=Decimal("20.00"))
+        for name, allocated, spent in [("Food", "100", "30"), ("Rent", "400", "0")]:
+            category = Category.objects.create(user=self.user, name=name)
+            BudgetAllocation.objects.create(category=category, account=account, amount=Decimal(allocated))
+            Transaction.objects.create(
+                user=self.user, account=account, category=category,
+                transaction_type="expense", amount=Decimal(spent),
+            )
+        other = User.objects.create_user("grace", password="pass1234!")
+        Account.objects.create(user=other, name="Hidden", balance=Decimal("1.00"))
+
+    def test_account_list_matches_sync(self):
+        resp = self.client.get(api_url("/accounts/async/"))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), self.client.get(api_url("/accounts/")).json())
+
+    def test_category_balances_match_sync(self):
+        resp = self.client.get(api_url("/categories/balances/async/"))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), self.client.get(api_url("/categories/balances/")).json())
+
+    def test_requires_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get(api_url("/accounts/async/")).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer nope")
+        self.assertEqual(self.client.get(api_url("/accounts/async/")).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(LEDGER_SHARDS=[DEFAULT_DB_ALIAS])
+class ShardedAsyncReadTests(AsyncReadTests):
+    """The async views with shards configured, where finding the user's shard queries the database."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class BaseBudgetTestCase(LedgerTestCase):
     def setUp(self):
         super().setUp()
         self.user = User.objects.create_user(
@@ -44,6 +289,7 @@ class BaseBudgetTestCase(APITestCase):
             email="alice@test.com",
             password="pass1234!",
         )
+        self.use_ledger_of(self.user)
         self.client.force_authenticate(user=self.user)
 
     def create_account(self, name="Checking", balance=Decimal("1000.00")) -> Account:
@@ -52,6 +298,12 @@ class BaseBudgetTestCase(APITestCase):
     def create_category(self, name="Groceries") -> Category:
         return Category.objects.create(user=self.user, name=name)
 
+    def run_job(self, resp):
+        """Run the jobs queued, as `manage.py run_jobs` would, and poll the one `resp` accepted."""
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        jobs.work(burst=True)
+        return self.client.get(resp["Location"]).data
+
 
 class AccountCategoryTests(BaseBudgetTestCase):
     def test_account_crud_and_isolation(self):
@@ -187,8 +439,8 @@ class TransactionTests(BaseBudgetTestCase):
 
         balances = self.client.get(api_url("/categories/balances/")).data
         groc_balance = next(b for b in balances if b["category_id"] == self.groceries.id)
-        self.assertEqual(groc_balance["spent"], "50")
-        self.assertEqual(groc_balance["available"], "250")
+        self.assertEqual(groc_balance["spent"], "50.00")
+        self.assertEqual(groc_balance["available"], "250.00")
 
     def test_income_increases_balance(self):
         create_resp = self.client.post(
@@ -251,6 +503,51 @@ class TransactionTests(BaseBudgetTestCase):
         self.assertEqual(no_cat_resp.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class MoneyFieldTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account(balance=Decimal("100.00"))
+        self.groceries = self.create_category("Groceries")
+
+    def spend(self, amount):
+        return self.client.post(
+            api_url("/transactions/"),
+            {"category": self.groceries.id, "account": self.account.id, "transaction_type": "expense", "amount": amount},
+            format="json",
+        )
+
+    def test_amounts_are_stored_as_cents_and_served_as_decimals(self):
+        resp = self.spend("12.34")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data["amount"], "12.34")
+        with connections[self.ledger_db].cursor() as cursor:
+            cursor.execute("SELECT amount FROM budget_transaction WHERE id = %s", [resp.data["id"]])
+            self.assertEqual(cursor.fetchone()[0], 1234)
+            cursor.execute("SELECT balance FROM budget_account WHERE id = %s", [self.account.id])
+            self.assertEqual(cursor.fetchone()[0], 8766)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("87.66"))
+        listed = self.client.get(api_url("/transactions/")).data
+        self.assertEqual([t["amount"] for t in listed], ["12.34"])
+        filtered = self.client.get(api_url("/transactions/"), {"amount_min": "12.34", "amount_max": "12.34"}).data
+        self.assertEqual(len(filtered), 1)
+
+    def test_sums_are_exact(self):
+        for amount in ["0.10", "0.20", "0.07"]:
+            self.spend(amount)
+        total = Transaction.objects.filter(user=self.user).aggregate(total=Sum("amount"))["total"]
+        self.assertEqual(total, Decimal("0.37"))
+        self.assertEqual(str(total), "0.37")
+        rollup = CategoryMonthRollup.objects.get(user=self.user, category=self.groceries)
+        self.assertEqual(rollup.expense, Decimal("0.37"))
+
+    def test_amounts_beyond_cents_or_max_digits_are_rejected(self):
+        self.assertEqual(self.spend("1.005").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.spend("123456789.00").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Transaction.objects.exists())
+
+
 class CategoryBalanceTests(BaseBudgetTestCase):
     def test_balances_endpoint(self):
         account = self.create_account(balance=Decimal("1000"))
@@ -274,13 +571,13 @@ class CategoryBalanceTests(BaseBudgetTestCase):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         dining_balance = next(b for b in resp.data if b["category_id"] == dining.id)
         travel_balance = next(b for b in resp.data if b["category_id"] == travel.id)
-        self.assertEqual(dining_balance["allocated"], "200")
-        self.assertEqual(dining_balance["spent"], "50")
-        self.assertEqual(dining_balance["available"], "150")
-        self.assertEqual(travel_balance["available"], "300")
+        self.assertEqual(dining_balance["allocated"], "200.00")
+        self.assertEqual(dining_balance["spent"], "50.00")
+        self.assertEqual(dining_balance["available"], "150.00")
+        self.assertEqual(travel_balance["available"], "300.00")
 
 
-class UserIsolationTests(APITestCase):
+class UserIsolationTests(LedgerTestCase):
     def setUp(self):
         self.alice = User.objects.create_user("alice", password="pass1234!")
         self.bob = User.objects.create_user("bob", password="pass1234!")
@@ -332,3 +629,1516 @@ class UserIsolationTests(APITestCase):
         self.assertEqual(alice_txns.data[0]["amount"], "10.00")
         self.assertEqual(len(bob_txns.data), 1)
         self.assertEqual(bob_txns.data[0]["amount"], "20.00")
+
+
+class BatchTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account()
+        self.category = self.create_category()
+
+    def batch(self, requests, **extra):
+        return self.client.post(api_url("/batch/"), {"requests": requests, **extra}, format="json")
+
+    def test_reads_match_individual_calls(self):
+        paths = ["/api/accounts/", f"/api/accounts/{self.account.id}/", "/api/categories/balances/",
+                 "/api/auth/me/"]
+        resp = self.batch([{"method": "GET", "path": path} for path in paths + ["/api/nope/"]])
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        *results, missing = resp.json()["responses"]
+        for path, result in zip(paths, results):
+            single = self.client.get(path, HTTP_ACCEPT="application/json")
+            self.assertEqual(result["status"], single.status_code, path)
+            self.assertEqual(result["body"], single.json(), path)
+        self.assertEqual(missing["status"], status.HTTP_404_NOT_FOUND)
+
+    def test_async_views_use_bearer_token(self):
+        self.client.force_authenticate(user=None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user)['access']}")
+        result = self.batch([{"path": "/api/accounts/async/"}]).json()["responses"][0]
+        self.assertEqual(result["status"], status.HTTP_200_OK)
+        self.assertEqual([a["id"] for a in result["body"]], [self.account.id])
+
+    def test_posts_run_in_order(self):
+        resp = self.batch([
+            {"method": "POST", "path": "/api/categories/", "body": {"name": "Rent"}},
+            {"method": "GET", "path": "/api/categories/?fields=name"},
+        ])
+        created, listed = resp.json()["responses"]
+        self.assertEqual(created["status"], status.HTTP_201_CREATED)
+        self.assertEqual(listed["body"], [{"name": "Groceries"}, {"name": "Rent"}])
+
+    def test_atomic_batch_rolls_back_on_failure(self):
+        resp = self.batch([
+            {"method": "POST", "path": "/api/categories/", "body": {"name": "Rent"}},
+            {"method": "POST", "path": "/api/allocations/",
+             "body": {"account": self.account.id, "category": self.category.id, "amount": "5000.00"}},
+            {"method": "GET", "path": "/api/categories/"},
+        ], atomic=True)
+        data = resp.json()
+        self.assertFalse(data["committed"])
+        self.assertEqual([r["status"] for r in data["responses"]], [201, 400])
+        self.assertFalse(Category.objects.filter(name="Rent").exists())
+
+        resp = self.batch([{"method": "POST", "path": "/api/categories/", "body": {"name": "Rent"}}], atomic=True)
+        self.assertTrue(resp.json()["committed"])
+        self.assertTrue(Category.objects.filter(name="Rent").exists())
+
+    def test_rejects_bad_batches(self):
+        for requests in [
+            [],
+            [{"method": "DELETE", "path": f"/api/accounts/{self.account.id}/"}],
+            [{"path": "/admin/"}],
+            [{"method": "POST", "path": "/api/batch/", "body": {"requests": []}}],
+            [{"path": "/api/accounts/"}] * 21,
+        ]:
+            self.assertEqual(self.batch(requests).status_code, status.HTTP_400_BAD_REQUEST, requests[:1])
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.batch([{"path": "/api/accounts/"}]).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class DashboardTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account()
+        self.create_account(name="Savings", balance=Decimal("250.00"))
+        for name, allocated, spent in [("Food", "100.00", "30.00"), ("Rent", "400.00", "0")]:
+            category = self.create_category(name)
+            BudgetAllocation.objects.create(category=category, account=self.account, amount=Decimal(allocated))
+            Transaction.objects.create(
+                user=self.user, account=self.account, category=category,
+                transaction_type="expense", amount=Decimal(spent),
+            )
+        Transaction.objects.create(
+            user=self.user, account=self.account, transaction_type="expense", amount=Decimal("12.00"),
+        )
+
+    def test_matches_individual_endpoints(self):
+        data = self.client.get(api_url("/dashboard/?transactions=2")).data
+        self.assertEqual(data["accounts"], self.client.get(api_url("/accounts/")).data)
+        self.assertEqual(data["categories"], self.client.get(api_url("/categories/balances/")).data)
+        self.assertEqual(data["recent_transactions"], self.client.get(api_url("/transactions/")).data[:2])
+        # 1250 in accounts, 500 allocated, 42 spent (12 of it uncategorized).
+        self.assertEqual(Decimal(data["available_to_budget"]), Decimal("792.00"))
+
+    def test_available_to_budget_agrees_with_allocation_check(self):
+        available = self.client.get(api_url("/dashboard/")).data["available_to_budget"]
+        category = Category.objects.get(name="Food")
+        resp = self.client.post(
+            api_url("/allocations/"),
+            {"account": self.account.id, "category": category.id, "amount": "800.00"},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(f"Available: ${Decimal(available):.2f}", str(resp.data))
+
+    def test_query_budget(self):
+        for i in range(20):
+            category = self.create_category(f"Extra {i}")
+            BudgetAllocation.objects.create(category=category, account=self.account, amount=Decimal("1.00"))
+            Transaction.objects.create(
+                user=self.user, account=self.account, category=category,
+                transaction_type="expense", amount=Decimal("0.50"),
+            )
+        with self.assertNumQueries(6, using=self.ledger_db):
+            resp = self.client.get(api_url("/dashboard/?transactions=50"))
+        self.assertEqual(len(resp.data["categories"]), 22)
+        self.assertEqual(len(resp.data["recent_transactions"]), 23)
+        with self.assertNumQueries(4, using=self.ledger_db):
+            self.client.get(api_url("/categories/balances/"))
+
+
+class LedgerCheckpointTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account()
+        self.food = self.create_category("Food")
+        self.rent = self.create_category("Rent")
+        self.this_month = rollups.month_of(timezone.now())
+
+    def at(self, months_ago):
+        """The 10th of the month `months_ago` before this one."""
+        day = rollups.add_months(self.this_month, -months_ago).replace(day=10)
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def allocate(self, category, amount, months_ago):
+        allocation = BudgetAllocation.objects.create(category=category, account=self.account, amount=Decimal(amount))
+        BudgetAllocation.objects.filter(pk=allocation.pk).update(allocated_at=self.at(months_ago))
+        return allocation
+
+    def spend(self, category, amount, months_ago):
+        txn = Transaction.objects.create(
+            user=self.user, account=self.account, category=category,
+            transaction_type="expense", amount=Decimal(amount),
+        )
+        Transaction.objects.filter(pk=txn.pk).update(date=self.at(months_ago))
+        return txn
+
+    def close(self, *args):
+        call_command("close_ledger_period", "--workers", "1", *args, stdout=open("/dev/null", "w"))
+
+    def balances(self):
+        return self.client.get(api_url("/categories/balances/")).data
+
+    def amounts(self, balances=None):
+        return {
+            b["category_id"]: (Decimal(b["allocated"]), Decimal(b["spent"]))
+            for b in (self.balances() if balances is None else balances)
+        }
+
+    def test_balances_add_only_rows_after_checkpoint(self):
+        self.allocate(self.food, "100.00", 3)
+        self.allocate(self.rent, "500.00", 2)
+        self.spend(self.food, "30.00", 2)
+        self.spend(None, "5.00", 2)
+        before = self.balances()
+        available = self.client.get(api_url("/dashboard/")).data["available_to_budget"]
+
+        self.close()
+        self.assertEqual(LedgerCheckpoint.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.amounts(), self.amounts(before))
+        # Rows behind the checkpoint are no longer read...
+        Transaction.objects.filter(user=self.user).delete()
+        BudgetAllocation.objects.filter(account=self.account).delete()
+        self.assertEqual(self.client.get(api_url("/dashboard/")).data["available_to_budget"], available)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.user)['access']}")
+        self.assertEqual(self.amounts(self.client.get(api_url("/categories/balances/async/")).json()), self.amounts())
+        # ...which --verify notices.
+        with self.assertRaises(CommandError):
+            self.close("--verify")
+
+        self.spend(self.food, "10.00", 0)
+        self.assertEqual(self.amounts()[self.food.id], (Decimal("100"), Decimal("40")))
+
+    def test_incremental_close_matches_recount(self):
+        self.allocate(self.food, "100.00", 3)
+        self.spend(self.food, "30.00", 3)
+        self.close("--through", f"{rollups.add_months(self.this_month, -3):%Y-%m}")
+        self.allocate(self.food, "50.00", 2)
+        self.allocate(self.rent, "700.00", 1)
+        self.spend(self.food, "20.00", 1)
+        self.spend(self.food, "1.00", 0)
+        self.close()
+
+        latest = LedgerCheckpoint.objects.filter(user=self.user, period_end=checkpoints.period_end(
+            rollups.add_months(self.this_month, -1)
+        ))
+        self.assertEqual(
+            sorted((c.category_id, c.allocated, c.spent) for c in latest),
+            [(self.food.id, Decimal("150.00"), Decimal("50.00")), (self.rent.id, Decimal("700.00"), Decimal("0"))],
+        )
+        self.close("--verify")
+        with self.assertRaises(CommandError):
+            self.close("--through", f"{self.this_month:%Y-%m}")
+
+    def test_changing_closed_rows_drops_checkpoints(self):
+        allocation = self.allocate(self.food, "100.00", 2)
+        old = self.spend(self.food, "30.00", 2)
+        self.close()
+
+        resp = self.client.post(api_url("/transactions/"), {
+            "account": self.account.id, "category": self.food.id, "transaction_type": "expense", "amount": "5.00",
+        }, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(LedgerCheckpoint.objects.filter(user=self.user).exists())
+
+        self.client.delete(api_url(f"/transactions/{old.id}/"))
+        self.assertFalse(LedgerCheckpoint.objects.filter(user=self.user).exists())
+        self.assertEqual(self.amounts()[self.food.id], (Decimal("100"), Decimal("5")))
+
+        self.close()
+        self.client.delete(api_url(f"/allocations/{allocation.id}/"))
+        self.assertFalse(LedgerCheckpoint.objects.filter(user=self.user).exists())
+        self.close("--verify")
+
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ParallelCloseTests(APITransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, *settings.LEDGER_SHARDS}
+
+    def setUp(self):
+        cache.clear()
+        last_month = timezone.make_aware(datetime.combine(
+            rollups.add_months(rollups.month_of(timezone.now()), -1).replace(day=10), time.min
+        ))
+        self.users = [User.objects.create_user(f"user{i}", password="pass1234!") for i in range(6)]
+        for user in self.users:
+            account = Account.objects.create(user=user, name="Checking", balance=Decimal("100"))
+            category = Category.objects.create(user=user, name="Food")
+            allocation = BudgetAllocation.objects.create(category=category, account=account, amount=Decimal("40.00"))
+            BudgetAllocation.objects.for_user(user.id).filter(pk=allocation.pk).update(allocated_at=last_month)
+            txn = Transaction.objects.create(
+                user=user, account=account, category=category, transaction_type="expense", amount=Decimal("5.00"),
+            )
+            Transaction.objects.for_user(user.id).filter(pk=txn.pk).update(date=last_month)
+
+    def test_close_with_workers(self):
+        out = StringIO()
+        call_command("close_ledger_period", "--workers", "2", stdout=out)
+        self.assertIn(f"for {len(self.users)} users", out.getvalue())
+        for user in self.users:
+            checkpoint = LedgerCheckpoint.objects.for_user(user.id).get()
+            self.assertEqual((checkpoint.allocated, checkpoint.spent), (Decimal("40.00"), Decimal("5.00")))
+        call_command("close_ledger_period", "--workers", "2", "--verify", stdout=out)
+        self.assertIn(f"Checked {len(self.users)} users", out.getvalue())
+
+
+class RebuildAccountBalancesTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bob = User.objects.create_user(username="bob", email="bob@test.com", password="pass1234!")
+        self.checking = self.create_account("Checking", Decimal("100.00"))
+        self.savings = self.create_account("Savings", Decimal("50.00"))
+        self.empty = self.create_account("Empty", Decimal("5.00"))
+        self.bobs = Account.objects.create(user=self.bob, name="Bob's", balance=Decimal("10.00"))
+        for account, amount in [(self.checking, "30.00"), (self.checking, "0.05"), (self.savings, "20.00"),
+                                (self.bobs, "1.00")]:
+            category = Category.objects.create(user=account.user, name=f"{account.name} {amount}")
+            BudgetAllocation.objects.create(category=category, account=account, amount=Decimal(amount))
+        # These accounts predate the allocation change the rebuild corrects.
+        app, name = balances.CUTOVER_MIGRATION
+        MigrationRecorder.Migration.objects.filter(app=app, name=name).update(applied=timezone.now())
+
+    def rebuild(self, *args):
+        out = StringIO()
+        call_command("rebuild_account_balances", "--workers", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def balances(self):
+        return dict(Account.objects.order_by("id").values_list("name", "balance"))
+
+    def test_rebuild_adds_allocations_once(self):
+        out = self.rebuild()
+        self.assertIn("4 accounts, added 51.05", out)
+        self.assertEqual(self.balances(), {
+            "Checking": Decimal("130.05"), "Savings": Decimal("70.00"), "Empty": Decimal("5.00"),
+            "Bob's": Decimal("11.00"),
+        })
+        self.assertEqual(AccountBalanceRebuild.objects.count(), 4)
+
+        self.assertIn("No accounts left to rebuild.", self.rebuild())
+        self.assertEqual(self.balances()["Checking"], Decimal("130.05"))
+        self.rebuild("--verify")
+
+    def test_accounts_created_after_the_cutover_are_left_alone(self):
+        self.rebuild()
+        new = self.create_account("New", Decimal("100.00"))
+        BudgetAllocation.objects.create(category=self.create_category("New"), account=new, amount=Decimal("40.00"))
+        self.assertIn("No accounts left to rebuild.", self.rebuild())
+        self.assertEqual(self.balances()["New"], Decimal("100.00"))
+        self.rebuild("--verify")
+
+    def test_interrupted_rebuild_resumes(self):
+        self.rebuild("--user", str(self.bob.id))
+        self.assertEqual(self.balances()["Bob's"], Decimal("11.00"))
+        self.assertIn("3 accounts, added 50.05", self.rebuild())
+        self.assertEqual(self.balances()["Bob's"], Decimal("11.00"))
+        self.assertEqual(self.balances()["Checking"], Decimal("130.05"))
+
+    def test_dry_run_writes_nothing(self):
+        before = self.balances()
+        self.assertIn("would rebuild 4 accounts, adding 51.05", self.rebuild("--dry-run"))
+        self.assertEqual(self.balances(), before)
+        self.assertFalse(AccountBalanceRebuild.objects.exists())
+
+    def test_verify_reports_unrebuilt_and_tampered_accounts(self):
+        with self.assertRaises(CommandError):
+            self.rebuild("--verify")
+        self.rebuild()
+        AccountBalanceRebuild.objects.filter(account=self.savings).update(added=Decimal("19.00"))
+        with self.assertRaisesMessage(CommandError, "1 accounts failed verification."):
+            self.rebuild("--verify")
+
+    def test_queries_per_range_do_not_grow_with_accounts(self):
+        def queries():
+            AccountBalanceRebuild.objects.all().delete()
+            with captured_queries(self.databases) as captured:
+                balances.rebuild([self.user.id, self.bob.id])
+            return len(captured)
+
+        few = queries()
+        for i in range(20):
+            account = self.create_account(f"Extra {i}")
+            BudgetAllocation.objects.create(
+                category=Category.objects.create(user=self.user, name=f"Extra {i}"), account=account, amount=1,
+            )
+        self.assertEqual(queries(), few)
+
+
+class ReconcileBalancesTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        resp = self.client.post(api_url("/accounts/"), {"name": "Checking", "balance": "100.00"}, format="json")
+        self.account = Account.objects.get(pk=resp.data["id"])
+        self.food = self.create_category("Food")
+        for transaction_type, amount in [("income", "50.00"), ("expense", "20.25")]:
+            self.client.post(api_url("/transactions/"), {
+                "account": self.account.id, "category": self.food.id,
+                "transaction_type": transaction_type, "amount": amount,
+            }, format="json")
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command("reconcile_balances", "--workers", "1", "--batch-size", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_balances_written_through_the_api_reconcile(self):
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("129.75"))
+        self.assertEqual(self.account.opening_balance, Decimal("100.00"))
+        self.assertIn("0 accounts drifted", self.reconcile())
+
+        # Setting the balance by hand moves the opening balance with it.
+        resp = self.client.patch(api_url(f"/accounts/{self.account.id}/"), {"balance": "500.00"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.opening_balance, Decimal("470.25"))
+        self.assertIn("0 accounts drifted", self.reconcile())
+
+    def test_drift_is_reported_and_fixed(self):
+        Account.objects.filter(pk=self.account.pk).update(balance=Decimal("130.00"))
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 accounts drifted"):
+            call_command("reconcile_balances", "--workers", "1", stdout=out)
+        self.assertIn(f"Account {self.account.id} (user {self.user.id}): balance 130.00, "
+                      f"transactions give 129.75 (+0.25)", out.getvalue())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            report = Path(tmp) / "drift.csv"
+            self.assertIn("1 accounts drifted, all corrected.", self.reconcile("--fix", "--report", str(report)))
+            self.assertEqual(
+                report.read_text().splitlines()[1], f"{self.account.id},{self.user.id},130.00,129.75,0.25,True"
+            )
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("129.75"))
+        self.assertIn("0 accounts drifted", self.reconcile())
+
+    def test_rebuild_is_not_drift(self):
+        BudgetAllocation.objects.create(category=self.food, account=self.account, amount=Decimal("10.00"))
+        app, name = balances.CUTOVER_MIGRATION
+        MigrationRecorder.Migration.objects.filter(app=app, name=name).update(applied=timezone.now())
+        call_command("rebuild_account_balances", "--workers", "1", stdout=StringIO())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("139.75"))
+        self.assertIn("0 accounts drifted", self.reconcile())
+
+    def test_accounts_without_opening_balance_are_recorded_by_fix(self):
+        Account.objects.filter(pk=self.account.pk).update(opening_balance=None, balance=Decimal("200.00"))
+        self.assertIn("1 accounts have no opening balance yet", self.reconcile())
+        self.assertIn("recorded opening balances for 1 accounts", self.reconcile("--fix"))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.opening_balance, Decimal("170.25"))
+
+        Account.objects.filter(pk=self.account.pk).update(balance=Decimal("1.00"))
+        with self.assertRaises(CommandError):
+            self.reconcile()
+
+
+class LedgerEventTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checking = self.create_account("Checking", Decimal("100.00"))
+        self.savings = self.create_account("Savings", Decimal("50.00"))
+        self.food = self.create_category("Food")
+        self.rent = self.create_category("Rent")
+
+    def post(self, path, payload):
+        resp = self.client.post(api_url(path), payload, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        return resp.data
+
+    def post_transaction(self, amount, transaction_type="expense", category=None, description=""):
+        return self.post("/transactions/", {
+            "account": self.checking.id, "category": category.id if category else None,
+            "transaction_type": transaction_type, "amount": amount, "description": description,
+        })["id"]
+
+    def balances(self):
+        return dict(Account.objects.order_by().values_list("id", "balance"))
+
+    def rebuild(self, *args):
+        out = StringIO()
+        call_command("rebuild_ledger_projections", "--workers", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_transaction_edits_move_balances(self):
+        txn = self.post_transaction("20.00", category=self.food)
+        resp = self.client.patch(
+            api_url(f"/transactions/{txn}/"), {"account": self.savings.id, "amount": "30.00"}, format="json",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.balances(), {self.checking.id: Decimal("100.00"), self.savings.id: Decimal("20.00")})
+
+        self.assertEqual(self.client.delete(api_url(f"/transactions/{txn}/")).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.balances(), {self.checking.id: Decimal("100.00"), self.savings.id: Decimal("50.00")})
+        self.assertEqual(list(LedgerEvent.objects.values_list("sequence", "kind", "account", "balance", "spent")), [
+            (1, "account.opened", self.checking.id, Decimal("100.00"), Decimal("0.00")),
+            (2, "account.opened", self.savings.id, Decimal("50.00"), Decimal("0.00")),
+            (3, "transaction.created", self.checking.id, Decimal("-20.00"), Decimal("20.00")),
+            (4, "transaction.updated", self.checking.id, Decimal("20.00"), Decimal("-20.00")),
+            (5, "transaction.updated", self.savings.id, Decimal("-30.00"), Decimal("30.00")),
+            (6, "transaction.deleted", self.savings.id, Decimal("30.00"), Decimal("-30.00")),
+        ])
+        # Editing a transaction now moves the balances the way reconciliation expects.
+        out = StringIO()
+        call_command("reconcile_balances", "--workers", "1", stdout=out)
+        self.assertIn("0 accounts drifted", out.getvalue())
+
+    def test_projection_matches_stored_balances_and_totals(self):
+        self.post("/allocations/", {"category": self.food.id, "account": self.checking.id, "amount": "60.00"})
+        allocation = self.post(
+            "/allocations/", {"category": self.rent.id, "account": self.savings.id, "amount": "40.00"},
+        )
+        self.client.patch(api_url(f"/allocations/{allocation['id']}/"), {"amount": "30.00"}, format="json")
+        self.post("/allocations/move/", {
+            "source_category": self.food.id, "target_category": self.rent.id, "amount": "15.00",
+            "account": self.checking.id,
+        })
+        self.post_transaction("12.50", category=self.food)
+        self.post_transaction("7.25", transaction_type="income", description="Corner coffee refund")
+        self.post_transaction("80.00", transaction_type="income")
+        with self.captureOnCommitCallbacks(using=self.ledger_db, execute=True):
+            self.post("/rules/", {"category": self.food.id, "pattern": "coffee"})
+        self.assertEqual(self.run_job(self.client.post(api_url("/rules/apply/")))["result"], {"categorized": 1})
+        self.client.patch(api_url(f"/accounts/{self.savings.id}/"), {"balance": "75.00"}, format="json")
+
+        projection = events.project(self.user.id)
+        self.assertEqual(projection.balances, self.balances())
+        self.assertEqual(projection.categories[self.food.id], [Decimal("45.00"), Decimal("12.50")])
+        self.assertEqual(projection.categories[self.rent.id], [Decimal("45.00"), Decimal("0.00")])
+        self.assertIn("Checked 1 users' projections", self.rebuild("--verify"))
+
+        # Cascades need no events of their own.
+        self.client.delete(api_url(f"/categories/{self.food.id}/"))
+        self.client.delete(api_url(f"/accounts/{self.savings.id}/"))
+        self.assertEqual(events.project(self.user.id).categories[None], [Decimal("0.00"), Decimal("12.50")])
+        self.assertIn("Checked 1 users' projections", self.rebuild("--verify"))
+
+    def test_drift_is_corrected_and_replay_starts_from_snapshot(self):
+        self.post_transaction("20.00", category=self.food)
+        Account.objects.filter(pk=self.checking.pk).update(balance=Decimal("1.00"))
+        with self.assertRaisesMessage(CommandError, "1 balances and 0 category totals disagree"):
+            self.rebuild("--verify")
+
+        out = self.rebuild("--snapshot")
+        self.assertIn(
+            f"Account {self.checking.id} (user {self.user.id}): balance 1.00, events give 80.00, corrected", out,
+        )
+        self.assertIn("1 balances corrected, 1 snapshots written", out)
+        self.assertEqual(set(LedgerSnapshot.objects.values_list("sequence", flat=True)), {3})
+        self.assertIn("0 snapshots written", self.rebuild("--snapshot"))
+
+        # Only the events after the snapshot are read again.
+        LedgerEvent.objects.filter(sequence__lte=3).delete()
+        self.post_transaction("5.00", transaction_type="income")
+        self.assertEqual(events.replay(self.user.id)[0], 4)
+        self.assertEqual(events.project(self.user.id).balances, self.balances())
+        self.assertEqual(self.balances()[self.checking.id], Decimal("85.00"))
+        self.assertIn("Checked 1 users' projections", self.rebuild("--verify"))
+
+
+class IdempotencyKeyTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account(balance=Decimal("500.00"))
+        self.food = self.create_category("Food")
+        self.rent = self.create_category("Rent")
+
+    def post(self, path, payload, key="attempt-1"):
+        return self.client.post(api_url(path), payload, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def expense(self, amount="25.00"):
+        return {"account": self.account.id, "category": self.food.id, "transaction_type": "expense", "amount": amount}
+
+    def test_retry_replays_without_writing_again(self):
+        first = self.post("/transactions/", self.expense())
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", first)
+
+        with self.assertNumQueries(1, using=self.ledger_db):
+            retry = self.post("/transactions/", self.expense())
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("475.00"))
+
+        # Keys are per user.
+        other = User.objects.create_user("bob", password="pass1234!")
+        self.client.force_authenticate(user=other)
+        bob_account = Account.objects.create(user=other, name="Bob", balance=Decimal("10.00"))
+        bob_food = Category.objects.create(user=other, name="Food")
+        resp = self.post("/transactions/", {
+            "account": bob_account.id, "category": bob_food.id, "transaction_type": "expense", "amount": "1.00",
+        })
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", resp)
+
+    def test_allocations_and_moves_are_idempotent(self):
+        for _ in range(2):
+            self.assertEqual(
+                self.post("/allocations/", {"category": self.food.id, "account": self.account.id, "amount": "100.00"},
+                          key="allocate").status_code,
+                status.HTTP_201_CREATED,
+            )
+            resp = self.post("/allocations/move/", {
+                "source_category": self.food.id, "target_category": self.rent.id, "amount": "40.00",
+                "account": self.account.id,
+            }, key="move")
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data["message"], "Moved $40.00 from Food to Rent")
+        totals = dict(BudgetAllocation.objects.values("category").annotate(total=Sum("amount")).values_list(
+            "category", "total"
+        ))
+        self.assertEqual(totals, {self.food.id: Decimal("60.00"), self.rent.id: Decimal("40.00")})
+
+    def test_failures_are_not_stored_and_keys_are_not_reused(self):
+        resp = self.post("/transactions/", self.expense(amount="-1"))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post("/transactions/", self.expense()).status_code, status.HTTP_201_CREATED)
+
+        resp = self.post("/transactions/", self.expense(amount="30.00"))
+        self.assertEqual(resp.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.post("/transactions/", self.expense(), key="").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_expired_keys_run_again(self):
+        self.post("/transactions/", self.expense())
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        resp = self.post("/transactions/", self.expense())
+        self.assertNotIn("Idempotent-Replayed", resp)
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_fingerprint_uses_the_parsed_body(self):
+        def parsed(body, content_type="application/json"):
+            request = Request(RequestFactory().post("/api/transactions/", body, content_type=content_type),
+                              parsers=[ORJSONParser(), FormParser()])
+            request.data  # The stream is read before the fingerprint, as a throttle or the view may do.
+            return fingerprint(request)
+
+        self.assertEqual(parsed(b'{"amount": "5.00", "account": 1}'), parsed(b'{"account":1,"amount":"5.00"}'))
+        self.assertNotEqual(parsed(b'{"amount": "5.00", "account": 1}'), parsed(b'{"amount": "5.00", "account": 2}'))
+        form = "application/x-www-form-urlencoded"
+        self.assertEqual(parsed(b"amount=5.00&account=1", form), parsed(b"account=1&amount=5.00", form))
+        # Multipart parsing consumes the stream: request.body is no longer readable.
+        multipart = Request(RequestFactory().post("/api/transactions/", {"account": "1", "amount": "5.00"}),
+                            parsers=[MultiPartParser()])
+        multipart.data
+        self.assertEqual(fingerprint(multipart), parsed(b"account=1&amount=5.00", form))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class IdempotencyLockTests(APITransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, *settings.LEDGER_SHARDS}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="pass1234!")
+        self.account = Account.objects.create(user=self.user, name="Checking", balance=Decimal("100"))
+        self.client.force_authenticate(user=self.user)
+
+    def test_duplicate_that_times_out_waiting_gets_409(self):
+        using = shard_for_user(self.user.id)
+        locked, release = threading.Event(), threading.Event()
+
+        def first_attempt():
+            # Holds the key's row and the write lock, as a request still running the write does.
+            try:
+                with transaction.atomic(using=using):
+                    IdempotencyKey.objects.using(using).create(
+                        user_id=self.user.id, key="attempt-1", fingerprint="", expires_at=timezone.now() + timedelta(1),
+                    )
+                    locked.set()
+                    release.wait(30)
+                    transaction.set_rollback(True, using=using)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=first_attempt)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        self.assertTrue(locked.wait(10))
+
+        payload = {"account": self.account.id, "transaction_type": "income", "amount": "5.00"}
+        resp = self.client.post(api_url("/transactions/"), payload, format="json", HTTP_IDEMPOTENCY_KEY="attempt-1")
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn("in progress", resp.data["error"])
+
+        release.set()
+        thread.join()
+        resp = self.client.post(api_url("/transactions/"), payload, format="json", HTTP_IDEMPOTENCY_KEY="attempt-1")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Transaction.objects.for_user(self.user.id).count(), 1)
+
+
+class RecurringTransactionTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account(balance=Decimal("1000.00"))
+        self.rent = self.create_category("Rent")
+
+    def at(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def schedule(self, **fields):
+        fields = {
+            "user": self.user, "account": self.account, "category": self.rent, "transaction_type": "expense",
+            "amount": Decimal("100.00"), "description": "Rent", "starts_at": self.at(2026, 1, 31, 9), **fields,
+        }
+        return RecurringTransaction.objects.create(**fields)
+
+    def test_catches_up_on_missed_occurrences(self):
+        schedule = self.schedule()
+        self.assertEqual(recurring.run(self.ledger_db, until=self.at(2026, 5, 15)), (1, 4))
+
+        # Monthly from the 31st: the shorter months get their last day.
+        self.assertEqual(
+            sorted(Transaction.objects.values_list("date", flat=True)),
+            [self.at(2026, 1, 31, 9), self.at(2026, 2, 28, 9), self.at(2026, 3, 31, 9), self.at(2026, 4, 30, 9)],
+        )
+        schedule.refresh_from_db()
+        self.assertEqual((schedule.occurrences, schedule.next_run), (4, self.at(2026, 5, 31, 9)))
+        self.assertEqual((schedule.claimed_by, schedule.lease_until), ("", None))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("600.00"))
+        self.assertEqual(CategoryMonthRollup.objects.filter(category=self.rent).count(), 4)
+        self.assertEqual(events.drifted(self.user.id), [])
+
+        # Nothing more is due.
+        self.assertEqual(recurring.run(self.ledger_db, until=self.at(2026, 5, 15)), (0, 0))
+        self.assertEqual(Transaction.objects.count(), 4)
+
+    def test_scheduled_allocations_stop_at_the_end(self):
+        schedule = self.schedule(
+            transaction_type=RecurringTransaction.ALLOCATION, frequency=RecurringTransaction.WEEKLY, interval=2,
+            amount=Decimal("50.00"), ends_at=self.at(2026, 3, 1),
+        )
+        recurring.run(self.ledger_db, until=self.at(2026, 6, 1))
+        self.assertEqual(
+            sorted(BudgetAllocation.objects.values_list("allocated_at", flat=True)),
+            [self.at(2026, 1, 31, 9), self.at(2026, 2, 14, 9), self.at(2026, 2, 28, 9)],
+        )
+        schedule.refresh_from_db()
+        self.assertFalse(schedule.active)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("1000.00"))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_claimed_schedules_wait_for_their_lease(self):
+        held = self.schedule(description="Held")
+        abandoned = self.schedule(description="Abandoned")
+        RecurringTransaction.objects.filter(pk=held.pk).update(
+            claimed_by="another-run", lease_until=timezone.now() + timedelta(minutes=5),
+        )
+        RecurringTransaction.objects.filter(pk=abandoned.pk).update(
+            claimed_by="crashed-run", lease_until=timezone.now() - timedelta(seconds=1),
+        )
+        out = StringIO()
+        call_command("materialize_recurring", "--workers", "1", stdout=out)
+        self.assertIn("from 1 schedules", out.getvalue())
+        self.assertEqual(set(Transaction.objects.values_list("description", flat=True)), {"Abandoned"})
+        held.refresh_from_db()
+        self.assertEqual((held.occurrences, held.claimed_by), (0, "another-run"))
+
+    def test_api(self):
+        payload = {
+            "account": self.account.id, "category": self.rent.id, "transaction_type": "expense", "amount": "100.00",
+            "description": "Rent", "frequency": "monthly", "starts_at": "2026-01-31T09:00:00Z",
+        }
+        resp = self.client.post(api_url("/recurring/"), payload, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data["next_run"], "2026-01-31T09:00:00Z")
+
+        for invalid in ({"category": None}, {"interval": 0}, {"ends_at": "2025-12-31T00:00:00Z"}):
+            resp = self.client.post(api_url("/recurring/"), {**payload, **invalid}, format="json")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, invalid)
+
+        schedule_id = RecurringTransaction.objects.get().id
+        recurring.run(self.ledger_db, until=self.at(2026, 2, 1))
+        resp = self.client.patch(api_url(f"/recurring/{schedule_id}/"), {"interval": 2}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.patch(api_url(f"/recurring/{schedule_id}/"), {"amount": "120.00"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data["next_run"], "2026-02-28T09:00:00Z")
+
+        # An edit while a run holds the schedule keeps the run's claim.
+        self.assertEqual(recurring.claim(self.ledger_db, "run", self.at(2026, 3, 1), 300, 10), [schedule_id])
+        resp = self.client.patch(api_url(f"/recurring/{schedule_id}/"), {"description": "Flat"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(recurring.materialize(self.ledger_db, "run", [schedule_id], self.at(2026, 3, 1)), 1)
+        self.assertEqual(Transaction.objects.order_by("-date").first().description, "Flat")
+
+
+def failing_job(job, succeed_on):
+    if job.attempts < succeed_on:
+        raise ValueError(f"attempt {job.attempts} failed")
+    jobs.report(job, 1, 1)
+    return {"attempts": job.attempts}
+
+
+@override_settings(JOB_RETRY_SECONDS=0)
+class JobTests(BaseBudgetTestCase):
+    def enqueue(self, succeed_on=1, **kwargs):
+        return jobs.enqueue(failing_job, {"succeed_on": succeed_on}, user_id=self.user.id, **kwargs)
+
+    def test_retries_until_max_attempts(self):
+        retried = self.enqueue(succeed_on=2)
+        failed = self.enqueue(succeed_on=4)
+        self.assertEqual(jobs.work(burst=True), 5)
+
+        resp = self.client.get(api_url(f"/jobs/{retried.id}/"))
+        self.assertEqual(
+            {key: resp.data[key] for key in ("status", "attempts", "progress", "total", "result", "error")},
+            {"status": "succeeded", "attempts": 2, "progress": 1, "total": 1, "result": {"attempts": 2}, "error": ""},
+        )
+        resp = self.client.get(api_url(f"/jobs/{failed.id}/"))
+        self.assertEqual((resp.data["status"], resp.data["attempts"]), ("failed", 3))
+        self.assertEqual(resp.data["error"], "ValueError: attempt 3 failed")
+        self.assertIn("Traceback", Job.objects.get(pk=failed.id).error)
+
+        # Jobs are only visible to their user.
+        self.client.force_authenticate(user=User.objects.create_user("bob", password="pass1234!"))
+        self.assertEqual(self.client.get(api_url(f"/jobs/{failed.id}/")).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_claims_by_priority_and_takes_over_expired_leases(self):
+        later = self.enqueue()
+        first = self.enqueue(priority=-1)
+        claimed = jobs.claim("worker-1")
+        self.assertEqual((claimed.pk, claimed.status, claimed.claimed_by), (first.pk, Job.RUNNING, "worker-1"))
+
+        # worker-1 stops reporting; once its lease runs out the job goes to the next worker.
+        Job.objects.filter(pk=first.pk).update(lease_until=timezone.now() - timedelta(seconds=1))
+        taken = jobs.claim("worker-2")
+        self.assertEqual((taken.pk, taken.attempts), (first.pk, 2))
+        with self.assertRaises(jobs.LeaseLost):
+            jobs.report(claimed, 1)
+        self.assertEqual(jobs.claim("worker-1").pk, later.pk)
+        self.assertIsNone(jobs.claim("worker-1"))
+
+    def test_apply_queues_one_job_at_a_time(self):
+        first = self.client.post(api_url("/rules/apply/"))
+        second = self.client.post(api_url("/rules/apply/"))
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(first.data["id"], second.data["id"])
+        self.assertEqual(first.data["status"], "queued")
+        self.assertTrue(first["Location"].endswith(f"/api/jobs/{first.data['id']}/"))
+
+        out = StringIO()
+        call_command("run_jobs", "--burst", "--workers", "1", stdout=out)
+        self.assertIn("Ran 1 jobs", out.getvalue())
+        self.assertEqual(Job.objects.get().status, Job.SUCCEEDED)
+
+
+class RollupReportTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account()
+        self.food = self.create_category("Food")
+        self.rent = self.create_category("Rent")
+
+    def post_transaction(self, category, amount, transaction_type="expense"):
+        resp = self.client.post(api_url("/transactions/"), {
+            "account": self.account.id, "category": category.id if category else None,
+            "transaction_type": transaction_type, "amount": amount,
+        }, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        return resp.data["id"]
+
+    def rollup_rows(self):
+        return sorted(
+            (r.category_id or 0, r.month, r.income, r.expense, r.count)
+            for r in CategoryMonthRollup.objects.filter(user=self.user)
+        )
+
+    def assert_matches_backfill(self):
+        maintained = self.rollup_rows()
+        call_command("backfill_category_rollups", user=[self.user.id], stdout=open("/dev/null", "w"))
+        self.assertEqual(maintained, self.rollup_rows())
+        return maintained
+
+    def test_one_uncategorized_row_per_month(self):
+        for amount in ["4.00", "1.00"]:
+            rollups.add_transaction(SimpleNamespace(
+                user_id=self.user.id, category_id=None, date=timezone.now(), transaction_type="expense",
+                amount=Decimal(amount),
+            ))
+        month = rollups.month_of(timezone.now())
+        self.assertEqual(self.rollup_rows(), [(0, month, Decimal("0.00"), Decimal("5.00"), 2)])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CategoryMonthRollup.objects.create(user=self.user, category=None, month=month, expense=Decimal("1.00"))
+
+    def test_api_writes_keep_rollups_current(self):
+        first = self.post_transaction(self.food, "10.00")
+        self.post_transaction(self.food, "5.50")
+        self.post_transaction(self.rent, "700.00")
+        self.post_transaction(self.rent, "50.00", "income")
+        resp = self.client.put(api_url(f"/transactions/{first}/"), {
+            "account": self.account.id, "category": self.rent.id, "transaction_type": "expense", "amount": "12.00",
+        }, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        rows = self.assert_matches_backfill()
+        self.assertEqual([(r[2], r[3], r[4]) for r in rows], [
+            (Decimal("0"), Decimal("5.50"), 1), (Decimal("50.00"), Decimal("712.00"), 3),
+        ])
+
+        self.client.delete(api_url(f"/transactions/{first}/"))
+        self.client.delete(api_url(f"/categories/{self.food.id}/"))
+        rows = self.assert_matches_backfill()
+        self.assertEqual(rows[0][0], 0)
+
+        other = self.create_account("Savings")
+        self.client.post(api_url("/transactions/"), {
+            "account": other.id, "category": self.rent.id, "transaction_type": "expense", "amount": "1.00",
+        }, format="json")
+        self.client.delete(api_url(f"/accounts/{other.id}/"))
+        self.assert_matches_backfill()
+
+    def test_reports_read_only_rollups(self):
+        this_month = rollups.month_of(timezone.now())
+        history = [(0, self.food, "20.00"), (0, self.rent, "700.00"), (-1, self.food, "30.00"), (-13, self.food, "99.00")]
+        for months_ago, category, amount in history:
+            txn = Transaction.objects.create(
+                user=self.user, account=self.account, category=category,
+                transaction_type="expense", amount=Decimal(amount),
+            )
+            # Backdated afterwards, as an import would.
+            month = rollups.add_months(this_month, months_ago)
+            Transaction.objects.filter(pk=txn.pk).update(date=timezone.make_aware(datetime.combine(month, time(12))))
+        call_command("backfill_category_rollups", stdout=open("/dev/null", "w"))
+
+        with captured_queries(self.databases) as queries:
+            monthly = self.client.get(api_url("/reports/monthly/")).data
+            by_category = self.client.get(api_url(f"/reports/categories/?start={this_month:%Y-%m}")).data
+            trends = self.client.get(api_url("/reports/trends/")).data
+        self.assertFalse(any("budget_transaction" in q["sql"] for q in queries))
+
+        self.assertEqual([(m["expense"], m["count"]) for m in monthly], [("99.00", 1), ("30.00", 1), ("720.00", 2)])
+        self.assertEqual([(c["category_name"], c["expense"]) for c in by_category], [("Rent", "700.00"), ("Food", "20.00")])
+        food = next(t for t in trends if t["category_name"] == "Food")
+        self.assertEqual(len(food["months"]), 12)
+        self.assertEqual([m["expense"] for m in food["months"][-2:]], ["30.00", "20.00"])
+        self.assertEqual((food["total"], food["average"]), ("50.00", "4.17"))
+        self.assertEqual(self.client.get(api_url("/reports/monthly/?start=2024")).status_code, 400)
+
+
+class TransactionFilterTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.checking = self.create_account()
+        self.savings = self.create_account(name="Savings")
+        self.food = self.create_category("Food")
+        rows = [
+            (self.checking, self.food, "expense", "12.50", "2026-01-05"),
+            (self.checking, None, "income", "1000.00", "2026-01-31"),
+            (self.savings, self.food, "expense", "80.00", "2026-02-01"),
+            (self.checking, self.food, "expense", "3.00", "2026-03-15"),
+        ]
+        for account, category, transaction_type, amount, day in rows:
+            txn = Transaction.objects.create(
+                user=self.user, account=account, category=category,
+                transaction_type=transaction_type, amount=Decimal(amount),
+            )
+            moment = timezone.make_aware(datetime.combine(datetime.fromisoformat(day), time(9)))
+            Transaction.objects.filter(pk=txn.pk).update(date=moment)
+
+    def amounts(self, query):
+        resp = self.client.get(api_url(f"/transactions/?{query}"))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        return [row["amount"] for row in resp.data]
+
+    def test_filters(self):
+        self.assertEqual(self.amounts("date_from=2026-01-31&date_to=2026-02-01"), ["80.00", "1000.00"])
+        self.assertEqual(self.amounts("date_to=2026-01-31T08:00:00"), ["12.50"])
+        self.assertEqual(self.amounts("transaction_type=income"), ["1000.00"])
+        self.assertEqual(self.amounts(f"category={self.food.id}&account={self.checking.id}"), ["3.00", "12.50"])
+        self.assertEqual(self.amounts("category=none"), ["1000.00"])
+        self.assertEqual(self.amounts("amount_min=3&amount_max=12.5"), ["3.00", "12.50"])
+        self.assertEqual(self.amounts("transaction_type=expense&amount_min=50&fields=amount"), ["80.00"])
+
+    def test_bad_values_are_rejected(self):
+        resp = self.client.get(api_url("/transactions/?date_from=yesterday&amount_max=NaN&transaction_type=gift"))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(resp.data), {"date_from", "amount_max", "transaction_type"})
+
+        resp = self.client.get(api_url("/transactions/?date_to=9999-12-31&account=99999999999999999999"))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(resp.data), {"date_to", "account"})
+
+    @skipUnless(connection.vendor == "sqlite", "checks SQLite query plans")
+    def test_every_filter_combination_uses_an_index(self):
+        values = {
+            "date_from": "2026-01-01", "date_to": "2026-01-31", "transaction_type": "expense",
+            "category": str(self.food.id), "account": str(self.checking.id), "amount_min": "10",
+        }
+        names = list(values)
+        for mask in range(1 << len(names)):
+            params = {name: values[name] for bit, name in enumerate(names) if mask >> bit & 1}
+            queryset = Transaction.objects.for_user(self.user.id).filter(**transaction_lookups(params))
+            plan = queryset.explain()
+            self.assertRegex(plan, r"SEARCH budget_transaction USING (COVERING )?INDEX budget_txn_", params)
+            self.assertNotIn("SCAN budget_transaction", plan, params)
+
+
+class TransactionSearchTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account()
+        self.category = self.create_category()
+        for description in ["Lunch and coffee with the team", "Coffee", "Groceries", "Café crème"]:
+            self.create_transaction(self.user, description)
+        self.create_transaction(User.objects.create_user("mallory", password="pass1234!"), "Coffee")
+
+    def create_transaction(self, user, description):
+        account = self.account if user == self.user else Account.objects.create(user=user, name="Other")
+        return Transaction.objects.create(
+            user=user, account=account, category=self.category if user == self.user else None,
+            transaction_type="expense", amount=Decimal("4.00"), description=description,
+        )
+
+    def search(self, query):
+        resp = self.client.get(api_url(f"/transactions/?q={query}"))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [row["description"] for row in resp.data]
+
+    def test_ranked_results_for_own_transactions(self):
+        self.assertEqual(self.search("COFFEE"), ["Coffee", "Lunch and coffee with the team"])
+        self.assertEqual(self.search("coffee team"), ["Lunch and coffee with the team"])
+        self.assertEqual(self.search("cafe"), ["Café crème"])
+        self.assertEqual(self.search("tea"), [])
+        self.assertEqual(self.search("%22)*"), [])
+        self.assertEqual(len(self.client.get(api_url("/transactions/?q=coffee&amount_min=5")).data), 0)
+
+    def test_index_follows_writes(self):
+        txn = Transaction.objects.get(description="Groceries")
+        Transaction.objects.filter(pk=txn.pk).update(description="Weekly groceries")
+        self.assertEqual(self.search("weekly"), ["Weekly groceries"])
+        Transaction.objects.filter(description="Coffee").delete()
+        self.assertEqual(self.search("coffee"), ["Lunch and coffee with the team"])
+
+    @skipIf(settings.LEDGER_SHARDS, "the admin lists the default database's ledger only")
+    def test_admin_search_uses_index_and_usernames(self):
+        model_admin = TransactionAdmin(Transaction, AdminSite())
+        request = RequestFactory().get("/admin/budget/transaction/")
+        results, _ = model_admin.get_search_results(request, Transaction.objects.all(), "coffee")
+        self.assertEqual(results.count(), 3)
+        results, _ = model_admin.get_search_results(request, Transaction.objects.all(), "coff")
+        self.assertEqual(results.count(), 3)
+        results, _ = model_admin.get_search_results(request, Transaction.objects.all(), "mallory")
+        self.assertEqual([t.description for t in results], ["Coffee"])
+
+    @skipIf(settings.LEDGER_SHARDS, "the admin lists the default database's ledger only")
+    def test_admin_search_without_words_matches_usernames_only(self):
+        model_admin = TransactionAdmin(Transaction, AdminSite())
+        request = RequestFactory().get("/admin/budget/transaction/")
+        for term in ["%", "--"]:
+            results, _ = model_admin.get_search_results(request, Transaction.objects.all(), term)
+            self.assertEqual(list(results), [], repr(term))
+        User.objects.create_user("o--neil", password="pass1234!")
+        self.create_transaction(User.objects.get(username="o--neil"), "Rent")
+        results, _ = model_admin.get_search_results(request, Transaction.objects.all(), "--")
+        self.assertEqual([t.description for t in results], ["Rent"])
+
+    @skipUnless(connection.vendor == "sqlite", "checks the SQLite FTS5 triggers")
+    def test_install_repairs_missing_triggers(self):
+        with connections[self.ledger_db].cursor() as cursor:
+            cursor.execute("DROP TRIGGER budget_transaction_fts_ai")
+        self.create_transaction(self.user, "Coffee beans")
+        self.assertNotIn("Coffee beans", self.search("beans"))
+        install_search(self.ledger_db)
+        self.assertEqual(self.search("beans"), ["Coffee beans"])
+        self.create_transaction(self.user, "Bean bag")
+        self.assertEqual(self.search("bag"), ["Bean bag"])
+
+
+class CategorizationRuleTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.account = self.create_account()
+        self.coffee = self.create_category("Coffee")
+        self.shopping = self.create_category("Shopping")
+        self.streaming = self.create_category("Streaming")
+
+    def add_rule(self, category, pattern, match_type="contains", priority=0):
+        with self.captureOnCommitCallbacks(using=self.ledger_db, execute=True):
+            resp = self.client.post(api_url("/rules/"), {
+                "category": category.id, "pattern": pattern, "match_type": match_type, "priority": priority,
+            }, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        return resp.data["id"]
+
+    def post_expense(self, description, amount="4.00"):
+        return self.client.post(api_url("/transactions/"), {
+            "account": self.account.id, "transaction_type": "expense", "amount": amount, "description": description,
+        }, format="json")
+
+    def test_matcher_agrees_with_rules_tried_in_order(self):
+        rules = [
+            ("prime video", "contains", 1), ("amazon", "contains", 2), ("fee", "contains", 3), (r"^sq \*", "regex", 4),
+            (r"\bcoffee\b", "regex", 5), ("café", "contains", 6), ("(tea|chai)s?$", "regex", 7), ("ti", "regex", 8),
+        ]
+        matcher = Matcher(rules)
+        descriptions = [
+            "AMAZON PRIME VIDEO", "amazon.com", "Coffee fee", "SQ *BLUE BOTTLE COFFEE", "coffeehouse", "CAFÉ NERO",
+            "green teas", "chai latte", "TIP", "tıp", "", "rent",
+        ]
+        for description in descriptions:
+            expected = next(
+                (category for pattern, kind, category in rules
+                 if (re.search(pattern, description, re.IGNORECASE) if kind == "regex"
+                     else pattern.casefold() in description.casefold())),
+                None,
+            )
+            self.assertEqual(matcher.category_for(description), expected, description)
+
+    def test_backtracking_regexes_never_run(self):
+        matcher = Matcher([("(a+)+$", "regex", self.coffee.id), ("aaa", "contains", self.shopping.id)])
+        self.assertEqual(matcher.category_for("a" * 40 + "!"), self.shopping.id)
+        for pattern in [r"^sq \*", r"\bcoffee\b", "(tea|chai)s?$", r"\d{3,}-\d+", "(?:ab)+"]:
+            self.assertIsNone(regex_problem(pattern), pattern)
+
+    def test_new_transactions_without_category_use_rules(self):
+        self.add_rule(self.shopping, "amazon", priority=5)
+        self.add_rule(self.streaming, "prime video", priority=1)
+        resp = self.post_expense("AMAZON PRIME VIDEO")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data["category"], self.streaming.id)
+        self.assertEqual(self.post_expense("Amazon.com").data["category"], self.shopping.id)
+        self.assertEqual(self.post_expense("Rent").status_code, status.HTTP_400_BAD_REQUEST)
+
+        explicit = self.client.post(api_url("/transactions/"), {
+            "account": self.account.id, "category": self.coffee.id, "transaction_type": "expense",
+            "amount": "3.00", "description": "Amazon locker coffee",
+        }, format="json")
+        self.assertEqual(explicit.data["category"], self.coffee.id)
+
+    def test_rule_edits_recompile(self):
+        rule_id = self.add_rule(self.coffee, "bean")
+        self.assertEqual(self.post_expense("Bean there").data["category"], self.coffee.id)
+        with self.captureOnCommitCallbacks(using=self.ledger_db, execute=True):
+            self.client.patch(api_url(f"/rules/{rule_id}/"), {"category": self.shopping.id}, format="json")
+        self.assertEqual(self.post_expense("Bean there").data["category"], self.shopping.id)
+        with self.captureOnCommitCallbacks(using=self.ledger_db, execute=True):
+            self.client.delete(api_url(f"/rules/{rule_id}/"))
+        self.assertEqual(self.post_expense("Bean there").status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_rules_rejected(self):
+        other = Category.objects.create(user=User.objects.create_user("bob", password="pass1234!"), name="Bob's")
+        for payload in [
+            {"category": other.id, "pattern": "x"},
+            {"category": self.coffee.id, "pattern": "  "},
+            {"category": self.coffee.id, "pattern": "(unclosed", "match_type": "regex"},
+            {"category": self.coffee.id, "pattern": "x(?i)", "match_type": "regex"},
+            {"category": self.coffee.id, "pattern": "(a+)+$", "match_type": "regex"},
+            {"category": self.coffee.id, "pattern": r"^(\w+\s?)*$", "match_type": "regex"},
+            {"category": self.coffee.id, "pattern": "(a|aa)*b", "match_type": "regex"},
+            {"category": self.coffee.id, "pattern": r"(ab)\1", "match_type": "regex"},
+        ]:
+            resp = self.client.post(api_url("/rules/"), payload, format="json")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, payload)
+
+    def test_apply_categorizes_existing_rows_and_rollups(self):
+        for description in ["Blue Bottle coffee", "Coffee", "Amazon", "Rent", ""]:
+            Transaction.objects.create(
+                user=self.user, account=self.account, transaction_type="expense",
+                amount=Decimal("2.00"), description=description,
+            )
+        rollups.rebuild(self.user.id)
+        self.add_rule(self.coffee, r"coffee$", match_type="regex")
+        self.add_rule(self.shopping, "amazon")
+
+        job = self.run_job(self.client.post(api_url("/rules/apply/")))
+        self.assertEqual((job["status"], job["result"]), ("succeeded", {"categorized": 3}))
+        self.assertEqual((job["progress"], job["total"]), (4, 4))
+        self.assertEqual(Transaction.objects.filter(category=self.coffee).count(), 2)
+        self.assertEqual(Transaction.objects.filter(category__isnull=True).count(), 2)
+        def rollup_rows():
+            return sorted(CategoryMonthRollup.objects.values_list("category", "expense", "count"), key=str)
+        maintained = rollup_rows()
+        rollups.rebuild(self.user.id)
+        self.assertEqual(maintained, rollup_rows())
+        self.assertEqual(self.run_job(self.client.post(api_url("/rules/apply/")))["result"], {"categorized": 0})
+
+
+class ProjectionContractTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        account = self.create_account()
+        groceries = self.create_category("Groceries")
+        BudgetAllocation.objects.create(category=groceries, account=account, amount=Decimal("300"))
+        BudgetAllocation.objects.create(category=groceries, account=account, amount=Decimal("-12.5"))
+        Transaction.objects.create(
+            user=self.user, account=account, category=groceries,
+            transaction_type="expense", amount=Decimal("45.10"), description="Market",
+        )
+        # Income without a category: DRF omits category_name for it.
+        Transaction.objects.create(user=self.user, account=account, transaction_type="income", amount=Decimal("1000"))
+
+    def assert_matches_serializer(self, path, serializer_class, queryset):
+        request = SimpleNamespace(user=self.user)
+        expected = serializer_class(queryset, many=True, context={"request": request}).data
+        resp = self.client.get(api_url(path), HTTP_ACCEPT="application/json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.content, ORJSONRenderer().render(expected))
+        self.assertEqual(resp.content, JSONRenderer().render(expected))
+
+    def test_transaction_list_matches_serializer(self):
+        self.assert_matches_serializer("/transactions/", TransactionSerializer, Transaction.objects.all())
+        self.assertNotIn("category_name", self.client.get(api_url("/transactions/")).data[0])
+
+    def test_allocation_list_matches_serializer(self):
+        self.assert_matches_serializer("/allocations/", BudgetAllocationSerializer, BudgetAllocation.objects.all())
+
+    def test_list_is_one_query(self):
+        with captured_queries(self.databases) as queries:
+            self.client.get(api_url("/transactions/"))
+        self.assertEqual(len(queries), 1)
+
+
+class SparseFieldsetTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self.create_account()
+        category = self.create_category()
+        Transaction.objects.create(
+            user=self.user, account=self.account, category=category,
+            transaction_type="expense", amount=Decimal("9.99"), description="Lunch",
+        )
+
+    def get(self, path):
+        with captured_queries(self.databases) as queries:
+            resp = self.client.get(api_url(path))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.data, " ".join(q["sql"] for q in queries)
+
+    def test_fields_trims_output_and_columns(self):
+        data, sql = self.get("/transactions/?fields=id,amount,date")
+        self.assertEqual(list(data[0]), ["id", "amount", "date"])
+        self.assertNotIn("description", sql)
+        self.assertNotIn("budget_category", sql)
+
+        data, sql = self.get(f"/accounts/{self.account.id}/?fields=name")
+        self.assertEqual(data, {"name": "Checking"})
+        self.assertNotIn("balance", sql)
+
+    def test_omit(self):
+        data, _ = self.get("/transactions/?omit=user,description,category_name")
+        self.assertEqual(
+            list(data[0]), ["id", "category", "account", "account_name", "transaction_type", "amount", "date"]
+        )
+
+    def test_unknown_field_is_rejected(self):
+        resp = self.client.get(api_url("/accounts/?fields=id,nope"))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("nope", str(resp.data["fields"]))
+
+    def test_writes_ignore_fieldsets(self):
+        resp = self.client.post(api_url("/accounts/?fields=id"), {"name": "Savings", "balance": "5.00"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data["name"], "Savings")
+
+
+class CompressionTests(BaseBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        account = self.create_account()
+        Transaction.objects.bulk_create(
+            Transaction(user=self.user, account=account, transaction_type="income", amount=Decimal("1.00"),
+                        description=f"Paycheck {i}")
+            for i in range(50)
+        )
+
+    def test_large_json_is_gzipped(self):
+        plain = self.client.get(api_url("/transactions/"))
+        resp = self.client.get(api_url("/transactions/"), HTTP_ACCEPT_ENCODING="br;q=0.5, gzip")
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        self.assertEqual(gzip.decompress(resp.content), plain.content)
+        self.assertLess(int(resp["Content-Length"]), len(plain.content))
+
+    def test_skips_small_refused_and_excluded_responses(self):
+        small = self.client.get(api_url("/categories/"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+        refused = self.client.get(api_url("/transactions/"), HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(refused.has_header("Content-Encoding"))
+        login = self.client.post(
+            api_url("/auth/login/"), {"username": "alice", "password": "pass1234!"},
+            format="json", HTTP_ACCEPT_ENCODING="gzip",
+        )
+        self.assertFalse(login.has_header("Content-Encoding"))
+
+    def test_streaming_response_is_compressed_per_chunk(self):
+        chunks = [b'{"chunk": %d}\n' % i * 40 for i in range(5)]
+        middleware = CompressionMiddleware(lambda request: StreamingHttpResponse(
+            iter(chunks), content_type="application/json"
+        ))
+        resp = middleware(RequestFactory().get("/stream/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        parts = list(resp.streaming_content)
+        self.assertEqual(len(parts), len(chunks) + 1)
+        self.assertEqual(gzip.decompress(b"".join(parts)), b"".join(chunks))
+
+    def test_skips_encoded_and_cached_responses(self):
+        body = b'{"chunk": 1}\n' * 200
+        encoded = CompressionMiddleware(lambda request: HttpResponse(
+            body, content_type="application/json", headers={"Content-Encoding": "br"}
+        ))
+        resp = encoded(RequestFactory().get("/encoded/", HTTP_ACCEPT_ENCODING="gzip"))
+        self.assertEqual((resp["Content-Encoding"], resp.content), ("br", body))
+
+        # With the cache above the middleware, a hit is served as stored, compressed once.
+        self.addCleanup(cache.clear)
+        views = []
+
+        def view(request):
+            views.append(request.path)
+            return HttpResponse(body, content_type="application/json")
+
+        stack = CacheMiddleware(CompressionMiddleware(view), page_timeout=60)
+        with patch.object(gzip, "compress", wraps=gzip.compress) as compress:
+            first, hit = [stack(RequestFactory().get("/cached/", HTTP_ACCEPT_ENCODING="gzip")) for _ in range(2)]
+        self.assertEqual((views, compress.call_count), (["/cached/"], 1))
+        self.assertEqual((hit["Content-Encoding"], hit.content), ("gzip", first.content))
+        self.assertEqual(gzip.decompress(hit.content), body)
+
+
+class ORJSONRendererTests(BaseBudgetTestCase):
+    def test_matches_drf_renderer(self):
+        account = self.create_account()
+        category = self.create_category("Caf\u00e9 \u2028")
+        for amount in ["12.50", "0.01", "99.99"]:
+            Transaction.objects.create(
+                user=self.user, account=account, category=category,
+                transaction_type="expense", amount=Decimal(amount), description="line\u2029sep",
+            )
+        data = self.client.get(api_url("/transactions/")).data
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_raw_decimals_render_as_strings(self):
+        self.assertEqual(ORJSONRenderer().render({"total": Decimal("1234567.10"), 1: None}), b'{"total":"1234567.10","1":null}')
+
+    def test_malformed_body_is_bad_request(self):
+        resp = self.client.post(api_url("/accounts/"), b'{"name": ', content_type="application/json")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("JSON parse error", resp.data["detail"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRouterTests(SimpleTestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Account), "replica_1")
+        self.assertEqual(self.router.db_for_write(Account), DEFAULT_DB_ALIAS)
+
+    def test_atomic_blocks_read_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Account), DEFAULT_DB_ALIAS)
+
+    def test_pinned_context_reads_primary(self):
+        token = pin_to_primary()
+        try:
+            self.assertEqual(self.router.db_for_read(Account), DEFAULT_DB_ALIAS)
+        finally:
+            unpin(token)
+        self.assertEqual(self.router.db_for_read(Account), "replica_1")
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate("replica_1", "budget"))
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, "budget"))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "set BUDGET_DB_REPLICAS=<file.sqlite3> to run the replica harness")
+class ReplicaHarnessTests(APITransactionTestCase):
+    """
+    Runs against real SQLite replicas that only change when sync_replicas()
+    copies the primary over them, so replication lag is under the test's control.
+    """
+    databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="pass1234!")
+        self.account = Account.objects.create(user=self.user, name="Checking", balance=Decimal("100"))
+        self.category = Category.objects.create(user=self.user, name="Food")
+        self.client.force_authenticate(user=self.user)
+        self.sync_replicas()
+
+    def sync_replicas(self):
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            target = connections[alias]
+            target.ensure_connection()
+            source.connection.backup(target.connection)
+
+    def test_reads_hit_replica_until_synced(self):
+        Account.objects.create(user=self.user, name="Savings", balance=Decimal("50"))
+        resp = self.client.get(api_url("/accounts/"))
+        self.assertEqual([a["name"] for a in resp.data], ["Checking"])
+        self.sync_replicas()
+        resp = self.client.get(api_url("/accounts/"))
+        self.assertEqual(sorted(a["name"] for a in resp.data), ["Checking", "Savings"])
+
+    def test_user_reads_own_writes_while_replica_lags(self):
+        create = self.client.post(
+            api_url("/transactions/"),
+            {"account": self.account.id, "category": self.category.id,
+             "transaction_type": "expense", "amount": "5.00"},
+            format="json",
+        )
+        self.assertEqual(create.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(self.client.get(api_url("/transactions/")).data), 1)
+
+        cache.clear()
+        self.assertEqual(len(self.client.get(api_url("/transactions/")).data), 0)
+        self.sync_replicas()
+        self.assertEqual(len(self.client.get(api_url("/transactions/")).data), 1)
+
+    def test_me_right_after_register(self):
+        client = APIClient()
+        resp = client.post(api_url("/auth/register/"), {
+            "username": "bob", "email": "bob@test.com",
+            "password": "StrongPass123!", "password_confirm": "StrongPass123!",
+        }, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED, resp.data)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {resp.data['tokens']['access']}")
+        me = client.get(api_url("/auth/me/"))
+        self.assertEqual(me.data["email"], "bob@test.com")
+
+
+@override_settings(LEDGER_SHARDS=[DEFAULT_DB_ALIAS])
+class LedgerShardTests(BaseBudgetTestCase):
+    """Runs the shard code paths with the default database as the only shard."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Don't leave assignments to the default database cached for the tests after.
+        self.addCleanup(cache.clear)
+
+    def test_hash_is_stable(self):
+        with self.settings(LEDGER_SHARDS=["ledger_1", "ledger_2", "ledger_3"]):
+            placements = [hashed_shard(user_id) for user_id in range(1, 100)]
+            self.assertEqual(placements, [hashed_shard(user_id) for user_id in range(1, 100)])
+            self.assertEqual(set(placements), {"ledger_1", "ledger_2", "ledger_3"})
+
+    def test_api_works_through_shard_managers(self):
+        account = self.create_account()
+        category = self.create_category()
+        resp = self.client.post(
+            api_url("/transactions/"),
+            {"account": account.id, "category": category.id, "transaction_type": "income", "amount": "5.00"},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(self.client.get(api_url("/transactions/")).data), 1)
+
+    def test_writes_refused_while_moving(self):
+        self.create_account()
+        set_assignment(self.user.id, DEFAULT_DB_ALIAS, moving=True)
+        self.assertEqual(self.client.get(api_url("/accounts/")).status_code, status.HTTP_200_OK)
+        resp = self.client.post(api_url("/accounts/"), {"name": "New", "balance": "1.00"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        set_assignment(self.user.id, DEFAULT_DB_ALIAS, moving=False)
+        resp = self.client.post(api_url("/accounts/"), {"name": "New", "balance": "1.00"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+    def test_move_needs_shared_cache_and_full_grace(self):
+        with self.assertRaisesMessage(CommandError, "local to each process"):
+            call_command("move_user_shard", self.user.id, DEFAULT_DB_ALIAS)
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir},
+        }):
+            with self.assertRaisesMessage(CommandError, "--grace must be at least"):
+                call_command("move_user_shard", self.user.id, DEFAULT_DB_ALIAS, grace=1)
+
+
+@skipUnless(len(settings.LEDGER_SHARDS) >= 2, "set BUDGET_LEDGER_SHARDS=<a.sqlite3>,<b.sqlite3> to run the shard harness")
+class LedgerShardHarnessTests(APITransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="pass1234!")
+        self.client.force_authenticate(user=self.user)
+        self.home = shard_for_user(self.user.id)
+
+    def create_ledger(self):
+        account = self.client.post(api_url("/accounts/"), {"name": "Checking", "balance": "100.00"}, format="json").data
+        category = self.client.post(api_url("/categories/"), {"name": "Food"}, format="json").data
+        self.client.post(
+            api_url("/allocations/"), {"account": account["id"], "category": category["id"], "amount": "40.00"},
+            format="json",
+        )
+        self.client.post(
+            api_url("/transactions/"),
+            {"account": account["id"], "category": category["id"], "transaction_type": "expense", "amount": "5.00"},
+            format="json",
+        )
+        return account
+
+    def test_ledger_lives_on_hashed_shard(self):
+        account = self.create_ledger()
+        self.assertEqual(self.home, hashed_shard(self.user.id))
+        index = settings.LEDGER_SHARDS.index(self.home) + 1
+        self.assertGreater(account["id"], index * SHARD_ID_RANGE)
+        for alias in settings.LEDGER_SHARDS:
+            expected = 1 if alias == self.home else 0
+            self.assertEqual(Transaction.objects.using(alias).filter(user=self.user).count(), expected)
+        self.assertEqual(len(self.client.get(api_url("/categories/balances/")).data), 1)
+
+    def test_users_write_to_their_own_shards(self):
+        other = User.objects.create_user("bob", password="pass1234!")
+        while shard_for_user(other.id) == self.home:
+            other = User.objects.create_user(f"bob{other.id}", password="pass1234!")
+        for user in [self.user, other]:
+            self.client.force_authenticate(user=user)
+            self.create_ledger()
+            self.client.post(api_url("/recurring/"), {
+                "account": Account.objects.for_user(user.id).get().id, "transaction_type": "income",
+                "amount": "1.00", "frequency": "monthly", "starts_at": "2026-01-31T09:00:00Z",
+            }, format="json")
+
+        for user in [self.user, other]:
+            home = shard_for_user(user.id)
+            for alias in settings.LEDGER_SHARDS:
+                expected = 1 if alias == home else 0
+                for model in [Account, Category, Transaction, RecurringTransaction]:
+                    self.assertEqual(model.objects.using(alias).filter(user=user).count(), expected, (model, alias))
+                self.assertEqual(
+                    BudgetAllocation.objects.using(alias).filter(account__user=user).count(), expected, alias,
+                )
+                self.assertEqual(LedgerEvent.objects.using(alias).filter(user=user).exists(), alias == home)
+                self.assertEqual(CategoryMonthRollup.objects.using(alias).filter(user=user).exists(), alias == home)
+        self.assertFalse(Account.objects.using(DEFAULT_DB_ALIAS).exists())
+
+    def test_move_user_shard(self):
+        # The servers and the command share the assignment cache, as they must in production.
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                                "LOCATION": cache_dir}},
+            LEDGER_ASSIGNMENT_CACHE_SECONDS=0,
+        ):
+            account = self.create_ledger()
+            target = next(alias for alias in settings.LEDGER_SHARDS if alias != self.home)
+            call_command("move_user_shard", self.user.id, target, grace=0, stdout=open("/dev/null", "w"))
+
+            self.assertEqual(shard_for_user(self.user.id), target)
+            self.assertFalse(Account.objects.using(self.home).filter(user=self.user).exists())
+            resp = self.client.get(api_url("/accounts/"))
+            self.assertEqual([a["id"] for a in resp.data], [account["id"]])
+            self.assertEqual(resp.data[0]["balance"], "95.00")
+            balances = self.client.get(api_url("/categories/balances/")).data
+            self.assertEqual(balances[0]["available"], "35.00")
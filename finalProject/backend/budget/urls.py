@@ -1,9 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
+from . import async_views
 from .views import (
-    AccountViewSet, CategoryViewSet, BudgetAllocationViewSet, TransactionViewSet,
-    RegisterView, LoginView, CurrentUserView
+    AccountViewSet, CategoryViewSet, BudgetAllocationViewSet, TransactionViewSet, CategorizationRuleViewSet,
+    JobViewSet, RecurringTransactionViewSet, ReportViewSet, RegisterView, LoginView, CurrentUserView, BatchView,
+    DashboardView,
 )
 
 router = DefaultRouter()
@@ -11,14 +13,28 @@ router.register(r'accounts', AccountViewSet, basename='account')
 router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'allocations', BudgetAllocationViewSet, basename='allocation')
 router.register(r'transactions', TransactionViewSet, basename='transaction')
+router.register(r'rules', CategorizationRuleViewSet, basename='rule')
+router.register(r'recurring', RecurringTransactionViewSet, basename='recurring')
+router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'reports', ReportViewSet, basename='report')
 
 auth_patterns = [
     path('auth/register/', RegisterView.as_view(), name='register'),
+    path('auth/register/async/', async_views.register, name='register_async'),
     path('auth/login/', LoginView.as_view(), name='login'),
+    path('auth/login/async/', async_views.login, name='login_async'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/me/', CurrentUserView.as_view(), name='current_user'),
 ]
 
-urlpatterns = auth_patterns + [
+# Async-native reads; listed before the router so `async` isn't taken for a pk.
+async_patterns = [
+    path('accounts/async/', async_views.account_list, name='account_list_async'),
+    path('categories/balances/async/', async_views.category_balances, name='category_balances_async'),
+]
+
+urlpatterns = auth_patterns + async_patterns + [
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
     path('', include(router.urls)),
 ]
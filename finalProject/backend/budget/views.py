@@ -1,53 +1,116 @@
+from copy import copy
+from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.db import transaction
 from django.db.models import Sum
-from django.contrib.auth import authenticate
-from .models import Account, Category, BudgetAllocation, Transaction
+from django.utils import timezone
+from urllib.parse import urlsplit
+from .batch import build_subrequest, dispatch
+from .authentication import tokens_for_user, verify_credentials
+from .models import (
+    Account, Category, BudgetAllocation, CategorizationRule, CategoryMonthRollup, Job, RecurringTransaction,
+    Transaction,
+)
+from . import checkpoints, events, jobs, rollups
+from .categorization import categorize_job
+from .fieldsets import SparseQuerysetMixin
+from .filters import TransactionFilterBackend
+from .idempotency import idempotent
+from .ledger import LedgerTotals
+from .permissions import LedgerWritable
+from .projections import ValuesProjection
+from .routers import pin_to_primary, recently_wrote, record_write, unpin
+from .search import search
+from .sharding import atomic_ledger, ledger_atomic, release_user_shard, shard_for_user, use_user_shard
 from .serializers import (
-    AccountSerializer, CategorySerializer, BudgetAllocationSerializer,
-    TransactionSerializer, RegisterSerializer, UserSerializer
+    AccountSerializer, CategorySerializer, BudgetAllocationSerializer, CategorizationRuleSerializer,
+    JobSerializer, RecurringTransactionSerializer, TransactionSerializer, RegisterSerializer, UserSerializer
 )
 
 
-class RegisterView(APIView):
+class PrimaryAfterWriteMixin:
+    """
+    Keep unsafe requests on the primary database, and safe requests too while
+    the user has a recent write (see budget.routers).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self._db_pin = pin_to_primary(request.method not in permissions.SAFE_METHODS)
+        super().initial(request, *args, **kwargs)
+        if request.user.is_authenticated and recently_wrote(request.user.id):
+            pin_to_primary()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (request.method not in permissions.SAFE_METHODS and response.status_code < 400
+                and request.user.is_authenticated):
+            record_write(request.user.id)
+        if getattr(self, '_db_pin', None) is not None:
+            unpin(self._db_pin)
+            self._db_pin = None
+        return response
+
+
+class LedgerShardMixin:
+    """Point ledger queries DRF issues without a routing hint at the user's shard."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._shard_token = use_user_shard(request.user.id)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, '_shard_token', None) is not None:
+            release_user_shard(self._shard_token)
+            self._shard_token = None
+        return response
+
+
+class ProjectedListMixin:
+    """Serve `list` from a values() projection of the serializer (see budget.projections)."""
+
+    def list(self, request, *args, **kwargs):
+        if self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(self.list_projection.rows(queryset, request))
+
+
+class RegisterView(PrimaryAfterWriteMixin, APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            record_write(user.id)
             return Response({
                 'user': UserSerializer(user).data,
-                'tokens': {
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
-                }
+                'tokens': tokens_for_user(user),
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LoginView(APIView):
+class LoginView(PrimaryAfterWriteMixin, APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
 
-        user = authenticate(username=username, password=password)
+        user = verify_credentials(username, password, request)
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            # The client's next read is usually /auth/me/, which must not hit a lagging replica.
+            record_write(user.id)
             return Response({
                 'user': UserSerializer(user).data,
-                'tokens': {
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
-                }
+                'tokens': tokens_for_user(user),
             })
         return Response(
             {'error': 'Invalid credentials'},
@@ -55,81 +118,196 @@ class LoginView(APIView):
         )
 
 
-class CurrentUserView(APIView):
+class CurrentUserView(PrimaryAfterWriteMixin, APIView):
     def get(self, request):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
 
 
-class AccountViewSet(viewsets.ModelViewSet):
-    serializer_class = AccountSerializer
+class BatchView(APIView):
+    """
+    Several API calls in one round trip:
+
+        POST /api/batch/
+        {"requests": [{"method": "GET", "path": "/api/accounts/"},
+                      {"method": "POST", "path": "/api/categories/", "body": {"name": "Rent"}}],
+         "atomic": false}
+
+    Returns {"responses": [{"status": ..., "body": ...}, ...]} in request
+    order. With "atomic": true the sub-requests share one transaction on the
+    user's ledger database; the first one that fails stops the batch and
+    rolls everything back, and the reply has "committed": false.
+    """
+    max_requests = 20
+    methods = ('GET', 'POST')
+
+    def post(self, request):
+        items = request.data.get('requests')
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'requests must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_requests:
+            return Response(
+                {'error': f'At most {self.max_requests} requests per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        for item in items:
+            error = self.check_item(request, item)
+            if error:
+                return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not request.data.get('atomic'):
+            return Response({'responses': self.run(request, items)})
+
+        with ledger_atomic(request.user.id):
+            responses = self.run(request, items, stop_on_error=True)
+            committed = responses[-1]['status'] < 400
+            if not committed:
+                transaction.set_rollback(True, using=shard_for_user(request.user.id))
+        return Response({'responses': responses, 'committed': committed})
+
+    def check_item(self, request, item):
+        if not isinstance(item, dict):
+            return 'Each request must be an object'
+        if str(item.get('method', 'GET')).upper() not in self.methods:
+            return f"Unsupported method: {item.get('method')}"
+        path = item.get('path')
+        if not isinstance(path, str) or not path.startswith('/api/'):
+            return 'Each request needs a path under /api/'
+        if urlsplit(path).path.rstrip('/') == request.path.rstrip('/'):
+            return 'Batches cannot be nested'
+        if item.get('body') is not None and not isinstance(item['body'], dict):
+            return 'body must be an object'
+        return None
+
+    def run(self, request, items, stop_on_error=False):
+        responses = []
+        for item in items:
+            subrequest = build_subrequest(request, item.get('method', 'GET').upper(), item['path'], item.get('body'))
+            status_code, body = dispatch(subrequest)
+            responses.append({'status': status_code, 'body': body})
+            if stop_on_error and status_code >= 400:
+                break
+        return responses
+
+
+class DashboardView(PrimaryAfterWriteMixin, LedgerShardMixin, APIView):
+    """
+    Everything the budget screen needs in one call: accounts, category
+    balances, available to budget and the latest transactions
+    (`?transactions=N`, default 10, at most 100).
+
+    Six queries whatever the ledger's size. Available to budget is worked out
+    from the account rows and the category totals already loaded, rather than
+    summed again.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    default_transactions = 10
+    max_transactions = 100
+
+    def get(self, request):
+        try:
+            count = int(request.query_params.get('transactions', self.default_transactions))
+        except ValueError:
+            return Response({'error': 'transactions must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        count = max(0, min(count, self.max_transactions))
+
+        user_id = request.user.id
+        accounts = list(Account.objects.for_user(user_id))
+        totals = LedgerTotals(user_id)
+        transactions = Transaction.objects.for_user(user_id).select_related('account', 'category')[:count]
+        context = {'request': request}
+        return Response({
+            'accounts': AccountSerializer(accounts, many=True, context=context).data,
+            'categories': totals.balances(Category.objects.for_user(user_id)),
+            'available_to_budget': str(totals.available_to_budget(sum(a.balance for a in accounts))),
+            'recent_transactions': TransactionSerializer(transactions, many=True, context=context).data,
+        })
+
+
+class AccountViewSet(PrimaryAfterWriteMixin, LedgerShardMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    serializer_class = AccountSerializer
+    permission_classes = [permissions.IsAuthenticated, LedgerWritable]
 
     def get_queryset(self):
-        return Account.objects.filter(user=self.request.user)
+        return Account.objects.for_user(self.request.user.id)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
+
+    @atomic_ledger
+    def perform_update(self, serializer):
+        account = serializer.instance
+        balance = serializer.validated_data.get('balance', account.balance)
+        adjustment = balance - account.balance
+        if account.opening_balance is None or not adjustment:
+            serializer.save()
+        else:
+            # Setting the balance by hand is an adjustment, not drift (see budget.reconciliation).
+            serializer.save(opening_balance=account.opening_balance + adjustment)
+        events.accounts_adjusted(account.user_id, {account.pk: adjustment})
+
+    @atomic_ledger
+    def perform_destroy(self, instance):
+        rollups.remove_account(instance)
+        checkpoints.invalidate(instance.user_id)
+        instance.delete()
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(PrimaryAfterWriteMixin, LedgerShardMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, LedgerWritable]
 
     def get_queryset(self):
-        return Category.objects.filter(user=self.request.user)
+        return Category.objects.for_user(self.request.user.id)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
+
+    @atomic_ledger
+    def perform_destroy(self, instance):
+        rollups.uncategorize(instance)
+        checkpoints.invalidate(instance.user_id)
+        instance.delete()
 
     @action(detail=False, methods=['get'], url_path='balances')
     def balances(self, request):
         """Calculate balance for each category."""
         categories = self.get_queryset()
-        balances = []
-
-        for category in categories:
-            allocated = BudgetAllocation.objects.filter(
-                category=category
-            ).aggregate(total=Sum('amount'))['total'] or 0
-
-            spent = Transaction.objects.filter(
-                category=category,
-                transaction_type='expense'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-
-            available = allocated - spent
-
-            balances.append({
-                'category_id': category.id,
-                'category_name': category.name,
-                'allocated': str(allocated),
-                'spent': str(spent),
-                'available': str(available),
-            })
-
-        return Response(balances)
+        return Response(LedgerTotals(request.user.id).balances(categories))
 
 
-class BudgetAllocationViewSet(viewsets.ModelViewSet):
+class BudgetAllocationViewSet(PrimaryAfterWriteMixin, LedgerShardMixin, ProjectedListMixin, SparseQuerysetMixin,
+                              viewsets.ModelViewSet):
     serializer_class = BudgetAllocationSerializer
-    permission_classes = [permissions.IsAuthenticated]
+    list_projection = ValuesProjection(BudgetAllocationSerializer)
+    permission_classes = [permissions.IsAuthenticated, LedgerWritable]
 
     def get_queryset(self):
-        return BudgetAllocation.objects.filter(
-            account__user=self.request.user
-        )
+        return BudgetAllocation.objects.for_user(self.request.user.id)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
-    @transaction.atomic
+    @atomic_ledger
     def perform_create(self, serializer):
-        serializer.save()
+        events.allocation_created(self.request.user.id, serializer.save())
 
-    @transaction.atomic
+    @atomic_ledger
+    def perform_update(self, serializer):
+        before = copy(serializer.instance)
+        checkpoints.invalidate(self.request.user.id, before.allocated_at)
+        events.allocation_updated(self.request.user.id, before, serializer.save())
+
+    @atomic_ledger
     def perform_destroy(self, instance):
+        checkpoints.invalidate(self.request.user.id, instance.allocated_at)
+        events.allocation_deleted(self.request.user.id, instance)
         instance.delete()
 
     @action(detail=False, methods=['post'], url_path='move')
-    @transaction.atomic
+    @idempotent
+    @atomic_ledger
     def move_money(self, request):
         source_category_id = request.data.get('source_category')
         target_category_id = request.data.get('target_category')
@@ -156,9 +334,9 @@ class BudgetAllocationViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            source_category = Category.objects.get(id=source_category_id, user=request.user)
-            target_category = Category.objects.get(id=target_category_id, user=request.user)
-            account = Account.objects.get(id=account_id, user=request.user)
+            source_category = Category.objects.for_user(request.user.id).get(id=source_category_id)
+            target_category = Category.objects.for_user(request.user.id).get(id=target_category_id)
+            account = Account.objects.for_user(request.user.id).get(id=account_id)
         except (Category.DoesNotExist, Account.DoesNotExist):
             return Response(
                 {'error': 'Invalid category or account'},
@@ -171,16 +349,7 @@ class BudgetAllocationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        allocated = BudgetAllocation.objects.filter(
-            category=source_category,
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-        spent = Transaction.objects.filter(
-            category=source_category,
-            transaction_type='expense'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-        available = allocated - spent
+        _, _, available = LedgerTotals(request.user.id, [source_category]).category(source_category.id)
         if available < amount:
             available_display = format(available, '.2f')
             amount_display = format(amount, '.2f')
@@ -189,7 +358,7 @@ class BudgetAllocationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        BudgetAllocation.objects.create(
+        source_allocation = BudgetAllocation.objects.create(
             category=source_category,
             account=account,
             amount=-amount
@@ -200,6 +369,7 @@ class BudgetAllocationViewSet(viewsets.ModelViewSet):
             account=account,
             amount=amount
         )
+        events.money_moved(request.user.id, source_allocation, target_allocation)
 
         serializer = self.get_serializer(target_allocation)
         return Response({
@@ -208,38 +378,197 @@ class BudgetAllocationViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_201_CREATED)
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(PrimaryAfterWriteMixin, LedgerShardMixin, ProjectedListMixin, SparseQuerysetMixin,
+                         viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
+    list_projection = ValuesProjection(TransactionSerializer)
+    permission_classes = [permissions.IsAuthenticated, LedgerWritable]
+    filter_backends = [TransactionFilterBackend]
+
+    def get_queryset(self):
+        queryset = Transaction.objects.for_user(self.request.user.id)
+        text = self.request.query_params.get('q')
+        if text and self.action == 'list':
+            # Ranked: best match first (see budget.search).
+            return search(queryset, text, user_id=self.request.user.id)
+        return queryset
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    # The account balance moves with the ledger events (see budget.events).
+    @atomic_ledger
+    def perform_create(self, serializer):
+        transaction_instance = serializer.save(user_id=self.request.user.id)
+        events.transaction_created(transaction_instance)
+        rollups.add_transaction(transaction_instance)
+
+    @atomic_ledger
+    def perform_update(self, serializer):
+        before = copy(serializer.instance)
+        rollups.remove_transaction(before)
+        checkpoints.invalidate(before.user_id, before.date)
+        transaction_instance = serializer.save()
+        events.transaction_updated(before, transaction_instance)
+        rollups.add_transaction(transaction_instance)
+
+    @atomic_ledger
+    def perform_destroy(self, instance):
+        events.transaction_deleted(instance)
+        rollups.remove_transaction(instance)
+        checkpoints.invalidate(instance.user_id, instance.date)
+        instance.delete()
+
+
+class CategorizationRuleViewSet(PrimaryAfterWriteMixin, LedgerShardMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    """
+    Auto-categorization rules (see budget.categorization). New transactions
+    without a category get one from these; `apply/` queues a job that
+    categorizes the existing uncategorized ones.
+    """
+    serializer_class = CategorizationRuleSerializer
+    permission_classes = [permissions.IsAuthenticated, LedgerWritable]
+
+    def get_queryset(self):
+        return CategorizationRule.objects.for_user(self.request.user.id)
+
+    def perform_create(self, serializer):
+        serializer.save(user_id=self.request.user.id)
+
+    @action(detail=False, methods=['post'], url_path='apply')
+    def apply(self, request):
+        job = jobs.enqueue(categorize_job, {'user_id': request.user.id}, user_id=request.user.id, unique=True)
+        return job_accepted(job, request)
+
+
+def job_accepted(job, request):
+    """202 with the queued job, and where to poll it."""
+    location = reverse('job-detail', args=[job.pk], request=request)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+class JobViewSet(PrimaryAfterWriteMixin, viewsets.ReadOnlyModelViewSet):
+    """The user's background jobs (see budget.jobs), to poll for progress and results."""
+    serializer_class = JobSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Transaction.objects.filter(user=self.request.user)
+        return Job.objects.filter(user_id=self.request.user.id)
+
+
+class RecurringTransactionViewSet(PrimaryAfterWriteMixin, LedgerShardMixin, SparseQuerysetMixin,
+                                  viewsets.ModelViewSet):
+    """
+    Recurring transactions and scheduled allocations (see budget.recurring).
+    `manage.py materialize_recurring` writes their occurrences as they come
+    due; deleting a schedule leaves the ones already written.
+    """
+    serializer_class = RecurringTransactionSerializer
+    permission_classes = [permissions.IsAuthenticated, LedgerWritable]
+
+    def get_queryset(self):
+        schedules = RecurringTransaction.objects.for_user(self.request.user.id)
+        if self.action in ('update', 'partial_update'):
+            # Locked from the read to the save, so the update is validated
+            # against the current occurrences and writes back the current
+            # next_run and claim instead of racing a materialize_recurring run.
+            schedules = schedules.select_for_update()
+        return schedules
 
-    @transaction.atomic
     def perform_create(self, serializer):
-        transaction_instance = serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
 
-        account = transaction_instance.account
-        amount = transaction_instance.amount
-        transaction_type = transaction_instance.transaction_type
+    @atomic_ledger
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
 
-        if transaction_type == 'income':
-            account.balance += amount
-        else:
-            account.balance -= amount
 
-        account.save()
+def _money(value):
+    return format(value or 0, '.2f')
 
-    @transaction.atomic
-    def perform_destroy(self, instance):
-        account = instance.account
-        amount = instance.amount
-        transaction_type = instance.transaction_type
 
-        if transaction_type == 'income':
-            account.balance -= amount
-        else:
-            account.balance += amount
+class ReportViewSet(PrimaryAfterWriteMixin, LedgerShardMixin, viewsets.ViewSet):
+    """
+    Spending reports, read only from the monthly rollups (see budget.rollups):
 
-        account.save()
-        instance.delete()
+    - monthly/: income, expense and transaction count per month
+    - categories/: the same per category
+    - trends/: each category's spending over the trailing 12 months
+
+    monthly/ and categories/ take `?start=YYYY-MM&end=YYYY-MM`, both inclusive.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    trend_months = 12
+
+    def month_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m').date()
+        except ValueError:
+            raise ValidationError({name: ['Use YYYY-MM.']})
+
+    def get_queryset(self):
+        queryset = CategoryMonthRollup.objects.for_user(self.request.user.id)
+        start, end = self.month_param('start'), self.month_param('end')
+        if start:
+            queryset = queryset.filter(month__gte=start)
+        if end:
+            queryset = queryset.filter(month__lte=end)
+        return queryset
+
+    @staticmethod
+    def totals(queryset, *group_by):
+        return queryset.values(*group_by).annotate(
+            total_income=Sum('income'), total_expense=Sum('expense'), total_count=Sum('count'),
+        )
+
+    @action(detail=False, methods=['get'])
+    def monthly(self, request):
+        rows = self.totals(self.get_queryset(), 'month').order_by('month')
+        return Response([{
+            'month': f"{row['month']:%Y-%m}",
+            'income': _money(row['total_income']),
+            'expense': _money(row['total_expense']),
+            'count': row['total_count'],
+        } for row in rows])
+
+    @action(detail=False, methods=['get'])
+    def categories(self, request):
+        rows = self.totals(self.get_queryset(), 'category', 'category__name').order_by('-total_expense', 'category__name')
+        return Response([{
+            'category_id': row['category'],
+            'category_name': row['category__name'],
+            'income': _money(row['total_income']),
+            'expense': _money(row['total_expense']),
+            'count': row['total_count'],
+        } for row in rows])
+
+    @action(detail=False, methods=['get'])
+    def trends(self, request):
+        last = rollups.month_of(timezone.now())
+        months = [rollups.add_months(last, offset) for offset in range(1 - self.trend_months, 1)]
+        queryset = CategoryMonthRollup.objects.for_user(request.user.id).filter(month__gte=months[0], month__lte=last)
+
+        trends = {}
+        for row in self.totals(queryset, 'category', 'category__name', 'month').order_by('category__name'):
+            trend = trends.setdefault(row['category'], {
+                'category_id': row['category'],
+                'category_name': row['category__name'],
+                'spent': dict.fromkeys(months, 0),
+            })
+            trend['spent'][row['month']] = row['total_expense'] or 0
+
+        report = []
+        for trend in trends.values():
+            spent = trend.pop('spent')
+            total = sum(spent.values())
+            report.append({
+                **trend,
+                'months': [{'month': f'{month:%Y-%m}', 'expense': _money(spent[month])} for month in months],
+                'total': _money(total),
+                'average': _money(total / self.trend_months),
+            })
+        return Response(report)
@@ -0,0 +1,28 @@
+"""
+Process pools for the maintenance commands (rebuild_account_balances,
+reconcile_balances, run_jobs): work items go to worker processes, which open their
+own database connections, and results come back as each item finishes.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.db import connections
+
+
+def _setup_worker():
+    # Spawned workers start without Django; forked ones already have it.
+    django.setup()
+
+
+def run(func, items, workers):
+    """Yield (item, func(item)) for each item, in completion order; in this process when workers <= 1."""
+    if workers <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+    # Don't hand the caller's connections to the workers.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) as pool:
+        futures = {pool.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'budget.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,6 +86,117 @@ DATABASES = {
     }
 }
 
+# BUDGET_DB_ENGINE=postgresql moves the primary to PostgreSQL, with
+# connections drawn from psycopg's pool (BUDGET_DB_POOL_SIZE per process).
+
+DATABASE_ENGINE = os.environ.get('BUDGET_DB_ENGINE', 'sqlite3')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('BUDGET_DB_NAME', 'budget'),
+        'USER': os.environ.get('BUDGET_DB_USER', 'budget'),
+        'PASSWORD': os.environ.get('BUDGET_DB_PASSWORD', ''),
+        'HOST': os.environ.get('BUDGET_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('BUDGET_DB_PORT', '5432'),
+        'OPTIONS': {
+            'pool': {
+                'min_size': 2,
+                'max_size': int(os.environ.get('BUDGET_DB_POOL_SIZE', 10)),
+                'timeout': 10,
+            },
+        },
+    }
+
+# DJANGO_SQLITE_PROFILE=production tunes SQLite for several worker processes:
+# WAL so readers never wait on the writer, NORMAL sync (durable across app
+# crashes, not power loss), a larger page cache and mmap, a busy timeout
+# instead of immediate "database is locked" errors, IMMEDIATE write
+# transactions so two writers can't deadlock upgrading their locks, and
+# persistent connections so requests stop reopening the file.
+
+SQLITE_PROFILE = os.environ.get('DJANGO_SQLITE_PROFILE', 'default')
+
+if DATABASE_ENGINE == 'sqlite3' and SQLITE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA busy_timeout=5000;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+
+# Read replicas: BUDGET_DB_REPLICAS is a comma-separated list of replica hosts
+# (PostgreSQL) or SQLite files. budget.routers sends reads there and keeps
+# writes, atomic blocks and recent writers on the primary. SQLite replicas
+# get their own test databases so the tests can sync them by hand.
+
+DATABASE_REPLICAS = []
+
+for _index, _location in enumerate(filter(None, os.environ.get('BUDGET_DB_REPLICAS', '').split(',')), start=1):
+    _alias = f'replica_{_index}'
+    if DATABASE_ENGINE == 'postgresql':
+        DATABASES[_alias] = {**DATABASES['default'], 'HOST': _location, 'TEST': {'MIRROR': 'default'}}
+    else:
+        DATABASES[_alias] = {**DATABASES['default'], 'NAME': _location}
+    DATABASE_REPLICAS.append(_alias)
+
+# Ledger shards: BUDGET_LEDGER_SHARDS is a comma-separated list of hosts
+# (PostgreSQL) or SQLite files. Each user's accounts, categories, allocations
+# and transactions live on one of them (see budget.sharding); users and
+# everything else stay on the default database.
+
+LEDGER_SHARDS = []
+
+for _index, _location in enumerate(filter(None, os.environ.get('BUDGET_LEDGER_SHARDS', '').split(',')), start=1):
+    _alias = f'ledger_{_index}'
+    if DATABASE_ENGINE == 'postgresql':
+        DATABASES[_alias] = {**DATABASES['default'], 'HOST': _location}
+    else:
+        DATABASES[_alias] = {**DATABASES['default'], 'NAME': _location}
+    LEDGER_SHARDS.append(_alias)
+
+# How long a process may route a user by its cached copy of their shard
+# assignment; move_user_shard waits at least this long before copying.
+LEDGER_ASSIGNMENT_CACHE_SECONDS = 30
+
+# Shard assignments and replica stickiness are kept in the default cache, which
+# every server process must share once there are shards or replicas:
+# BUDGET_CACHE_URL=redis://host:6379/0. Without it each process keeps its own.
+
+if os.environ.get('BUDGET_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['BUDGET_CACHE_URL'],
+        },
+    }
+
+DATABASE_ROUTERS = ['budget.routers.LedgerShardRouter', 'budget.routers.PrimaryReplicaRouter']
+
+REPLICA_STICKY_SECONDS = 5
+
+# How long a write made with an Idempotency-Key header is replayed to retries
+# (see budget.idempotency).
+IDEMPOTENCY_KEY_SECONDS = 24 * 60 * 60
+
+# Background jobs (see budget.jobs): how long a worker holds a job without
+# reporting progress before another may take it over, and the delay before
+# the first retry of a failed one, doubled for each retry after.
+JOB_LEASE_SECONDS = 5 * 60
+JOB_RETRY_SECONDS = 30
+
+
+# Logins go through authenticate(); this backend hashes on the pool in budget.authentication.
+AUTHENTICATION_BACKENDS = ['budget.authentication.PooledModelBackend']
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -103,6 +216,56 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# The selected algorithm hashes new passwords; hashes made with another listed
+# algorithm or older cost parameters are upgraded on the user's next login.
+# argon2 needs the optional argon2-cffi package.
+
+PASSWORD_HASHING = {
+    'ALGORITHM': os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt'),
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 102400,
+    'ARGON2_PARALLELISM': 8,
+    'SCRYPT_WORK_FACTOR': 2 ** 14,
+    'SCRYPT_BLOCK_SIZE': 8,
+    'SCRYPT_PARALLELISM': 1,
+    'PBKDF2_ITERATIONS': 1_000_000,
+    # Threads allowed to hash at once (see budget.authentication).
+    'WORKERS': int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+}
+
+_PASSWORD_HASHERS = {
+    'argon2': 'budget.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'budget.hashers.TunedScryptPasswordHasher',
+    'pbkdf2': 'budget.hashers.TunedPBKDF2PasswordHasher',
+}
+
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHING['ALGORITHM']]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items()
+    if name != PASSWORD_HASHING['ALGORITHM']
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+
+# Build the URLconf, password validators and hasher when a server process starts
+# (budget.apps.warm_up, called from wsgi.py and asgi.py) rather than on each
+# worker's first request.
+
+WARM_UP = os.environ.get('BUDGET_WARM_UP', '1') == '1'
+
+
+# Response compression (see budget.middleware). zstd and br are used when the
+# zstandard / brotli packages are installed.
+
+RESPONSE_COMPRESSION = {
+    'ENCODINGS': ['zstd', 'br', 'gzip'],
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    'ZSTD_LEVEL': 3,
+    # Token responses: keep them out of reach of compression side channels.
+    'EXCLUDE_PATHS': ['/api/auth/'],
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -131,7 +294,18 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication'
+        if os.environ.get('BUDGET_STATELESS_JWT', '1') == '1'
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'budget.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'budget.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
@@ -142,6 +316,9 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': False,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
+    # Built from token claims by JWTStatelessUserAuthentication; loads the
+    # User row only when a view reads a field the token doesn't carry.
+    'TOKEN_USER_CLASS': 'budget.authentication.LazyTokenUser',
 }
 
 CORS_ALLOWED_ORIGINS = [
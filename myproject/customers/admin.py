@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Customer
+from .models import Customer, Job
 
 
 @admin.register(Customer)
@@ -8,3 +8,10 @@ class CustomerAdmin(admin.ModelAdmin):
     list_filter = ['created_at']
     search_fields = ['first_name', 'last_name', 'email']
     readonly_fields = ['created_at']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['task', 'status', 'priority', 'attempts', 'progress', 'total', 'created_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task']
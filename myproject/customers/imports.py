@@ -0,0 +1,64 @@
+"""
+Importing customers in bulk, as a background job (see customers.jobs). Each
+row goes through CustomerSerializer, a query per row for the unique email,
+too slow for a large file inside the request.
+
+The valid rows are created together at the end, in one transaction with the
+final progress report: an attempt that lost its lease creates nothing. Emails
+are checked again right before the insert, since another request or an
+earlier attempt of this job may have created some of them after their rows
+were validated; those rows are reported as errors rather than failing the
+import. A retry after a committed attempt therefore reports its rows as
+existing customers.
+"""
+from django.db import IntegrityError, transaction
+
+from . import jobs
+from .models import Customer
+from .serializers import CustomerSerializer
+
+# Rows validated between progress reports.
+REPORT_EVERY = 100
+
+EXISTS = 'A customer with this email already exists.'
+
+
+def _drop_taken(customers, rows_by_email, errors):
+    """Move the customers whose email is now in the database to `errors`; how many were moved."""
+    taken = set(Customer.objects.filter(email__in=[c.email for c in customers]).values_list('email', flat=True))
+    for email in taken:
+        errors.append({'row': rows_by_email[email], 'errors': {'email': [EXISTS]}})
+    customers[:] = [customer for customer in customers if customer.email not in taken]
+    return len(taken)
+
+
+def import_customers(job, rows):
+    """The job `api/customers/import/` queues: how many rows were created, and each rejected row's errors."""
+    customers, errors, seen = [], [], {}
+    for index, row in enumerate(rows):
+        serializer = CustomerSerializer(data=row)
+        if not serializer.is_valid():
+            errors.append({'row': index, 'errors': serializer.errors})
+        elif serializer.validated_data['email'] in seen:
+            errors.append({'row': index, 'errors': {
+                'email': [f"Same email as row {seen[serializer.validated_data['email']]}."],
+            }})
+        else:
+            seen[serializer.validated_data['email']] = index
+            customers.append(Customer(**serializer.validated_data))
+        if (index + 1) % REPORT_EVERY == 0:
+            jobs.report(job, index + 1, len(rows))
+    with transaction.atomic():
+        _drop_taken(customers, seen, errors)
+        while True:
+            try:
+                with transaction.atomic():
+                    Customer.objects.bulk_create(customers, batch_size=500)
+                break
+            except IntegrityError:
+                # An email was created since the check; without one, the error is something else.
+                if not _drop_taken(customers, seen, errors):
+                    raise
+        jobs.report(job, len(rows), len(rows))
+    errors.sort(key=lambda error: error['row'])
+    return {'created': len(customers), 'errors': errors}
@@ -1,9 +1,24 @@
 from rest_framework import serializers
-from .models import Customer
+from .fieldsets import SparseFieldsMixin
+from .models import Customer, Job
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = ['id', 'first_name', 'last_name', 'email', 'phone_number', 'created_at']
         read_only_fields = ['id', 'created_at']
+
+
+class JobSerializer(serializers.ModelSerializer):
+    # The exception, without the traceback (that stays in the admin).
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'task', 'status', 'attempts', 'max_attempts', 'progress', 'total', 'result', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_error(self, job):
+        return job.error.strip().splitlines()[-1] if job.error else ''
@@ -1,3 +1,253 @@
-from django.test import TestCase
+import gzip
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.cache import CacheMiddleware
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from . import imports, jobs
+from .middleware import CompressionMiddleware
+from .models import Customer, Job
+from .renderers import ORJSONRenderer
+from .serializers import CustomerSerializer
+
+
+def failing_job(job, succeed_on):
+    if job.attempts < succeed_on:
+        raise ValueError(f'attempt {job.attempts} failed')
+    jobs.report(job, 1, 1)
+    return {'attempts': job.attempts}
+
+
+@override_settings(JOB_RETRY_SECONDS=0)
+class JobTests(APITestCase):
+    def enqueue(self, succeed_on=1, **kwargs):
+        return jobs.enqueue(failing_job, {'succeed_on': succeed_on}, **kwargs)
+
+    def test_retries_until_max_attempts(self):
+        retried = self.enqueue(succeed_on=2)
+        failed = self.enqueue(succeed_on=4)
+        self.assertEqual(jobs.work(burst=True), 5)
+
+        resp = self.client.get(f'/api/jobs/{retried.id}/')
+        self.assertEqual(
+            {key: resp.data[key] for key in ('status', 'attempts', 'progress', 'total', 'result', 'error')},
+            {'status': 'succeeded', 'attempts': 2, 'progress': 1, 'total': 1, 'result': {'attempts': 2}, 'error': ''},
+        )
+        resp = self.client.get(f'/api/jobs/{failed.id}/')
+        self.assertEqual((resp.data['status'], resp.data['attempts']), ('failed', 3))
+        self.assertEqual(resp.data['error'], 'ValueError: attempt 3 failed')
+        self.assertIn('Traceback', Job.objects.get(pk=failed.id).error)
+
+    def test_claims_by_priority_and_takes_over_expired_leases(self):
+        later = self.enqueue()
+        first = self.enqueue(priority=-1)
+        claimed = jobs.claim('worker-1')
+        self.assertEqual((claimed.pk, claimed.status, claimed.claimed_by), (first.pk, Job.RUNNING, 'worker-1'))
+
+        # worker-1 stops reporting; once its lease runs out the job goes to the next worker.
+        Job.objects.filter(pk=first.pk).update(lease_until=timezone.now() - timedelta(seconds=1))
+        taken = jobs.claim('worker-2')
+        self.assertEqual((taken.pk, taken.attempts), (first.pk, 2))
+        with self.assertRaises(jobs.LeaseLost):
+            jobs.report(claimed, 1)
+        self.assertEqual(jobs.claim('worker-1').pk, later.pk)
+        self.assertIsNone(jobs.claim('worker-1'))
+
+    def test_unique_returns_the_queued_job(self):
+        queued = self.enqueue(unique=True)
+        self.assertEqual(self.enqueue(unique=True).pk, queued.pk)
+        jobs.claim('worker-1')
+        self.assertNotEqual(self.enqueue(unique=True).pk, queued.pk)
+
+
+class CustomerImportTests(APITestCase):
+    def import_rows(self, rows):
+        resp = self.client.post('/api/customers/import/', rows, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(resp['Location'].endswith(f"/api/jobs/{resp.data['id']}/"))
+        self.assertEqual(jobs.work(burst=True), 1)
+        resp = self.client.get(f"/api/jobs/{resp.data['id']}/")
+        self.assertEqual(resp.data['status'], Job.SUCCEEDED)
+        return resp.data['result']
+
+    def test_reports_rejected_rows(self):
+        Customer.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com')
+        result = self.import_rows([
+            {'first_name': 'Bo', 'last_name': 'Ng', 'email': 'bo@example.com'},
+            {'first_name': 'Ann', 'last_name': 'Lee', 'email': 'ann@example.com'},
+            {'first_name': 'Bo', 'last_name': 'Ng', 'email': 'bo@example.com'},
+            {'first_name': 'Cy', 'last_name': 'Ro', 'email': 'not an email'},
+        ])
+        self.assertEqual(result['created'], 1)
+        self.assertEqual([error['row'] for error in result['errors']], [1, 2, 3])
+        self.assertEqual(result['errors'][1]['errors'], {'email': ['Same email as row 0.']})
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_email_taken_after_validation_is_a_row_error(self):
+        report = jobs.report
+
+        def create_then_report(job, done, total=None):
+            # Another request creates the first row's customer while the rest are validated.
+            if done == 1:
+                Customer.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com')
+            report(job, done, total)
+
+        with patch.object(imports, 'REPORT_EVERY', 1), patch.object(jobs, 'report', create_then_report):
+            result = self.import_rows([
+                {'first_name': 'Ann', 'last_name': 'Lee', 'email': 'ann@example.com'},
+                {'first_name': 'Bo', 'last_name': 'Ng', 'email': 'bo@example.com'},
+            ])
+        self.assertEqual(result, {'created': 1, 'errors': [{'row': 0, 'errors': {'email': [imports.EXISTS]}}]})
+
+    def test_email_taken_at_insert_is_a_row_error(self):
+        # The email is created between the check and the insert.
+        drop_taken = imports._drop_taken
+        calls = []
+
+        def late(customers, rows_by_email, errors):
+            calls.append(len(customers))
+            moved = drop_taken(customers, rows_by_email, errors)
+            if len(calls) == 1:
+                Customer.objects.create(first_name='Bo', last_name='Ng', email='bo@example.com')
+            return moved
+
+        with patch.object(imports, '_drop_taken', late):
+            result = self.import_rows([
+                {'first_name': 'Ann', 'last_name': 'Lee', 'email': 'ann@example.com'},
+                {'first_name': 'Bo', 'last_name': 'Ng', 'email': 'bo@example.com'},
+            ])
+        self.assertEqual(calls, [2, 2])
+        self.assertEqual(result, {'created': 1, 'errors': [{'row': 1, 'errors': {'email': [imports.EXISTS]}}]})
+        self.assertEqual(Customer.objects.count(), 2)
+
+
+class CustomerTestCase(APITestCase):
+    def setUp(self):
+        self.ann = Customer.objects.create(first_name='Ann', last_name='Lee', email='ann@example.com',
+                                           phone_number='555-0100')
+        Customer.objects.create(first_name='Zo\u00eb', last_name='Caf\u00e9 \u2028', email='zoe@example.com')
+
+
+class ProjectionContractTests(CustomerTestCase):
+    def test_customer_list_matches_serializer(self):
+        expected = CustomerSerializer(Customer.objects.all(), many=True).data
+        resp = self.client.get('/api/customers/', HTTP_ACCEPT='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.content, ORJSONRenderer().render(expected))
+        self.assertEqual(resp.content, JSONRenderer().render(expected))
+        self.assertIsNone(resp.json()[1]['phone_number'])
+
+
+class SparseFieldsetTests(CustomerTestCase):
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(path)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.json(), ' '.join(q['sql'] for q in queries)
+
+    def test_fields_trims_output_and_columns(self):
+        data, sql = self.get('/api/customers/?fields=id,email')
+        self.assertEqual(data, [{'id': c.id, 'email': c.email} for c in Customer.objects.all()])
+        self.assertNotIn('phone_number', sql)
+
+        data, sql = self.get(f'/api/customers/{self.ann.id}/?fields=last_name')
+        self.assertEqual(data, {'last_name': 'Lee'})
+        self.assertNotIn('first_name', sql)
+
+    def test_omit(self):
+        data, _ = self.get('/api/customers/?omit=created_at,phone_number')
+        self.assertEqual(list(data[0]), ['id', 'first_name', 'last_name', 'email'])
+
+    def test_unknown_field_is_rejected(self):
+        resp = self.client.get('/api/customers/?fields=id,nope')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('nope', str(resp.json()['fields']))
+
+    def test_writes_ignore_fieldsets(self):
+        resp = self.client.patch(f'/api/customers/{self.ann.id}/?fields=id', {'last_name': 'Li'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual((resp.json()['first_name'], resp.json()['last_name']), ('Ann', 'Li'))
+
+
+class CompressionTests(CustomerTestCase):
+    def test_large_json_is_gzipped(self):
+        Customer.objects.bulk_create(
+            Customer(first_name='Cy', last_name=f'Ro {i}', email=f'cy{i}@example.com') for i in range(30)
+        )
+        plain = self.client.get('/api/customers/')
+        resp = self.client.get('/api/customers/', HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp['Vary'])
+        self.assertEqual(gzip.decompress(resp.content), plain.content)
+        self.assertLess(int(resp['Content-Length']), len(plain.content))
+
+    def test_skips_small_and_refused_responses(self):
+        small = self.client.get(f'/api/customers/{self.ann.id}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+        Customer.objects.bulk_create(
+            Customer(first_name='Cy', last_name=f'Ro {i}', email=f'cy{i}@example.com') for i in range(30)
+        )
+        refused = self.client.get('/api/customers/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+
+    def test_streaming_response_is_compressed_per_chunk(self):
+        chunks = [b'{"chunk": %d}\n' % i * 40 for i in range(5)]
+        middleware = CompressionMiddleware(lambda request: StreamingHttpResponse(
+            iter(chunks), content_type='application/json'
+        ))
+        resp = middleware(RequestFactory().get('/stream/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        parts = list(resp.streaming_content)
+        self.assertEqual(len(parts), len(chunks) + 1)
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+
+    def test_skips_encoded_and_cached_responses(self):
+        body = b'{"chunk": 1}\n' * 200
+        encoded = CompressionMiddleware(lambda request: HttpResponse(
+            body, content_type='application/json', headers={'Content-Encoding': 'br'}
+        ))
+        resp = encoded(RequestFactory().get('/encoded/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual((resp['Content-Encoding'], resp.content), ('br', body))
+
+        # With the cache above the middleware, a hit is served as stored, compressed once.
+        self.addCleanup(cache.clear)
+        views = []
+
+        def view(request):
+            views.append(request.path)
+            return HttpResponse(body, content_type='application/json')
+
+        stack = CacheMiddleware(CompressionMiddleware(view), page_timeout=60)
+        with patch.object(gzip, 'compress', wraps=gzip.compress) as compress:
+            first, hit = [stack(RequestFactory().get('/cached/', HTTP_ACCEPT_ENCODING='gzip')) for _ in range(2)]
+        self.assertEqual((views, compress.call_count), (['/cached/'], 1))
+        self.assertEqual((hit['Content-Encoding'], hit.content), ('gzip', first.content))
+        self.assertEqual(gzip.decompress(hit.content), body)
+
+
+class ORJSONRendererTests(CustomerTestCase):
+    def test_matches_drf_renderer(self):
+        for path in ['/api/customers/', f'/api/customers/{self.ann.id}/']:
+            data = self.client.get(path).data
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data), path)
+
+    def test_raw_decimals_render_as_strings(self):
+        self.assertEqual(ORJSONRenderer().render({'due': Decimal('10.10'), 1: None}), b'{"due":"10.10","1":null}')
+
+    def test_malformed_body_is_bad_request(self):
+        resp = self.client.post('/api/customers/', b'{"first_name": ', content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JSON parse error', resp.data['detail'])
+        body = b'{"first_name": "Bo", "last_name": "Ng", "email": "bo@example.com"}'
+        resp = self.client.post('/api/customers/', body, content_type='application/json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import CustomerListCreateView, CustomerDetailView
+from .views import CustomerListCreateView, CustomerDetailView, CustomerImportView, JobDetailView
 
 urlpatterns = [
     path('api/customers/', CustomerListCreateView.as_view(), name='customer-list-create'),
     path('api/customers/<int:pk>/', CustomerDetailView.as_view(), name='customer-detail'),
+    path('api/customers/import/', CustomerImportView.as_view(), name='customer-import'),
+    path('api/jobs/<int:pk>/', JobDetailView.as_view(), name='job-detail'),
 ]
@@ -1,21 +1,54 @@
 from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Customer
-from .serializers import CustomerSerializer
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
+from . import jobs
+from .fieldsets import SparseQuerysetMixin
+from .imports import import_customers
+from .models import Customer, Job
+from .projections import ValuesProjection
+from .serializers import CustomerSerializer, JobSerializer
 
 
-class CustomerListCreateView(generics.ListCreateAPIView):
+class CustomerListCreateView(SparseQuerysetMixin, generics.ListCreateAPIView):
     """
     List all customers or create a new customer.
     """
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    list_projection = ValuesProjection(CustomerSerializer)
 
+    def list(self, request, *args, **kwargs):
+        # Read-only rows go straight from values() to dicts (see customers.projections).
+        if self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        return Response(self.list_projection.rows(self.filter_queryset(self.get_queryset()), request))
 
-class CustomerDetailView(generics.RetrieveUpdateDestroyAPIView):
+
+class CustomerDetailView(SparseQuerysetMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a customer instance.
     """
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+
+
+class CustomerImportView(APIView):
+    """
+    Queue an import of a list of customers (see customers.imports); answers
+    202 with the job, to poll at its Location.
+    """
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response({'error': 'Expected a list of customers.'}, status=status.HTTP_400_BAD_REQUEST)
+        job = jobs.enqueue(import_customers, {'rows': request.data})
+        location = reverse('job-detail', args=[job.pk], request=request)
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+class JobDetailView(generics.RetrieveAPIView):
+    """A background job (see customers.jobs), to poll for progress and its result."""
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer